@@ -70,6 +70,122 @@ ENABLE_M80_WORKER: bool = _get_env_bool(
     _cfg_bool("ENABLE_M80_WORKER", True),
 )
 TELEMETRY_POLL_INTERVAL_SEC: float = float(_cfg("TELEMETRY_POLL_INTERVAL_SEC", 1.0))
+# Intervalos de estado: amostra seguinte a até N s continua o intervalo; gap maior não conta tempo
+STATE_INTERVAL_MAX_GAP_SEC: float = float(_cfg("STATE_INTERVAL_MAX_GAP_SEC", 10.0))
+# Cria state_intervals no startup em bancos anteriores à tabela
+STATE_INTERVAL_AUTO_CREATE: bool = _get_env_bool(
+    "STATE_INTERVAL_AUTO_CREATE",
+    _cfg_bool("STATE_INTERVAL_AUTO_CREATE", True),
+)
+
+# Execução de I/O de banco a partir de código async: "executor" (pool dedicado) | "inline"
+DB_EXECUTION_MODE: str = str(_cfg("DB_EXECUTION_MODE", "executor")).strip().lower()
+DB_EXECUTOR_WORKERS: int = int(_cfg("DB_EXECUTOR_WORKERS", 8))
+
+# Ingest em lote (/v1/telemetry/ingest/batch)
+INGEST_BATCH_MAX_ITEMS: int = int(_cfg("INGEST_BATCH_MAX_ITEMS", 5000))
+# WebSocket /v1/telemetry/stream: frames sem ack permitidos por conexão
+INGEST_STREAM_WINDOW: int = int(_cfg("INGEST_STREAM_WINDOW", 8))
+# LRU de chaves (machine_id, ts) recentes para rejeitar replays antes do banco (0 desativa)
+INGEST_DEDUP_CACHE_SIZE: int = int(_cfg("INGEST_DEDUP_CACHE_SIZE", 50000))
+
+# Write-behind: telemetria/eventos enfileirados e gravados em group commit
+WRITE_BEHIND_ENABLED: bool = _get_env_bool(
+    "WRITE_BEHIND_ENABLED",
+    _cfg_bool("WRITE_BEHIND_ENABLED", False),
+)
+WRITE_BEHIND_MAX_ROWS: int = int(_cfg("WRITE_BEHIND_MAX_ROWS", 20000))
+WRITE_BEHIND_FLUSH_ROWS: int = int(_cfg("WRITE_BEHIND_FLUSH_ROWS", 1000))
+WRITE_BEHIND_FLUSH_INTERVAL_SEC: float = float(_cfg("WRITE_BEHIND_FLUSH_INTERVAL_SEC", 0.5))
+
+# Controle de admissão do ingest (0 desativa cada limite)
+INGEST_MAX_IN_FLIGHT: int = int(_cfg("INGEST_MAX_IN_FLIGHT", 16))
+INGEST_MACHINE_RATE: float = float(_cfg("INGEST_MACHINE_RATE", 50.0))  # amostras/s por máquina
+INGEST_MACHINE_BURST: float = float(_cfg("INGEST_MACHINE_BURST", 3000))
+INGEST_RETRY_AFTER_SEC: float = float(_cfg("INGEST_RETRY_AFTER_SEC", 1.0))
+
+# Spool em disco: amostras vão para segmentos locais enquanto o banco está fora/lento
+INGEST_SPOOL_ENABLED: bool = _get_env_bool(
+    "INGEST_SPOOL_ENABLED",
+    _cfg_bool("INGEST_SPOOL_ENABLED", True),
+)
+INGEST_SPOOL_DIR: str = str(_cfg("INGEST_SPOOL_DIR", str(BACKEND_DIR / "spool")))
+INGEST_SPOOL_MAX_MB: float = float(_cfg("INGEST_SPOOL_MAX_MB", 512))
+INGEST_SPOOL_SEGMENT_MB: float = float(_cfg("INGEST_SPOOL_SEGMENT_MB", 8))
+INGEST_SPOOL_DRAIN_BATCH: int = int(_cfg("INGEST_SPOOL_DRAIN_BATCH", 5000))
+INGEST_SPOOL_DRAIN_INTERVAL_SEC: float = float(_cfg("INGEST_SPOOL_DRAIN_INTERVAL_SEC", 2.0))
+# Commit acima deste tempo desvia as próximas amostras para o spool (0 desativa)
+INGEST_SPOOL_SLOW_COMMIT_MS: float = float(_cfg("INGEST_SPOOL_SLOW_COMMIT_MS", 2000))
+INGEST_SPOOL_FSYNC: bool = _get_env_bool(
+    "INGEST_SPOOL_FSYNC",
+    _cfg_bool("INGEST_SPOOL_FSYNC", True),
+)
+
+# Store de status compartilhado entre workers: "mmap" (arquivo mapeado) | "memory" (por processo)
+STATUS_STORE: str = str(_cfg("STATUS_STORE", "mmap")).strip().lower()
+# Vazio: /dev/shm/cnc-telemetry-status.bin (ou diretório temporário)
+STATUS_STORE_PATH: str = str(_cfg("STATUS_STORE_PATH", ""))
+STATUS_STORE_SLOTS: int = int(_cfg("STATUS_STORE_SLOTS", 4096))
+
+# Push de status (SSE/WS): intervalo de verificação do store, fila por cliente e keep-alive
+STATUS_PUSH_INTERVAL_SEC: float = float(_cfg("STATUS_PUSH_INTERVAL_SEC", 0.25))
+STATUS_PUSH_QUEUE_SIZE: int = int(_cfg("STATUS_PUSH_QUEUE_SIZE", 256))
+STATUS_PUSH_HEARTBEAT_SEC: float = float(_cfg("STATUS_PUSH_HEARTBEAT_SEC", 15.0))
+
+# Long-poll (?wait=) dos endpoints de status/eventos: espera máxima por requisição
+STATUS_LONGPOLL_MAX_SEC: float = float(_cfg("STATUS_LONGPOLL_MAX_SEC", 30.0))
+
+# Export NDJSON de /events: linhas por consulta keyset
+EVENTS_EXPORT_PAGE_SIZE: int = int(_cfg("EVENTS_EXPORT_PAGE_SIZE", 1000))
+
+# Streaming de /history (format=ndjson|csv): linhas por lote do cursor
+HISTORY_EXPORT_CHUNK_ROWS: int = int(_cfg("HISTORY_EXPORT_CHUNK_ROWS", 5000))
+
+# Cache LRU de /history (5m/1h/1d) invalidado pelos rollups; entradas (0 desativa)
+HISTORY_CACHE_SIZE: int = int(_cfg("HISTORY_CACHE_SIZE", 512))
+# resolution=auto de /history: pontos mínimos quando o cliente não informa min_points
+HISTORY_AUTO_MIN_POINTS: int = int(_cfg("HISTORY_AUTO_MIN_POINTS", 200))
+
+
+def _cfg_groups(name: str) -> dict:
+    """Machine groups: a dict in config.json or a JSON object in the environment."""
+    raw = _cfg(name, {})
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw) if raw.strip() else {}
+        except ValueError:
+            return {}
+    if not isinstance(raw, dict):
+        return {}
+    return {str(group): [str(machine_id) for machine_id in members] for group, members in raw.items()}
+
+
+# /v1/fleet: grupos nomeados de máquinas ({"usinagem": ["CNC-01", "CNC-02"]}) e máximo por requisição
+MACHINE_GROUPS: dict = _cfg_groups("MACHINE_GROUPS")
+FLEET_MAX_MACHINES: int = int(_cfg("FLEET_MAX_MACHINES", 500))
+
+# Eventos recentes em memória por máquina (servem /events sem ir ao banco)
+EVENT_RING_SIZE: int = int(_cfg("EVENT_RING_SIZE", 200))
+EVENT_RING_MACHINES: int = int(_cfg("EVENT_RING_MACHINES", 4096))
+EVENT_RING_WARM_LOAD: bool = _get_env_bool(
+    "EVENT_RING_WARM_LOAD",
+    _cfg_bool("EVENT_RING_WARM_LOAD", True),
+)
+
+# Rollups telemetry_5m/1h/1d mantidos pela API: "auto" (desliga se já forem
+# continuous aggregates do TimescaleDB) | "on" | "off"
+ROLLUP_ENGINE: str = str(_cfg("ROLLUP_ENGINE", "auto")).strip().lower()
+ROLLUP_INTERVAL_SEC: float = float(_cfg("ROLLUP_INTERVAL_SEC", 30.0))
+# Releitura atrás do watermark (amostras com ingested_at antigo commitadas depois da última rodada)
+ROLLUP_OVERLAP_SEC: float = float(_cfg("ROLLUP_OVERLAP_SEC", 120.0))
+
+# Compressão do histórico telemetry_events: "deadband" | "swinging_door" | "off"
+EVENT_COMPRESSION: str = str(_cfg("EVENT_COMPRESSION", "deadband")).strip().lower()
+EVENT_DEADBAND_RPM: float = float(_cfg("EVENT_DEADBAND_RPM", 50.0))
+EVENT_DEADBAND_FEED: float = float(_cfg("EVENT_DEADBAND_FEED", 25.0))
+EVENT_DEADBAND_LOAD_PCT: float = float(_cfg("EVENT_DEADBAND_LOAD_PCT", 5.0))
+# Grava ao menos um evento a cada N segundos mesmo sem mudança (0 desativa)
+EVENT_HEARTBEAT_SEC: float = float(_cfg("EVENT_HEARTBEAT_SEC", 300.0))
 
 
 def _env(key: str, default: str | None = None) -> str | None:
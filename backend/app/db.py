@@ -2,7 +2,7 @@
 # Database connection and models (SQLAlchemy + TimescaleDB)
 
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, Float, String, DateTime, BigInteger, CheckConstraint
+from sqlalchemy import create_engine, Column, Float, String, DateTime, BigInteger, Integer, CheckConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
@@ -50,7 +50,8 @@ class Telemetry(Base):
     state = Column(String(20), nullable=False)
     sequence = Column(BigInteger, nullable=True)
     src = Column(String(20), default="mtconnect")
-    ingested_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # Indexado: o motor de rollups (services/rollup.py) lê o que chegou desde o último watermark
+    ingested_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
     
     __table_args__ = (
         CheckConstraint('rpm >= 0', name='check_rpm_positive'),
@@ -63,8 +64,10 @@ class TelemetryEvents(Base):
     """Telemetry events history for v0.2 - stores snapshots for event log"""
     __tablename__ = "telemetry_events"
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    machine_id = Column(String(50), nullable=False, index=True)
+    # SQLite só gera autoincremento para INTEGER PRIMARY KEY
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # Sem índice próprio: machine_id é o prefixo de ix_telemetry_events_machine_ts_id
+    machine_id = Column(String(50), nullable=False)
     timestamp_utc = Column(DateTime(timezone=True), nullable=False, index=True)
     mode = Column(String(20), nullable=True)
     execution = Column(String(20), nullable=False)
@@ -82,6 +85,82 @@ class TelemetryEvents(Base):
     __table_args__ = (
         CheckConstraint('rpm >= 0', name='check_events_rpm_positive'),
         CheckConstraint("execution IN ('EXECUTING','STOPPED','READY','ALARM')", name='check_events_execution_valid'),
+        # Páginas de /events (mais recentes primeiro, cursor timestamp,id) saem
+        # direto da ordem do índice. Bancos existentes: db/events_keyset_index.sql
+        Index("ix_telemetry_events_machine_ts_id", machine_id, timestamp_utc.desc(), id.desc()),
+    )
+
+
+class _RollupColumns:
+    """Columns shared by the rollup tables maintained by services/rollup.py.
+
+    Sums, counts and min/max are kept next to the averages so a coarser level
+    is computed exactly from the finer one. The column names read by the
+    history API match the TimescaleDB continuous aggregates (db/aggregates.sql).
+    """
+
+    machine_id = Column(String(50), primary_key=True, nullable=False)
+    sample_count = Column(BigInteger, nullable=False)
+    rpm_sum = Column(Float, nullable=False)
+    rpm_min = Column(Float)
+    rpm_max = Column(Float)
+    rpm_avg = Column(Float)
+    feed_sum = Column(Float, nullable=False)
+    feed_min = Column(Float)
+    feed_max = Column(Float)
+    feed_avg = Column(Float)
+    running_count = Column(BigInteger, nullable=False)
+    stopped_count = Column(BigInteger, nullable=False)
+    idle_count = Column(BigInteger, nullable=False)
+    state_mode = Column(String(20))
+
+
+class Telemetry5m(_RollupColumns, Base):
+    """5-minute rollup (plain table when TimescaleDB is not available)"""
+    __tablename__ = "telemetry_5m"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    uptime_ratio = Column(Float)
+
+
+class Telemetry1h(_RollupColumns, Base):
+    """1-hour rollup, computed from telemetry_5m"""
+    __tablename__ = "telemetry_1h"
+
+    bucket = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    uptime_ratio = Column(Float)
+
+
+class Telemetry1d(_RollupColumns, Base):
+    """1-day (UTC) rollup, computed from telemetry_1h"""
+    __tablename__ = "telemetry_1d"
+
+    date = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    availability = Column(Float)
+
+
+class RollupWatermark(Base):
+    """Progress of the rollup engine: samples ingested up to `watermark` are rolled up"""
+    __tablename__ = "rollup_watermark"
+
+    name = Column(String(50), primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class StateInterval(Base):
+    """Run of consecutive samples of a machine in one state, [start_ts, end_ts) (services/state_intervals.py)"""
+    __tablename__ = "state_intervals"
+
+    machine_id = Column(String(50), primary_key=True, nullable=False)
+    start_ts = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    end_ts = Column(DateTime(timezone=True), nullable=False)
+    state = Column(String(20), nullable=False)
+    sample_count = Column(BigInteger, nullable=False, default=1)
+
+    __table_args__ = (
+        # Janela [a, b): end_ts > a AND start_ts < b
+        Index("ix_state_intervals_machine_end", "machine_id", "end_ts"),
     )
 
 
@@ -1,20 +1,82 @@
 # backend/app/routers/history.py
 # Historical telemetry data API
 
+import csv
+import io
+import json
 import logging
+import math
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import DateTime, bindparam, extract, func, select, text
 from sqlalchemy.exc import OperationalError, ProgrammingError
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Sequence, Set, Tuple
 
-from ..db import get_db
+from ..config import (
+    FLEET_MAX_MACHINES,
+    HISTORY_CACHE_SIZE,
+    HISTORY_AUTO_MIN_POINTS,
+    HISTORY_EXPORT_CHUNK_ROWS,
+    MACHINE_GROUPS,
+    STATUS_STORE,
+    STATUS_STORE_PATH,
+    STATUS_STORE_SLOTS,
+)
+from ..db import Telemetry, get_db
+from ..services.columnar import ARROW_MEDIA_TYPE, ColumnBuffers, arrow_available, to_arrow_ipc, to_columnar_json
+from ..services.downsample import SeriesBuffer, lttb_indices
+from ..services.history_cache import HistoryCache, RollupChangeLog
+from ..services.rollup import Partial, summarize, summarize_many
+from ..services.state_intervals import durations_or_estimate, window_durations
+from ..services.status_store import create_status_store, default_store_path
+from ..services.timing import timed
 
 router = APIRouter(prefix="/v1/machines", tags=["history"])
+fleet_router = APIRouter(prefix="/v1/fleet", tags=["fleet"])
 logger = logging.getLogger(__name__)
 
+# Linhas por lote lidas do cursor na 1ª passada do downsampling de raw
+RAW_SERIES_CHUNK = 20000
+RESOLUTION_SECONDS = {"5m": 300, "1h": 3600, "1d": 86400}
+
+# fields=: campo da resposta -> coluna SQL de que depende (mode/execution vêm de state;
+# `state` é o nome da coluna nos formatos columnar/arrow)
+FIELD_COLUMNS = {
+    "timestamp_utc": "ts",
+    "machine_id": "machine_id",
+    "rpm": "rpm",
+    "feed_mm_min": "feed_mm_min",
+    "mode": "state",
+    "execution": "state",
+    "state": "state",
+    "rpm_max": "rpm_max",
+    "rpm_min": "rpm_min",
+    "feed_max": "feed_max",
+    "feed_min": "feed_min",
+    "sample_count": "sample_count",
+    "uptime_ratio": "uptime_ratio",
+    "sequence": "sequence",
+}
+
+# Resultados de 5m/1h/1d por (máquina, resolução, intervalo alinhado aos buckets).
+# Invalidados pelas mudanças que o motor de rollups publica (log compartilhado entre workers).
+HISTORY_CACHE = HistoryCache(
+    RollupChangeLog(
+        create_status_store(
+            STATUS_STORE,
+            encode=bytes,
+            decode=bytes,
+            path=(STATUS_STORE_PATH + ".rollups") if STATUS_STORE_PATH else str(default_store_path("cnc-telemetry-rollups.bin")),
+            slots=STATUS_STORE_SLOTS,
+            slot_size=512,
+        )
+    ),
+    max_entries=HISTORY_CACHE_SIZE,
+)
+
 
 def _empty_history_response() -> List[Dict]:
     return []
@@ -23,11 +85,98 @@ def _empty_history_response() -> List[Dict]:
 def _normalize_timestamp(value) -> str:
     if value is None:
         return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    if isinstance(value, datetime):
+        return _as_utc(value).isoformat().replace("+00:00", "Z")
     if hasattr(value, "isoformat"):
         return value.isoformat().replace("+00:00", "Z")
     return str(value)
 
 
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _aligned_range(resolution: str, from_dt: datetime, to_dt: datetime) -> Tuple[datetime, datetime]:
+    """First/last bucket start the query can return: same rows as the raw bounds, stable cache key.
+
+    1d keeps the day containing from_ts (historical behaviour of the endpoint).
+    """
+    width = RESOLUTION_SECONDS.get(resolution)
+    if width is None:
+        return from_dt, to_dt
+    start, end = from_dt.timestamp(), to_dt.timestamp()
+    first = math.floor(start / width) if resolution == "1d" else math.ceil(start / width)
+    return (
+        datetime.fromtimestamp(first * width, timezone.utc),
+        datetime.fromtimestamp(math.floor(end / width) * width, timezone.utc),
+    )
+
+
+def _epoch_expr(dialect: str, column):
+    """Timestamp as float epoch seconds computed by the database."""
+    if dialect == "sqlite":
+        return (func.julianday(column) - 2440587.5) * 86400.0
+    return extract("epoch", column)
+
+
+def _downsampled_raw(
+    db: Session,
+    machine_id: str,
+    from_dt: datetime,
+    to_dt: datetime,
+    max_points: int,
+    columns: Optional[Set[str]] = None,
+):
+    """LTTB over every raw sample of the range, newest first.
+
+    First pass streams only (epoch, rpm) into float columns; the second one
+    fetches the chosen rows by position (ROW_NUMBER over ts), so memory and
+    payload stay bounded by `max_points` whatever the range. `columns`
+    restricts the second pass to those output columns (`ts` always).
+    """
+    in_range = (Telemetry.machine_id == machine_id, Telemetry.ts >= from_dt, Telemetry.ts <= to_dt)
+    series = SeriesBuffer()
+    result = db.execute(
+        select(_epoch_expr(db.get_bind().dialect.name, Telemetry.ts), Telemetry.rpm)
+        .where(*in_range)
+        .order_by(Telemetry.ts)
+        .execution_options(yield_per=RAW_SERIES_CHUNK)
+    )
+    for chunk in result.partitions():
+        series.extend(chunk)
+    if not len(series):
+        return []
+
+    positions = [index + 1 for index in lttb_indices(series.x, series.y, max_points)]
+    selected = [
+        column
+        for column in (Telemetry.ts, Telemetry.machine_id, Telemetry.rpm, Telemetry.feed_mm_min, Telemetry.state, Telemetry.sequence)
+        if columns is None or column.key == "ts" or column.key in columns
+    ]
+    numbered = (
+        select(*selected, func.row_number().over(order_by=Telemetry.ts).label("position"))
+        .where(*in_range)
+        .subquery()
+    )
+    return db.execute(
+        select(*(column for column in numbered.c if column.name != "position"))
+        .where(numbered.c.position.in_(positions))
+        .order_by(numbered.c.ts.desc())
+    )
+
+
+def _downsampled_rows(rows: List, max_points: int) -> List:
+    """LTTB over rows already fetched (newest first), e.g. aggregated resolutions."""
+    if len(rows) <= max_points:
+        return rows
+    ordered = rows[::-1]
+    series = SeriesBuffer()
+    series.extend((_as_utc(row.ts).timestamp(), row.rpm) for row in ordered)
+    return [ordered[index] for index in reversed(lttb_indices(series.x, series.y, max_points))]
+
+
 def _execution_from_state(state: Optional[str]) -> Optional[str]:
     if not state:
         return None
@@ -39,13 +188,263 @@ def _execution_from_state(state: Optional[str]) -> Optional[str]:
     return mapping.get(state.lower(), state.upper())
 
 
+# Por resolução: tabela, coluna de tempo e colunas (expressão SQL, nome). Nomes iguais aos
+# dos continuous aggregates do TimescaleDB e dos rollups mantidos por services/rollup.py
+HISTORY_SOURCES = {
+    "raw": ("telemetry", "ts", (
+        ("ts", "ts"),
+        ("machine_id", "machine_id"),
+        ("rpm", "rpm"),
+        ("feed_mm_min", "feed_mm_min"),
+        ("state", "state"),
+        ("sequence", "sequence"),
+    )),
+    "5m": ("telemetry_5m", "bucket", (
+        ("bucket", "ts"),
+        ("machine_id", "machine_id"),
+        ("rpm_avg", "rpm"),
+        ("rpm_max", "rpm_max"),
+        ("rpm_min", "rpm_min"),
+        ("feed_avg", "feed_mm_min"),
+        ("feed_max", "feed_max"),
+        ("feed_min", "feed_min"),
+        ("state_mode", "state"),
+        ("sample_count", "sample_count"),
+        ("uptime_ratio", "uptime_ratio"),
+    )),
+    "1h": ("telemetry_1h", "bucket", (
+        ("bucket", "ts"),
+        ("machine_id", "machine_id"),
+        ("rpm_avg", "rpm"),
+        ("rpm_max", "rpm_max"),
+        ("feed_avg", "feed_mm_min"),
+        ("sample_count", "sample_count"),
+        ("uptime_ratio", "uptime_ratio"),
+    )),
+    # O dia de telemetry_1d é comparado pelo início do dia (sem cast ::date)
+    "1d": ("telemetry_1d", "date", (
+        ("date", "ts"),
+        ("machine_id", "machine_id"),
+        ("rpm_avg", "rpm"),
+        ("rpm_max", "rpm_max"),
+        ("feed_avg", "feed_mm_min"),
+        ("sample_count", "sample_count"),
+        ("availability", "uptime_ratio"),
+    )),
+}
+
+HISTORY_CSV_COLUMNS = (
+    "timestamp_utc", "machine_id", "rpm", "feed_mm_min", "mode", "execution",
+    "rpm_max", "rpm_min", "feed_max", "feed_min", "sample_count", "uptime_ratio", "sequence",
+)
+
+
+def _history_sql(
+    resolution: str,
+    machine_filter: str,
+    extra_columns: Sequence[str] = (),
+    selected: Optional[Set[str]] = None,
+) -> Tuple[str, str]:
+    """(SELECT ... FROM ... WHERE, coluna de tempo) of a resolution; caller adds ORDER BY/LIMIT.
+
+    `selected` keeps only those output columns (`ts` is always selected).
+    """
+    table, time_column, columns = HISTORY_SOURCES[resolution]
+    select_list = ",\n            ".join([
+        *(
+            expression if expression == name else f"{expression} AS {name}"
+            for expression, name in columns
+            if selected is None or name == "ts" or name in selected
+        ),
+        *extra_columns,
+    ])
+    sql = f"""
+        SELECT 
+            {select_list}
+        FROM {table}
+        WHERE {machine_filter}
+          AND {time_column} >= :from_ts
+          AND {time_column} <= :to_ts
+    """
+    return sql, time_column
+
+
+def _history_params(machine_id: str, from_dt: datetime, to_dt: datetime) -> Dict:
+    return {"machine_id": machine_id, "from_ts": from_dt, "to_ts": to_dt}
+
+
+def _typed(sql: str, expanding: Sequence[str] = ()):
+    # Tipo explícito: no SQLite os timestamps são texto sem fuso (UTC)
+    return text(sql).bindparams(
+        *(bindparam(name, type_=DateTime(timezone=True)) for name in ("from_ts", "to_ts")),
+        *(bindparam(name, expanding=True) for name in expanding),
+    ).columns(ts=DateTime(timezone=True))
+
+
+def _history_query(resolution: str, limited: bool, selected: Optional[Set[str]] = None):
+    sql, time_column = _history_sql(resolution, "machine_id = :machine_id", selected=selected)
+    sql += f"    ORDER BY {time_column} DESC\n"
+    if limited:
+        sql += "LIMIT :limit\n"
+    return _typed(sql)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Requested response fields (timestamp_utc always included); None = all."""
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(["timestamp_utc", *(part.strip() for part in fields.split(",") if part.strip())]))
+    unknown = [name for name in names if name not in FIELD_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(FIELD_COLUMNS)}",
+        )
+    return names
+
+
+def _auto_resolution(from_dt: datetime, to_dt: datetime, min_points: int) -> str:
+    """Coarsest of 1d/1h/5m still giving at least `min_points` buckets for the range, else raw."""
+    span = (to_dt - from_dt).total_seconds()
+    for resolution in ("1d", "1h", "5m"):
+        if span / RESOLUTION_SECONDS[resolution] >= min_points:
+            return resolution
+    return "raw"
+
+
+def _format_row(row, machine_id: str, fields: Optional[Sequence[str]] = None) -> Dict:
+    rpm_value = None
+    if hasattr(row, "rpm") and row.rpm is not None:
+        rpm_value = round(float(row.rpm), 1)
+
+    feed_value = None
+    feed_attr = getattr(row, "feed_mm_min", None)
+    if feed_attr is not None:
+        feed_value = round(float(feed_attr), 1)
+
+    state_attr = getattr(row, "state", None)
+    if state_attr is None:
+        state_attr = getattr(row, "state_mode", None)
+
+    mode_value = getattr(row, "mode", None)
+    if mode_value is None:
+        mode_value = state_attr.upper() if isinstance(state_attr, str) else None
+
+    row_dict = {
+        "timestamp_utc": _normalize_timestamp(getattr(row, "ts", None)),
+        "machine_id": getattr(row, "machine_id", machine_id),
+        "rpm": rpm_value or 0,
+        "feed_mm_min": feed_value or 0,
+        "mode": mode_value,
+        "execution": _execution_from_state(state_attr),
+    }
+
+    if hasattr(row, 'rpm_max') and row.rpm_max is not None:
+        row_dict["rpm_max"] = round(float(row.rpm_max), 1)
+        row_dict["rpm_min"] = round(float(getattr(row, 'rpm_min', 0)), 1) if getattr(row, 'rpm_min', None) is not None else None
+    
+    if hasattr(row, 'feed_max') and row.feed_max is not None:
+        row_dict["feed_max"] = round(float(row.feed_max), 1)
+        row_dict["feed_min"] = round(float(getattr(row, 'feed_min', 0)), 1) if getattr(row, 'feed_min', None) is not None else None
+    
+    if hasattr(row, 'sample_count') and row.sample_count is not None:
+        row_dict["sample_count"] = int(row.sample_count)
+    
+    if hasattr(row, 'uptime_ratio') and row.uptime_ratio is not None:
+        row_dict["uptime_ratio"] = round(float(row.uptime_ratio), 4)
+    
+    if hasattr(row, 'sequence') and row.sequence:
+        row_dict["sequence"] = int(row.sequence)
+
+    if fields is not None:
+        return {name: row_dict[name] for name in fields if name in row_dict}
+    return row_dict
+
+
+def _csv_columns(fields: Optional[Sequence[str]]) -> Sequence[str]:
+    return HISTORY_CSV_COLUMNS if fields is None else [name for name in HISTORY_CSV_COLUMNS if name in fields]
+
+
+def _encode_chunk(rows: List[Dict], format: str, fields: Optional[Sequence[str]] = None) -> bytes:
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, fieldnames=_csv_columns(fields), lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+    return "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows).encode("utf-8")
+
+
+def _stream_history(
+    chunks: Iterable[Sequence],
+    machine_id: str,
+    format: str,
+    fields: Optional[Sequence[str]] = None,
+) -> Iterator[bytes]:
+    """Formata e envia lote a lote do cursor: memória constante qualquer que seja o intervalo."""
+    if format == "csv":
+        yield (",".join(_csv_columns(fields)) + "\n").encode("utf-8")
+    try:
+        for chunk in chunks:
+            yield _encode_chunk([_format_row(row, machine_id, fields) for row in chunk], format, fields)
+    except Exception as exc:  # noqa: BLE001
+        # Status 200 já foi enviado: o cliente vê o corpo truncado
+        logger.warning("history export stopped", extra={"machine_id": machine_id, "error": str(exc)})
+
+
+def _streaming_history(
+    chunks: Iterable[Sequence],
+    machine_id: str,
+    resolution: str,
+    format: str,
+    fields: Optional[Sequence[str]] = None,
+) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_history(chunks, machine_id, format, fields),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{machine_id}-history-{resolution}.{format}"',
+            "X-History-Resolution": resolution,
+        },
+    )
+
+
+def _columnar_history(result, machine_id: str, resolution: str, format: str) -> Response:
+    """Columns straight from the cursor chunks (no dict per row), as JSON arrays or Arrow IPC."""
+    if hasattr(result, "partitions"):
+        names, chunks = list(result.keys()), result.partitions()
+    else:
+        rows = list(result)
+        names, chunks = (list(rows[0]._fields) if rows else []), [rows]
+    buffers = ColumnBuffers(names).extend_all(chunks)
+    aliases = {"ts": "timestamp_utc"}
+    with timed("serialize"):
+        if format == "arrow":
+            body = to_arrow_ipc(buffers, aliases, machine_id=machine_id, resolution=resolution)
+            return Response(content=body, media_type=ARROW_MEDIA_TYPE, headers={"X-History-Resolution": resolution})
+        body = to_columnar_json(buffers, aliases, machine_id=machine_id, resolution=resolution)
+        return Response(content=body, media_type="application/json", headers={"X-History-Resolution": resolution})
+
+
 @router.get("/{machine_id}/history")
 def get_machine_history(
     machine_id: str,
+    response: Response,
     from_ts: Optional[str] = Query(None, description="Start timestamp (ISO 8601)"),
     to_ts: Optional[str] = Query(None, description="End timestamp (ISO 8601)"),
-    resolution: str = Query("5m", description="raw | 5m | 1h | 1d"),
+    resolution: str = Query("5m", description="raw | 5m | 1h | 1d | auto"),
     limit: int = Query(10000, description="Max number of records"),
+    min_points: int = Query(
+        HISTORY_AUTO_MIN_POINTS, ge=1, le=10000, description="resolution=auto: coarsest table with at least N points"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return (timestamp_utc always); others are not selected"
+    ),
+    max_points: Optional[int] = Query(
+        None, ge=3, le=10000, description="Downsample (LTTB on rpm) to at most N points; raw ignores limit"
+    ),
+    format: Literal["json", "ndjson", "csv", "columnar", "arrow"] = Query(
+        "json",
+        description="ndjson | csv: streaming of the whole range (limit ignored); columnar | arrow: one array per field",
+    ),
     db: Session = Depends(get_db)
 ) -> List[Dict]:
     """
@@ -56,6 +455,22 @@ def get_machine_history(
     - 5m: 5-minute aggregates
     - 1h: 1-hour aggregates
     - 1d: 1-day aggregates
+    - auto: coarsest of 1d/1h/5m giving at least `min_points` buckets for the
+      range, raw otherwise (chosen one in the X-History-Resolution header)
+
+    fields=rpm,state... selects and serializes only those fields (plus
+    timestamp_utc); mode/execution come from the `state` column.
+
+    max_points reduces the series server-side with Largest-Triangle-Three-Buckets
+    (shape-preserving; one point per chart pixel is enough). With raw, the whole
+    range is read instead of the newest `limit` samples.
+
+    format=ndjson|csv streams every row of the range, newest first, straight
+    from a server-side cursor (yield_per), so memory stays flat for any range.
+
+    format=columnar returns `{"columns": {field: [values]}}` and format=arrow an
+    Arrow IPC stream (needs pyarrow); both carry the selected SQL columns
+    (`state` instead of mode/execution) without rounding.
     
     Example:
         GET /v1/machines/CNC-SIM-001/history?from_ts=2025-10-05T00:00:00Z&to_ts=2025-11-05T00:00:00Z&resolution=1h
@@ -75,99 +490,61 @@ def get_machine_history(
         else:
             from_dt = datetime.fromisoformat(from_ts.replace('Z', '+00:00'))
         
+        from_dt, to_dt = _as_utc(from_dt), _as_utc(to_dt)
+
         # Validate date range
         if from_dt >= to_dt:
             raise HTTPException(status_code=400, detail="from_ts must be before to_ts")
         
         # Select appropriate table/view based on resolution
-        if resolution == "raw":
-            query = text("""
-                SELECT 
-                    ts,
-                    machine_id,
-                    rpm,
-                    feed_mm_min,
-                    state,
-                    sequence
-                FROM telemetry
-                WHERE machine_id = :machine_id
-                  AND ts >= :from_ts
-                  AND ts <= :to_ts
-                ORDER BY ts DESC
-                LIMIT :limit
-            """)
-        
-        elif resolution == "5m":
-            query = text("""
-                SELECT 
-                    bucket AS ts,
-                    machine_id,
-                    rpm_avg AS rpm,
-                    rpm_max,
-                    rpm_min,
-                    feed_avg AS feed_mm_min,
-                    feed_max,
-                    feed_min,
-                    state_mode AS state,
-                    sample_count,
-                    uptime_ratio
-                FROM telemetry_5m
-                WHERE machine_id = :machine_id
-                  AND bucket >= :from_ts
-                  AND bucket <= :to_ts
-                ORDER BY bucket DESC
-                LIMIT :limit
-            """)
-        
-        elif resolution == "1h":
-            query = text("""
-                SELECT 
-                    bucket AS ts,
-                    machine_id,
-                    rpm_avg AS rpm,
-                    rpm_max,
-                    feed_avg AS feed_mm_min,
-                    sample_count,
-                    uptime_ratio
-                FROM telemetry_1h
-                WHERE machine_id = :machine_id
-                  AND bucket >= :from_ts
-                  AND bucket <= :to_ts
-                ORDER BY bucket DESC
-                LIMIT :limit
-            """)
-        
-        elif resolution == "1d":
-            query = text("""
-                SELECT 
-                    date AS ts,
-                    machine_id,
-                    rpm_avg AS rpm,
-                    rpm_max,
-                    feed_avg AS feed_mm_min,
-                    sample_count,
-                    availability AS uptime_ratio
-                FROM telemetry_1d
-                WHERE machine_id = :machine_id
-                  AND date >= :from_ts::date
-                  AND date <= :to_ts::date
-                ORDER BY date DESC
-            """)
-        
-        else:
+        if resolution == "auto":
+            resolution = _auto_resolution(from_dt, to_dt, min_points)
+        if resolution not in HISTORY_SOURCES:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid resolution: {resolution}. Must be one of: raw, 5m, 1h, 1d"
+                detail=f"Invalid resolution: {resolution}. Must be one of: raw, 5m, 1h, 1d, auto"
             )
-        
+        projection = _parse_fields(fields)
+        selected = None
+        if projection is not None:
+            selected = {FIELD_COLUMNS[name] for name in projection}
+            if max_points is not None:
+                selected.add("rpm")  # LTTB usa rpm
+
+        streaming = format in ("ndjson", "csv")
+        columnar = format in ("columnar", "arrow")
+        if format == "arrow" and not arrow_available():
+            raise HTTPException(status_code=501, detail="format=arrow requires pyarrow on the server")
+        range_from, range_to = _aligned_range(resolution, from_dt, to_dt)
+        params = _history_params(machine_id, range_from, range_to)
+        query = _history_query(resolution, limited=not streaming, selected=selected)
+        if not streaming:
+            params["limit"] = limit
+
+        cache_key = None
+        if HISTORY_CACHE.active and resolution != "raw" and not streaming:
+            cache_key = (machine_id, resolution, range_from, range_to, limit, max_points, format, projection)
+            # Tempo bruto coberto pelos buckets selecionados
+            covered = (int(range_from.timestamp()), int(range_to.timestamp()) + RESOLUTION_SECONDS[resolution])
+            cached = HISTORY_CACHE.get(cache_key)
+            if cached is not None:
+                if columnar:
+                    return Response(content=cached[0], media_type=cached[1], headers={"X-History-Resolution": resolution})
+                response.headers["X-History-Resolution"] = resolution
+                return cached
+            cache_token = HISTORY_CACHE.changes.token(machine_id)
+
         # Execute query
         try:
-            result = db.execute(query, {
-                "machine_id": machine_id,
-                "from_ts": from_dt,
-                "to_ts": to_dt,
-                "limit": limit
-            })
+            if max_points is not None and resolution == "raw":
+                result = _downsampled_raw(db, machine_id, from_dt, to_dt, max_points, selected)
+            elif format != "json" and max_points is None:
+                # Cursor no servidor (psycopg2) / iteração do cursor (SQLite), lote a lote
+                result = db.execute(query.execution_options(yield_per=HISTORY_EXPORT_CHUNK_ROWS), params)
+            else:
+                result = db.execute(query, params)
+                if max_points is not None:
+                    result = _downsampled_rows(result.all(), max_points)
         except (OperationalError, ProgrammingError) as exc:
             # [ASSUNCAO] Em ambientes de teste (SQLite) as tabelas agregadas podem não existir.
             # Retornamos dataset vazio para manter o contrato do endpoint sem quebrar a UI.
@@ -176,67 +553,96 @@ def get_machine_history(
                 "resolution": resolution,
                 "error": str(exc)
             })
+            if streaming:
+                return _streaming_history([], machine_id, resolution, format, projection)
+            if columnar:
+                return _columnar_history([], machine_id, resolution, format)
             return _empty_history_response()
+
+        if streaming:
+            chunks = result.partitions() if hasattr(result, "partitions") else [list(result)]
+            return _streaming_history(chunks, machine_id, resolution, format, projection)
+        if columnar:
+            response = _columnar_history(result, machine_id, resolution, format)
+            if cache_key is not None:
+                HISTORY_CACHE.put(
+                    cache_key, machine_id, cache_token, *covered, (response.body, response.media_type)
+                )
+            return response
         
         # Format response
-        rows = []
-        for row in result:
-            rpm_value = None
-            if hasattr(row, "rpm") and row.rpm is not None:
-                rpm_value = round(float(row.rpm), 1)
-
-            feed_value = None
-            feed_attr = getattr(row, "feed_mm_min", None)
-            if feed_attr is not None:
-                feed_value = round(float(feed_attr), 1)
-
-            state_attr = getattr(row, "state", None)
-            if state_attr is None:
-                state_attr = getattr(row, "state_mode", None)
-
-            mode_value = getattr(row, "mode", None)
-            if mode_value is None:
-                mode_value = state_attr.upper() if isinstance(state_attr, str) else None
-
-            row_dict = {
-                "timestamp_utc": _normalize_timestamp(getattr(row, "ts", None)),
-                "machine_id": getattr(row, "machine_id", machine_id),
-                "rpm": rpm_value or 0,
-                "feed_mm_min": feed_value or 0,
-                "mode": mode_value,
-                "execution": _execution_from_state(state_attr),
-            }
-
-            if hasattr(row, 'rpm_max') and row.rpm_max is not None:
-                row_dict["rpm_max"] = round(float(row.rpm_max), 1)
-                row_dict["rpm_min"] = round(float(getattr(row, 'rpm_min', 0)), 1) if getattr(row, 'rpm_min', None) is not None else None
-            
-            if hasattr(row, 'feed_max') and row.feed_max is not None:
-                row_dict["feed_max"] = round(float(row.feed_max), 1)
-                row_dict["feed_min"] = round(float(getattr(row, 'feed_min', 0)), 1) if getattr(row, 'feed_min', None) is not None else None
-            
-            if hasattr(row, 'sample_count') and row.sample_count is not None:
-                row_dict["sample_count"] = int(row.sample_count)
-            
-            if hasattr(row, 'uptime_ratio') and row.uptime_ratio is not None:
-                row_dict["uptime_ratio"] = round(float(row.uptime_ratio), 4)
-            
-            if hasattr(row, 'sequence') and row.sequence:
-                row_dict["sequence"] = int(row.sequence)
-            
-            rows.append(row_dict)
+        rows = [_format_row(row, machine_id, projection) for row in result]
+        response.headers["X-History-Resolution"] = resolution
+        if cache_key is not None:
+            HISTORY_CACHE.put(cache_key, machine_id, cache_token, *covered, rows)
         
         if not rows:
             return _empty_history_response()
 
         return rows
     
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
 
 
+def _summary_body(
+    machine_id: str,
+    from_ts: str,
+    to_ts: str,
+    result: Partial,
+    durations: Optional[Dict[str, float]],
+) -> Dict:
+    # Tempo por estado pelos intervalos contínuos (gap > STATE_INTERVAL_MAX_GAP_SEC não conta);
+    # janela sem intervalos (histórico sem backfill): estimativa por contagem de amostras
+    durations = durations_or_estimate(durations, {
+        "running": result.running_count,
+        "stopped": result.stopped_count,
+        "idle": result.idle_count,
+    })
+    running_time_min = durations["running"] / 60
+    stopped_time_min = durations["stopped"] / 60
+    idle_time_min = durations["idle"] / 60
+    total_time_min = running_time_min + stopped_time_min + idle_time_min
+
+    avg_rpm = result.rpm_sum / result.sample_count
+    avg_feed = result.feed_sum / result.sample_count
+    uptime_ratio = result.running_count / result.sample_count
+
+    return {
+        "machine_id": machine_id,
+        "from_ts": from_ts,
+        "to_ts": to_ts,
+        "total_samples": int(result.sample_count),
+        "statistics": {
+            "rpm": {
+                "avg": round(avg_rpm, 1) if avg_rpm else 0,
+                "max": round(result.rpm_max, 1) if result.rpm_max else 0,
+                "min": round(result.rpm_min, 1) if result.rpm_min else 0
+            },
+            "feed_mm_min": {
+                "avg": round(avg_feed, 1) if avg_feed else 0,
+                "max": round(result.feed_max, 1) if result.feed_max else 0
+            }
+        },
+        "time_distribution": {
+            "total_min": round(total_time_min, 1),
+            "running_min": round(running_time_min, 1),
+            "stopped_min": round(stopped_time_min, 1),
+            "idle_min": round(idle_time_min, 1),
+            "uptime_ratio": round(uptime_ratio, 4) if uptime_ratio else 0
+        },
+        "sample_distribution": {
+            "running": int(result.running_count),
+            "stopped": int(result.stopped_count),
+            "idle": int(result.idle_count)
+        }
+    }
+
+
 @router.get("/{machine_id}/history/summary")
 def get_history_summary(
     machine_id: str,
@@ -254,33 +660,10 @@ def get_history_summary(
         from_dt = datetime.fromisoformat(from_ts.replace('Z', '+00:00'))
         to_dt = datetime.fromisoformat(to_ts.replace('Z', '+00:00'))
         
-        query = text("""
-            SELECT 
-                machine_id,
-                COUNT(*) AS total_samples,
-                AVG(rpm) AS avg_rpm,
-                MAX(rpm) AS max_rpm,
-                MIN(rpm) AS min_rpm,
-                AVG(feed_mm_min) AS avg_feed,
-                MAX(feed_mm_min) AS max_feed,
-                SUM(CASE WHEN state = 'running' THEN 1 ELSE 0 END)::FLOAT / COUNT(*) AS uptime_ratio,
-                SUM(CASE WHEN state = 'running' THEN 1 ELSE 0 END) AS running_samples,
-                SUM(CASE WHEN state = 'stopped' THEN 1 ELSE 0 END) AS stopped_samples,
-                SUM(CASE WHEN state = 'idle' THEN 1 ELSE 0 END) AS idle_samples
-            FROM telemetry
-            WHERE machine_id = :machine_id
-              AND ts >= :from_ts
-              AND ts <= :to_ts
-            GROUP BY machine_id
-        """)
-        
-        result = db.execute(query, {
-            "machine_id": machine_id,
-            "from_ts": from_dt,
-            "to_ts": to_dt
-        }).fetchone()
+        # Interior do intervalo pelos rollups (dias/horas/5m inteiros), bordas pelas amostras brutas
+        result = summarize(db, machine_id, from_dt, to_dt)
         
-        if not result:
+        if not result.sample_count:
             return {
                 "machine_id": machine_id,
                 "from_ts": from_ts,
@@ -288,41 +671,160 @@ def get_history_summary(
                 "message": "No data found for this period"
             }
         
-        # Calculate time durations (assuming 2-second sampling)
-        total_time_min = (result.total_samples * 2) / 60
-        running_time_min = (result.running_samples * 2) / 60
-        stopped_time_min = (result.stopped_samples * 2) / 60
-        idle_time_min = (result.idle_samples * 2) / 60
-        
-        return {
-            "machine_id": machine_id,
-            "from_ts": from_ts,
-            "to_ts": to_ts,
-            "total_samples": int(result.total_samples),
-            "statistics": {
-                "rpm": {
-                    "avg": round(float(result.avg_rpm), 1) if result.avg_rpm else 0,
-                    "max": round(float(result.max_rpm), 1) if result.max_rpm else 0,
-                    "min": round(float(result.min_rpm), 1) if result.min_rpm else 0
-                },
-                "feed_mm_min": {
-                    "avg": round(float(result.avg_feed), 1) if result.avg_feed else 0,
-                    "max": round(float(result.max_feed), 1) if result.max_feed else 0
-                }
-            },
-            "time_distribution": {
-                "total_min": round(total_time_min, 1),
-                "running_min": round(running_time_min, 1),
-                "stopped_min": round(stopped_time_min, 1),
-                "idle_min": round(idle_time_min, 1),
-                "uptime_ratio": round(float(result.uptime_ratio), 4) if result.uptime_ratio else 0
-            },
-            "sample_distribution": {
-                "running": int(result.running_samples),
-                "stopped": int(result.stopped_samples),
-                "idle": int(result.idle_samples)
-            }
-        }
+        durations = window_durations(db, [machine_id], from_dt, to_dt).get(machine_id)
+        return _summary_body(machine_id, from_ts, to_ts, result, durations)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summary calculation failed: {str(e)}")
+
+
+# ==========================================
+# Frota: várias máquinas numa requisição
+# ==========================================
+
+def _fleet_machines(ids: Optional[str], group: Optional[str]) -> Optional[List[str]]:
+    """machine_ids pedidos (`ids` + membros de `group`), na ordem; None = todas as máquinas."""
+    machines: List[str] = []
+    if group is not None:
+        if group not in MACHINE_GROUPS:
+            raise HTTPException(status_code=404, detail=f"Unknown machine group: {group}")
+        machines.extend(MACHINE_GROUPS[group])
+    if ids:
+        machines.extend(part.strip() for part in ids.split(","))
+    machines = [machine_id for machine_id in dict.fromkeys(machines) if machine_id]
+    if len(machines) > FLEET_MAX_MACHINES:
+        raise HTTPException(status_code=400, detail=f"At most {FLEET_MAX_MACHINES} machines per request")
+    if not machines:
+        return None if group is None else []
+    return machines
+
+
+def _fleet_history_query(resolution: str, machines: Optional[List[str]]):
+    """Todas as máquinas numa consulta; ROW_NUMBER por máquina aplica `limit` a cada uma."""
+    time_column = HISTORY_SOURCES[resolution][1]
+    sql, _time_column = _history_sql(
+        resolution,
+        "machine_id IN :machine_ids" if machines is not None else "1 = 1",
+        extra_columns=(f"ROW_NUMBER() OVER (PARTITION BY machine_id ORDER BY {time_column} DESC) AS position",),
+    )
+    ranked = f"""
+        SELECT * FROM ({sql}) AS ranked
+        WHERE position <= :limit
+        ORDER BY machine_id, ts DESC
+    """
+    return _typed(ranked, expanding=("machine_ids",) if machines is not None else ())
+
+
+@fleet_router.get("/history")
+def get_fleet_history(
+    ids: Optional[str] = Query(None, description="machine_ids separados por vírgula"),
+    group: Optional[str] = Query(None, description="Grupo de MACHINE_GROUPS"),
+    from_ts: Optional[str] = Query(None, description="Start timestamp (ISO 8601)"),
+    to_ts: Optional[str] = Query(None, description="End timestamp (ISO 8601)"),
+    resolution: str = Query("5m", description="raw | 5m | 1h | 1d"),
+    limit: int = Query(1000, ge=1, le=10000, description="Max records per machine"),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    Histórico de várias máquinas (`ids` e/ou `group`; sem nenhum = todas) numa só consulta.
+
+    Uma única leitura da tabela da resolução com `machine_id IN (...)` e
+    ROW_NUMBER por máquina, em vez de uma requisição por máquina. Linhas no
+    mesmo formato de /v1/machines/{id}/history; máquinas pedidas sem dados
+    no intervalo aparecem em "missing".
+
+    Example:
+        GET /v1/fleet/history?group=usinagem&resolution=1h&from_ts=2025-11-01T00:00:00Z&to_ts=2025-11-02T00:00:00Z
+    """
+    try:
+        to_dt = _as_utc(datetime.fromisoformat(to_ts.replace('Z', '+00:00'))) if to_ts else datetime.now(timezone.utc)
+        from_dt = (
+            _as_utc(datetime.fromisoformat(from_ts.replace('Z', '+00:00'))) if from_ts else to_dt - timedelta(hours=1)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {str(e)}")
+    if from_dt >= to_dt:
+        raise HTTPException(status_code=400, detail="from_ts must be before to_ts")
+    if resolution not in HISTORY_SOURCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution: {resolution}. Must be one of: raw, 5m, 1h, 1d"
+        )
+
+    machines = _fleet_machines(ids, group)
+    series: Dict[str, List[Dict]] = {machine_id: [] for machine_id in machines or ()}
+    if machines != []:
+        range_from, range_to = _aligned_range(resolution, from_dt, to_dt)
+        params = {"from_ts": range_from, "to_ts": range_to, "limit": limit}
+        if machines is not None:
+            params["machine_ids"] = machines
+        try:
+            result = db.execute(_fleet_history_query(resolution, machines), params)
+        except (OperationalError, ProgrammingError) as exc:
+            # [ASSUNCAO] Mesmo contrato do endpoint por máquina: tabela agregada ausente = vazio
+            logger.info("fleet history query skipped", extra={"resolution": resolution, "error": str(exc)})
+            result = []
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+        with timed("serialize"):
+            for row in result:
+                series.setdefault(row.machine_id, []).append(_format_row(row, row.machine_id))
+
+    return {
+        "from_ts": _normalize_timestamp(from_dt),
+        "to_ts": _normalize_timestamp(to_dt),
+        "resolution": resolution,
+        "count": sum(1 for rows in series.values() if rows),
+        "machines": {machine_id: rows for machine_id, rows in series.items() if rows},
+        "missing": [machine_id for machine_id, rows in series.items() if not rows],
+    }
+
+
+@fleet_router.get("/history/summary")
+def get_fleet_history_summary(
+    from_ts: str = Query(..., description="Start timestamp (ISO 8601)"),
+    to_ts: str = Query(..., description="End timestamp (ISO 8601)"),
+    ids: Optional[str] = Query(None, description="machine_ids separados por vírgula"),
+    group: Optional[str] = Query(None, description="Grupo de MACHINE_GROUPS"),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    Resumo de várias máquinas (`ids` e/ou `group`; sem nenhum = todas) numa só passada.
+
+    Mesmo planejamento de /v1/machines/{id}/history/summary (rollups no
+    interior, amostras brutas nas bordas), com GROUP BY machine_id em cada
+    consulta; durações de estado numa única leitura de state_intervals.
+
+    Example:
+        GET /v1/fleet/history/summary?ids=CNC-01,CNC-02&from_ts=2025-11-01T00:00:00Z&to_ts=2025-11-05T00:00:00Z
+    """
+    try:
+        from_dt = datetime.fromisoformat(from_ts.replace('Z', '+00:00'))
+        to_dt = datetime.fromisoformat(to_ts.replace('Z', '+00:00'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {str(e)}")
+
+    machines = _fleet_machines(ids, group)
+    try:
+        results = summarize_many(db, machines, from_dt, to_dt) if machines != [] else {}
+        durations = window_durations(db, list(results), from_dt, to_dt) if results else {}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Summary calculation failed: {str(e)}")
+
+    order = machines if machines is not None else sorted(results)
+    with timed("serialize"):
+        summaries = [
+            _summary_body(
+                machine_id, from_ts, to_ts, results[machine_id],
+                durations.get(machine_id),
+            )
+            for machine_id in order
+            if machine_id in results
+        ]
+    return {
+        "from_ts": from_ts,
+        "to_ts": to_ts,
+        "count": len(summaries),
+        "machines": summaries,
+        "missing": [machine_id for machine_id in order if machine_id not in results],
+    }
@@ -0,0 +1,414 @@
+"""
+Router de ingestão de telemetria.
+Recebe amostras do adapter MTConnect / gateways (idempotência: machine_id+timestamp).
+"""
+
+import asyncio
+import json
+import logging
+import math
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy.orm import Session
+
+from ..config import (
+    INGEST_BATCH_MAX_ITEMS,
+    INGEST_MACHINE_BURST,
+    INGEST_MACHINE_RATE,
+    INGEST_MAX_IN_FLIGHT,
+    INGEST_RETRY_AFTER_SEC,
+    INGEST_STREAM_WINDOW,
+)
+from ..db import get_db
+from ..services.admission import AdmissionController
+from ..services.db_executor import run_db
+from ..services.frame_codec import CONTENT_TYPE as FRAME_CONTENT_TYPE
+from ..services.frame_codec import STATES, FrameBatch, FrameDecodeError, decode_frame
+from ..services.ingest import OUTCOME_THROTTLED, IngestSample, ingest_samples, parse_timestamp
+from ..services.timing import mark_validation, timed
+
+router = APIRouter(prefix="/v1/telemetry", tags=["ingest"])
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+BINARY_CONTENT_TYPES = (FRAME_CONTENT_TYPE, "application/octet-stream")
+MACHINE_ID_RE = re.compile(r"^[a-zA-Z0-9-]+$")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Limita o trabalho de banco simultâneo do ingest e a taxa por máquina (429 + Retry-After)
+ADMISSION = AdmissionController(
+    max_in_flight=INGEST_MAX_IN_FLIGHT,
+    machine_rate=INGEST_MACHINE_RATE,
+    machine_burst=INGEST_MACHINE_BURST,
+    retry_after_sec=INGEST_RETRY_AFTER_SEC,
+)
+
+
+class TelemetryPayload(BaseModel):
+    machine_id: str = Field(..., pattern=r"^[a-zA-Z0-9-]+$")
+    timestamp: str  # ISO 8601
+    rpm: float = Field(..., ge=0, le=30000)
+    feed_mm_min: float = Field(..., ge=0, le=10000)
+    state: Literal["running", "stopped", "idle"]
+
+
+def _to_sample(payload: TelemetryPayload) -> IngestSample:
+    return IngestSample(
+        machine_id=payload.machine_id,
+        ts=parse_timestamp(payload.timestamp),
+        rpm=payload.rpm,
+        feed_mm_min=payload.feed_mm_min,
+        state=payload.state,
+        sequence=None,  # TODO: extrair do MTConnect se disponível
+    )
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _media_type(content_type: str) -> str:
+    return content_type.split(";")[0].strip().lower()
+
+
+def _decode_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """Aceita array JSON ou NDJSON (uma amostra por linha)."""
+    try:
+        if _media_type(content_type) in NDJSON_CONTENT_TYPES:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {exc}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or NDJSON")
+    return items
+
+
+def _validate_items(items: List[Any]) -> Tuple[List[Dict[str, Any]], List[IngestSample], List[int]]:
+    """Valida cada item do lote; inválidos já saem com resultado próprio."""
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    samples: List[IngestSample] = []
+    positions: List[int] = []
+    for index, item in enumerate(items):
+        try:
+            payload = TelemetryPayload.model_validate(item)
+            sample = _to_sample(payload)
+        except (ValidationError, ValueError) as exc:
+            machine_id = item.get("machine_id") if isinstance(item, dict) else None
+            results[index] = {
+                "index": index,
+                "machine_id": machine_id,
+                "status": "invalid",
+                "error": str(exc),
+            }
+            continue
+        samples.append(sample)
+        positions.append(index)
+    return results, samples, positions
+
+
+def _validate_frame(batch: FrameBatch) -> Tuple[List[Dict[str, Any]], List[IngestSample], List[int]]:
+    """Equivalente binário de _validate_items: mesmas regras de faixa do TelemetryPayload."""
+    valid_machine = [bool(MACHINE_ID_RE.match(machine_id)) for machine_id in batch.machine_ids]
+    n_machines = len(batch.machine_ids)
+    results: List[Dict[str, Any]] = [{} for _ in range(len(batch))]
+    samples: List[IngestSample] = []
+    positions: List[int] = []
+    columns = zip(batch.ts_ms, batch.machine_idx, batch.rpm, batch.feed_mm_min, batch.state)
+    for index, (ts_ms, machine_idx, rpm, feed, state) in enumerate(columns):
+        machine_id = batch.machine_ids[machine_idx] if machine_idx < n_machines else None
+        if machine_id is None or not valid_machine[machine_idx]:
+            error = "invalid machine index or machine_id"
+        elif not 0 <= rpm <= 30000:
+            error = "rpm out of range [0, 30000]"
+        elif not 0 <= feed <= 10000:
+            error = "feed_mm_min out of range [0, 10000]"
+        elif state >= len(STATES):
+            error = f"unknown state code {state}"
+        else:
+            error = None
+        if error is not None:
+            results[index] = {"index": index, "machine_id": machine_id, "status": "invalid", "error": error}
+            continue
+        samples.append(
+            IngestSample(
+                machine_id=machine_id,
+                ts=_EPOCH + timedelta(milliseconds=ts_ms),
+                # float32 no fio: arredondar devolve o valor decimal enviado pelo adapter
+                rpm=round(rpm, 3),
+                feed_mm_min=round(feed, 3),
+                state=STATES[state],
+            )
+        )
+        positions.append(index)
+    return results, samples, positions
+
+
+def _batch_summary(
+    results: List[Dict[str, Any]],
+    samples: List[IngestSample],
+    positions: List[int],
+    outcomes: List[str],
+) -> Dict[str, Any]:
+    for index, sample, outcome in zip(positions, samples, outcomes):
+        results[index] = {"index": index, "machine_id": sample.machine_id, "status": outcome}
+
+    counts = {"stored": 0, "queued": 0, "spooled": 0, "throttled": 0, "duplicate": 0, "failed": 0, "invalid": 0}
+    for result in results:
+        counts[result["status"]] += 1
+
+    return {
+        "received": len(results),
+        "ingested": counts["stored"],
+        "queued": counts["queued"],
+        "spooled": counts["spooled"],
+        "throttled": counts["throttled"],
+        "duplicates": counts["duplicate"],
+        "failed": counts["failed"],
+        "invalid": counts["invalid"],
+        "machines": len({sample.machine_id for sample in samples}),
+        "timestamp": _now_iso(),
+        "results": results,
+    }
+
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def _admit_or_429(samples: int) -> None:
+    retry = ADMISSION.try_enter(samples)
+    if retry is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Ingest overloaded, retry later",
+            headers=_retry_after(retry),
+        )
+
+
+async def _ingest_admitted(db: Session, samples: List[IngestSample]) -> Tuple[List[str], Optional[float]]:
+    """
+    Aplica o token bucket por máquina e grava o restante.
+
+    Amostras de máquinas acima da taxa saem como "throttled"; devolve também
+    o maior Retry-After entre elas (None se nenhuma foi limitada).
+    """
+    throttled = ADMISSION.take_tokens(Counter(sample.machine_id for sample in samples))
+    if not throttled:
+        return await run_db(ingest_samples, db, samples), None
+    outcomes = [OUTCOME_THROTTLED] * len(samples)
+    admitted = [index for index, sample in enumerate(samples) if sample.machine_id not in throttled]
+    if admitted:
+        stored = await run_db(ingest_samples, db, [samples[index] for index in admitted])
+        for index, outcome in zip(admitted, stored):
+            outcomes[index] = outcome
+    return outcomes, max(throttled.values())
+
+
+@router.post("/ingest", status_code=201)
+async def ingest_telemetry(payload: TelemetryPayload, db: Session = Depends(get_db)):
+    """Ingerir dados de telemetria (idempotência: machine_id+timestamp)"""
+
+    mark_validation()
+    _admit_or_429(1)
+    try:
+        # Persistir telemetria + atualizar status em memória + evento v0.2
+        _, retry = await _ingest_admitted(db, [_to_sample(payload)])
+    finally:
+        ADMISSION.leave()
+    if retry is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for machine {payload.machine_id}",
+            headers=_retry_after(retry),
+        )
+
+    return {
+        "ingested": True,
+        "machine_id": payload.machine_id,
+        "timestamp": _now_iso()
+    }
+
+
+@router.post("/ingest/batch")
+async def ingest_telemetry_batch(request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Ingerir lote de amostras de várias máquinas numa única requisição.
+
+    Corpo: array JSON de TelemetryPayload, NDJSON (Content-Type: application/x-ndjson)
+    ou frame binário (Content-Type: application/vnd.cnc-telemetry.frame, ver
+    services/frame_codec.py). Cada tabela recebe um único INSERT multi-linha e o
+    status é atualizado uma vez por máquina. Retorna resultado por item, na ordem de entrada.
+
+    Sobrecarga: 429 + Retry-After para o lote inteiro; máquinas acima da taxa
+    têm suas amostras marcadas "throttled" (com Retry-After na resposta).
+    """
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+    batch: Any
+    with timed("validation"):
+        if _media_type(content_type) in BINARY_CONTENT_TYPES:
+            try:
+                batch = decode_frame(body)
+            except FrameDecodeError as exc:
+                raise HTTPException(status_code=400, detail=f"Invalid frame: {exc}")
+        else:
+            batch = _decode_batch_body(body, content_type)
+        if len(batch) > INGEST_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large: {len(batch)} items (max {INGEST_BATCH_MAX_ITEMS})",
+            )
+
+        if isinstance(batch, FrameBatch):
+            results, samples, positions = _validate_frame(batch)
+        else:
+            results, samples, positions = _validate_items(batch)
+    _admit_or_429(len(samples))
+    try:
+        outcomes, retry = await _ingest_admitted(db, samples)
+    finally:
+        ADMISSION.leave()
+    if retry is not None:
+        response.headers.update(_retry_after(retry))
+    return _batch_summary(results, samples, positions, outcomes)
+
+
+
+class _StreamFrameError(ValueError):
+    def __init__(self, seq: Any, detail: str) -> None:
+        super().__init__(detail)
+        self.seq = seq
+        self.detail = detail
+
+
+def _decode_stream_frame(message: Dict[str, Any], last_seq: int) -> Tuple[int, Any]:
+    """
+    Frame de texto: {"seq": <int crescente>, "samples": [TelemetryPayload, ...]}.
+    Frame binário: formato de services/frame_codec.py (seq vem no cabeçalho).
+    """
+    if message.get("bytes") is not None:
+        try:
+            batch = decode_frame(message["bytes"])
+        except FrameDecodeError as exc:
+            raise _StreamFrameError(None, f"Invalid binary frame: {exc}")
+        if batch.seq <= last_seq:
+            raise _StreamFrameError(batch.seq, f"seq must be an integer greater than {last_seq}")
+        if len(batch) > INGEST_BATCH_MAX_ITEMS:
+            raise _StreamFrameError(batch.seq, f"Frame too large: {len(batch)} items (max {INGEST_BATCH_MAX_ITEMS})")
+        return batch.seq, batch
+    if message.get("text") is None:
+        raise _StreamFrameError(None, "Expected a text or binary frame")
+    try:
+        frame = json.loads(message["text"])
+    except ValueError as exc:
+        raise _StreamFrameError(None, f"Invalid JSON frame: {exc}")
+    if not isinstance(frame, dict):
+        raise _StreamFrameError(None, "Frame must be a JSON object")
+    seq = frame.get("seq")
+    if not isinstance(seq, int) or seq <= last_seq:
+        raise _StreamFrameError(seq, f"seq must be an integer greater than {last_seq}")
+    items = frame.get("samples")
+    if not isinstance(items, list):
+        raise _StreamFrameError(seq, "samples must be a list")
+    if len(items) > INGEST_BATCH_MAX_ITEMS:
+        raise _StreamFrameError(seq, f"Frame too large: {len(items)} items (max {INGEST_BATCH_MAX_ITEMS})")
+    return seq, items
+
+
+@router.websocket("/stream")
+async def ingest_telemetry_stream(websocket: WebSocket, db: Session = Depends(get_db)):
+    """
+    Ingestão contínua para gateways de borda numa única conexão WebSocket.
+
+    Protocolo:
+    - servidor envia {"type": "hello", "window": N, "max_items": M} ao conectar;
+    - cliente envia frames {"seq": n, "samples": [...]} com seq crescente
+      (ou frames binários de services/frame_codec.py, com seq no cabeçalho);
+    - servidor responde {"type": "ack", "seq": n, ...contagens, "errors": [...]}
+      por frame, na ordem, ou {"type": "error", "seq": n, "detail": ...};
+      amostras acima da taxa da máquina voltam "throttled" com "retry_after".
+
+    Controle de fluxo: o cliente mantém no máximo N frames sem ack. Do lado do
+    servidor a fila de frames é limitada a N, então um cliente que ignora a
+    janela para de ser lido (backpressure TCP) em vez de acumular memória.
+    Com o ingest sobrecarregado o writer espera por vaga em vez de recusar o
+    frame, e a mesma backpressure chega ao gateway.
+    """
+    await websocket.accept()
+    await websocket.send_json(
+        {"type": "hello", "window": INGEST_STREAM_WINDOW, "max_items": INGEST_BATCH_MAX_ITEMS}
+    )
+
+    frames: asyncio.Queue = asyncio.Queue(maxsize=max(1, INGEST_STREAM_WINDOW))
+    connected = True
+
+    async def _send(message: Dict[str, Any]) -> None:
+        nonlocal connected
+        if not connected:
+            return
+        try:
+            await websocket.send_json(message)
+        except Exception:  # noqa: BLE001 - cliente desconectou no meio do envio
+            connected = False
+
+    async def _writer() -> None:
+        # Frames já recebidos são gravados mesmo se o cliente cair antes do ack
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                return
+            seq, items = frame
+            if isinstance(items, FrameBatch):
+                results, samples, positions = _validate_frame(items)
+            else:
+                results, samples, positions = _validate_items(items)
+            while (wait := ADMISSION.try_enter(len(samples))) is not None:
+                await asyncio.sleep(wait)
+            try:
+                outcomes, retry = await _ingest_admitted(db, samples)
+            finally:
+                ADMISSION.leave()
+            summary = _batch_summary(results, samples, positions, outcomes)
+            ack = {
+                "type": "ack",
+                "seq": seq,
+                "received": summary["received"],
+                "ingested": summary["ingested"],
+                "queued": summary["queued"],
+                "spooled": summary["spooled"],
+                "throttled": summary["throttled"],
+                "duplicates": summary["duplicates"],
+                "failed": summary["failed"],
+                "invalid": summary["invalid"],
+                "errors": [r for r in summary["results"] if r["status"] in ("invalid", "failed")],
+            }
+            if retry is not None:
+                ack["retry_after"] = round(retry, 3)
+            await _send(ack)
+
+    writer = asyncio.create_task(_writer())
+    last_seq = 0
+    try:
+        while connected:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                connected = False
+                break
+            try:
+                seq, items = _decode_stream_frame(message, last_seq)
+            except _StreamFrameError as exc:
+                await _send({"type": "error", "seq": exc.seq, "detail": exc.detail})
+                continue
+            last_seq = seq
+            await frames.put((seq, items))
+    finally:
+        await frames.put(None)
+        await writer
+        if connected:
+            await websocket.close()
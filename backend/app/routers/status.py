@@ -3,17 +3,45 @@ Router para status de máquinas.
 Retorna último estado válido agregado pelo /ingest.
 """
 
+import asyncio
+import json
 import logging
+import time
+from types import SimpleNamespace
 
-from fastapi import APIRouter, Response, Depends, Query
+from fastapi import APIRouter, Response, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Literal, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, insert, tuple_
 from sqlalchemy.exc import OperationalError, ProgrammingError
 
-from ..db import get_db, TelemetryEvents
+from ..config import (
+    EVENT_COMPRESSION,
+    EVENT_DEADBAND_FEED,
+    EVENT_DEADBAND_LOAD_PCT,
+    EVENT_DEADBAND_RPM,
+    EVENT_HEARTBEAT_SEC,
+    EVENT_RING_MACHINES,
+    EVENT_RING_SIZE,
+    EVENTS_EXPORT_PAGE_SIZE,
+    STATUS_LONGPOLL_MAX_SEC,
+    STATUS_PUSH_HEARTBEAT_SEC,
+    STATUS_PUSH_INTERVAL_SEC,
+    STATUS_PUSH_QUEUE_SIZE,
+    STATUS_STORE,
+    STATUS_STORE_PATH,
+    STATUS_STORE_SLOTS,
+)
+from ..db import get_db, SessionLocal, TelemetryEvents
+from ..services.db_executor import run_db
+from ..services.event_compression import EventCompressor
+from ..services.event_ring import EventRecord, EventRing
+from ..services.status_broker import StatusBroker, Subscriber
+from ..services.status_store import StatusStore, create_status_store, default_store_path
+from ..services.timing import timed
 
 router = APIRouter(prefix="/v1/machines", tags=["status"])
 logger = logging.getLogger(__name__)
@@ -82,144 +110,538 @@ class MachineEvent(BaseModel):
             }
         }
 
-# In-memory store (substituir por Redis/DB em produção)
-LAST_STATUS: Dict[str, MachineStatus] = {}
+# Último status por máquina, compartilhado entre workers (ver services/status_store.py)
+LAST_STATUS: StatusStore = create_status_store(
+    STATUS_STORE,
+    encode=lambda status: status.model_dump_json().encode("utf-8"),
+    decode=MachineStatus.model_validate_json,
+    path=STATUS_STORE_PATH or None,
+    slots=STATUS_STORE_SLOTS,
+)
+
+# Versão do histórico de eventos por máquina (valor = timestamp do último evento).
+# Alterada só depois do commit dos eventos, para o ETag de /events nunca
+# apontar para linhas ainda não visíveis.
+EVENT_VERSIONS: StatusStore = create_status_store(
+    STATUS_STORE,
+    encode=lambda timestamp: timestamp.encode("utf-8"),
+    decode=lambda raw: raw.decode("utf-8"),
+    path=(STATUS_STORE_PATH + ".events") if STATUS_STORE_PATH else str(default_store_path("cnc-telemetry-events.bin")),
+    slots=STATUS_STORE_SLOTS,
+    slot_size=256,
+)
+
+# Últimos eventos por máquina já serializados; validados contra EVENT_VERSIONS
+EVENT_RING = EventRing(capacity=EVENT_RING_SIZE, max_machines=EVENT_RING_MACHINES)
+
+# Filtra eventos redundantes antes do histórico (ver services/event_compression.py)
+EVENT_COMPRESSOR = EventCompressor(
+    mode=EVENT_COMPRESSION,
+    rpm_deadband=EVENT_DEADBAND_RPM,
+    feed_deadband=EVENT_DEADBAND_FEED,
+    load_deadband=EVENT_DEADBAND_LOAD_PCT,
+    heartbeat_sec=EVENT_HEARTBEAT_SEC,
+)
+
+# Push de mudanças de status/eventos para dashboards (SSE /stream e WS /ws)
+STATUS_BROKER = StatusBroker(
+    LAST_STATUS,
+    interval_sec=STATUS_PUSH_INTERVAL_SEC,
+    queue_size=STATUS_PUSH_QUEUE_SIZE,
+)
+
+
+def _parse_ids(ids: Optional[str]) -> Optional[List[str]]:
+    if not ids:
+        return None
+    return [machine_id for machine_id in dict.fromkeys(part.strip() for part in ids.split(",")) if machine_id]
+
+
+def insert_events(db: Session, event_rows: Sequence[dict]) -> Optional[List[int]]:
+    """INSERT multi-linha dos eventos; devolve os ids na ordem de `event_rows`
+    (None se o dialeto não garante essa ordem no RETURNING)."""
+    if not db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        db.execute(insert(TelemetryEvents), event_rows)
+        return None
+    stmt = insert(TelemetryEvents).returning(TelemetryEvents.id, sort_by_parameter_order=True)
+    return list(db.execute(stmt, event_rows).scalars())
+
+
+def mark_events_written(event_rows: Sequence[dict], event_ids: Optional[Sequence[int]] = None) -> None:
+    """Avança a versão de eventos das máquinas em `event_rows` (chamar após o commit)
+    e acrescenta os eventos ao EVENT_RING."""
+    by_machine: Dict[str, List[int]] = {}
+    for index, row in enumerate(event_rows):
+        by_machine.setdefault(row["machine_id"], []).append(index)
+    for machine_id, indexes in by_machine.items():
+        latest = max(event_rows[index]["timestamp_utc"] for index in indexes)
+        previous, version = EVENT_VERSIONS.set_bytes(machine_id, latest.isoformat().encode("utf-8"))
+        if machine_id not in EVENT_RING:
+            continue
+        EVENT_RING.append(
+            machine_id,
+            [
+                _row_record(event_rows[index], event_ids[index] if event_ids is not None else None)
+                for index in indexes
+            ],
+            previous,
+            version,
+        )
+
+
+def _etag(store: StatusStore, machine_id: str, suffix: str = "") -> str:
+    return f'"{store.epoch:08x}-{store.key_version(machine_id)}{suffix}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def _wait_for_change(current_etag: Callable[[], str], etag: str, wait: float) -> str:
+    """Segura a requisição até o ETag mudar ou `wait` segundos passarem.
+
+    Consulta a versão no store (compartilhado entre workers) a cada
+    STATUS_PUSH_INTERVAL_SEC, então a escrita pode vir de qualquer processo.
+    """
+    deadline = time.monotonic() + min(wait, STATUS_LONGPOLL_MAX_SEC)
+    while True:
+        latest = current_etag()
+        remaining = deadline - time.monotonic()
+        if latest != etag or remaining <= 0:
+            return latest
+        await asyncio.sleep(min(STATUS_PUSH_INTERVAL_SEC, remaining))
+
+
+async def _conditional(request: Request, current_etag: Callable[[], str], wait: float) -> tuple:
+    """(etag, not_modified) aplicando If-None-Match e o long-poll `?wait=`."""
+    if_none_match = request.headers.get("if-none-match")
+    etag = current_etag()
+    if wait > 0 and _etag_matches(if_none_match, etag):
+        etag = await _wait_for_change(current_etag, etag, wait)
+    return etag, _etag_matches(if_none_match, etag)
+
+
+def _revalidate_headers(etag: str) -> Dict[str, str]:
+    # no-cache (e não no-store): o cliente guarda o corpo, mas revalida sempre com If-None-Match
+    return {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Origin, Accept-Encoding",
+        "X-Contract-Fingerprint": "010191590cf1",
+    }
+
+
+def _fleet_body(snapshot: Dict[str, bytes], order: List[str], missing: List[str]) -> bytes:
+    # Concatena os JSONs já serializados de cada máquina, sem passar pelo pydantic
+    return b"".join((
+        b'{"count":%d,"machines":[' % len(order),
+        b",".join(snapshot[machine_id] for machine_id in order),
+        b'],"missing":',
+        json.dumps(missing).encode("utf-8"),
+        b"}",
+    ))
+
+
+@router.get("/status")
+def get_fleet_status(
+    ids: Optional[str] = Query(None, description="machine_ids separados por vírgula (omitido = todas)"),
+):
+    """
+    Retorna o último status de várias máquinas numa única resposta.
+
+    O corpo é montado a partir dos bytes JSON que o store mantém por máquina
+    (reescritos só quando update_status muda aquela máquina), então o custo
+    é copiar bytes, não serializar um MachineStatus por máquina.
+    Máquinas pedidas em `ids` sem status ainda aparecem em "missing".
+    """
+    wanted = _parse_ids(ids)
+    if wanted:
+        snapshot = LAST_STATUS.snapshot_bytes(wanted)
+        order = [machine_id for machine_id in wanted if machine_id in snapshot]
+        missing = [machine_id for machine_id in wanted if machine_id not in snapshot]
+    else:
+        snapshot = LAST_STATUS.snapshot_bytes()
+        order = sorted(snapshot)
+        missing = []
+
+    with timed("serialize"):
+        body = _fleet_body(snapshot, order, missing)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={
+            "Cache-Control": "no-store",
+            "Vary": "Origin, Accept-Encoding",
+            "X-Contract-Fingerprint": "010191590cf1",
+        },
+    )
+
+
+async def _sse_messages(subscriber: Subscriber):
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.next(), timeout=STATUS_PUSH_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                # Comentário SSE mantém proxies/conexão vivos sem gerar evento no cliente
+                yield b": keep-alive\n\n"
+                continue
+            yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n".encode("utf-8")
+    finally:
+        STATUS_BROKER.unsubscribe(subscriber)
+
+
+@router.get("/stream")
+async def stream_machine_status(
+    ids: Optional[str] = Query(None, description="machine_ids separados por vírgula (omitido = todas)"),
+):
+    """
+    Server-Sent Events com mudanças de status e novos eventos, sem polling.
+
+    Mensagens (campo `event` do SSE = `type`):
+    - snapshot: {"machines": [MachineStatus...]} na conexão (e com "resync": true
+      quando o cliente ficou para trás e a fila dele foi descartada);
+    - status: {"machine_id", "changed": {só os campos alterados}};
+    - event: {"machine_id", "event": {...}} a cada evento gravado no histórico.
+    """
+    subscriber = STATUS_BROKER.subscribe(_parse_ids(ids))
+    return StreamingResponse(
+        _sse_messages(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def machine_status_ws(websocket: WebSocket, ids: Optional[str] = None):
+    """
+    Mesmo canal do /stream via WebSocket, com assinatura dinâmica:
+    o cliente envia {"action": "subscribe"|"unsubscribe", "ids": [...]}.
+    Sem `ids` na URL a conexão começa sem máquinas (use subscribe).
+    """
+    await websocket.accept()
+    subscriber = STATUS_BROKER.subscribe(_parse_ids(ids) or [])
+
+    async def _reader() -> None:
+        while True:
+            message = await websocket.receive_json()
+            machine_ids = message.get("ids") if isinstance(message, dict) else None
+            if not isinstance(machine_ids, list):
+                await websocket.send_json({"type": "error", "detail": "expected {action, ids: [...]}"})
+                continue
+            if message.get("action") == "subscribe":
+                subscriber.subscribe(str(m) for m in machine_ids)
+            elif message.get("action") == "unsubscribe":
+                subscriber.unsubscribe(str(m) for m in machine_ids)
+
+    reader = asyncio.create_task(_reader())
+    pending = reader
+    try:
+        while True:
+            pending = asyncio.create_task(subscriber.next())
+            done, _ = await asyncio.wait({reader, pending}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                break  # cliente desconectou (ou protocolo quebrado)
+            await websocket.send_json(pending.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        pending.cancel()
+        await asyncio.gather(reader, pending, return_exceptions=True)
+        STATUS_BROKER.unsubscribe(subscriber)
+
+
+def _default_status(machine_id: str) -> MachineStatus:
+    # Retorno default para máquina sem dados (idle)
+    # Permite UI funcionar antes do primeiro /ingest
+    return MachineStatus(
+        machine_id=machine_id,
+        controller_family="MITSUBISHI_M8X",
+        timestamp_utc=datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        mode="MANUAL",
+        execution="READY",
+        rpm=0.0,
+        feed_rate=None,
+        spindle_load_pct=None,
+        tool_id=None,
+        alarm_code=None,
+        alarm_message=None,
+        part_count=None,
+        update_interval_ms=1000,
+        source="mtconnect:sim"
+    )
+
 
 @router.get("/{machine_id}/status", response_model=MachineStatus)
-def get_machine_status(machine_id: str, response: Response):
+async def get_machine_status(
+    machine_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=STATUS_LONGPOLL_MAX_SEC, description="Long-poll: segundos aguardando mudança"),
+):
     """
     Retorna último status válido da máquina.
     
     Headers canônicos:
-    - Cache-Control: no-store (telemetria não deve ser cacheada)
+    - ETag: versão do status da máquina ("<epoch>-<versão>")
+    - Cache-Control: no-cache (cacheável, mas sempre revalidado)
     - Vary: Origin, Accept-Encoding
     - X-Contract-Fingerprint: 010191590cf1
-    - Server-Timing: app;dur=<ms>
-    """
-    # Headers canônicos
-    response.headers["Cache-Control"] = "no-store"
-    response.headers["Vary"] = "Origin, Accept-Encoding"
-    response.headers["X-Contract-Fingerprint"] = "010191590cf1"
-    response.headers["Server-Timing"] = "app;dur=1"
-    
-    # Buscar status
-    status = LAST_STATUS.get(machine_id)
-    
-    if not status:
-        # Retorno default para máquina sem dados (idle)
-        # Permite UI funcionar antes do primeiro /ingest
-        status = MachineStatus(
-            machine_id=machine_id,
-            controller_family="MITSUBISHI_M8X",
-            timestamp_utc=datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-            mode="MANUAL",
-            execution="READY",
-            rpm=0.0,
-            feed_rate=None,
-            spindle_load_pct=None,
-            tool_id=None,
-            alarm_code=None,
-            alarm_message=None,
-            part_count=None,
-            update_interval_ms=1000,
-            source="mtconnect:sim"
-        )
-    
-    return status
 
-@router.get("/{machine_id}/events", response_model=List[MachineEvent])
-def get_machine_events(
-    machine_id: str, 
-    limit: int = Query(50, ge=1, le=200, description="Number of events to return"),
-    db: Session = Depends(get_db)
-):
-    """
-    Retorna histórico de eventos da máquina v0.2.
-    
-    Eventos são ordenados por timestamp_utc desc (mais recentes primeiro).
-    Limite padrão: 50 eventos, máximo: 200.
+    Com If-None-Match igual ao ETag atual responde 304 sem corpo. Com
+    `?wait=N` e If-None-Match, segura a requisição até o status mudar
+    (ou N segundos) antes de responder — long-poll para quem não usa WS/SSE.
     """
+    etag, not_modified = await _conditional(request, lambda: _etag(LAST_STATUS, machine_id), wait)
+    headers = _revalidate_headers(etag)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    # Os bytes do store já são o JSON do MachineStatus: sem reserializar
+    raw = LAST_STATUS.get_bytes(machine_id)
+    if raw is None:
+        with timed("serialize"):
+            raw = _default_status(machine_id).model_dump_json().encode("utf-8")
+    return Response(content=raw, media_type="application/json", headers=headers)
+
+
+def _parse_cursor(before: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Cursor "timestamp,id" do último evento da página anterior."""
+    if not before:
+        return None
     try:
-        events_query = (
-            db.query(TelemetryEvents)
-            .filter(TelemetryEvents.machine_id == machine_id)
-            .order_by(desc(TelemetryEvents.timestamp_utc))
-            .limit(limit)
-        )
-        events = events_query.all()
+        timestamp, event_id = before.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp.strip().replace(" ", "+")), int(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="before must be '<timestamp ISO 8601>,<id>'")
+
+
+def _events_cursor(event: TelemetryEvents) -> str:
+    return f"{event.timestamp_utc.isoformat()},{event.id}"
+
+
+def _fetch_events(
+    db: Session,
+    machine_id: str,
+    limit: int,
+    cursor: Optional[Tuple[datetime, int]],
+) -> List[TelemetryEvents]:
+    # Keyset: (timestamp_utc, id) < cursor percorre ix_telemetry_events_machine_ts_id
+    # a partir do ponto certo, então cada página custa O(limit) e não O(offset)
+    query = db.query(TelemetryEvents).filter(TelemetryEvents.machine_id == machine_id)
+    if cursor is not None:
+        query = query.filter(tuple_(TelemetryEvents.timestamp_utc, TelemetryEvents.id) < cursor)
+    return (
+        query.order_by(desc(TelemetryEvents.timestamp_utc), desc(TelemetryEvents.id))
+        .limit(limit)
+        .all()
+    )
+
+
+def _event_model(event) -> MachineEvent:
+    # `event`: linha ORM, ou dict de _event_values em SimpleNamespace
+    timestamp = event.timestamp_utc
+    ts_str = (
+        timestamp.isoformat().replace("+00:00", "Z")
+        if hasattr(timestamp, "isoformat")
+        else str(timestamp)
+    )
+    return MachineEvent(
+        timestamp_utc=ts_str,
+        execution=event.execution,
+        mode=event.mode,
+        rpm=event.rpm,
+        feed_rate=event.feed_rate,
+        spindle_load_pct=event.spindle_load_pct,
+        tool_id=event.tool_id,
+        alarm_code=event.alarm_code,
+        alarm_message=event.alarm_message,
+        part_count=event.part_count,
+    )
+
+
+def _query_events(
+    db: Session,
+    machine_id: str,
+    limit: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+) -> Tuple[List[MachineEvent], Optional[str]]:
+    """Uma página de eventos e o cursor da próxima (None na última página)."""
+    try:
+        events = _fetch_events(db, machine_id, limit, cursor)
     except (OperationalError, ProgrammingError) as exc:
         logger.info(
             "events query skipped due to missing table/schema",
             extra={"machine_id": machine_id, "error": str(exc)},
         )
-        return []
+        return [], None
     except Exception as exc:
         logger.warning(
             "events query failed",
             extra={"machine_id": machine_id, "error": str(exc)},
         )
-        return []
-
-    result: List[MachineEvent] = []
-    for event in events:
-        timestamp = event.timestamp_utc
-        ts_str = (
-            timestamp.isoformat().replace("+00:00", "Z")
-            if hasattr(timestamp, "isoformat")
-            else str(timestamp)
+        return [], None
+
+    next_cursor = _events_cursor(events[-1]) if len(events) == limit else None
+    return [_event_model(event) for event in events], next_cursor
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # SQLite devolve datetime sem tz (gravado em UTC); comparável com os dos dicts
+    return timestamp.replace(tzinfo=timezone.utc) if timestamp.tzinfo is None else timestamp
+
+
+def _row_record(row: dict, event_id: Optional[int]) -> EventRecord:
+    body = _event_model(SimpleNamespace(**row)).model_dump_json().encode("utf-8")
+    return EventRecord(_as_utc(row["timestamp_utc"]), event_id, body)
+
+
+def _orm_record(event: TelemetryEvents) -> EventRecord:
+    return EventRecord(_as_utc(event.timestamp_utc), event.id, _event_model(event).model_dump_json().encode("utf-8"))
+
+
+def _load_event_ring(db: Session, machine_id: str) -> bool:
+    """(Re)carrega o EVENT_RING da máquina a partir do banco; False se a consulta falhar."""
+    version = EVENT_VERSIONS.key_version(machine_id)  # antes da consulta (ver EventRing.load)
+    try:
+        events = _fetch_events(db, machine_id, EVENT_RING.capacity, None)
+    except Exception as exc:
+        logger.info(
+            "event ring load skipped",
+            extra={"machine_id": machine_id, "error": str(exc)},
         )
-        result.append(
-            MachineEvent(
-                timestamp_utc=ts_str,
-                execution=event.execution,
-                mode=event.mode,
-                rpm=event.rpm,
-                feed_rate=event.feed_rate,
-                spindle_load_pct=event.spindle_load_pct,
-                tool_id=event.tool_id,
-                alarm_code=event.alarm_code,
-                alarm_message=event.alarm_message,
-                part_count=event.part_count,
+        return False
+    EVENT_RING.load(machine_id, [_orm_record(event) for event in events], version)
+    return True
+
+
+def warm_event_ring(session_factory: Callable[[], Session] = SessionLocal) -> int:
+    """Pré-carrega o EVENT_RING das máquinas com eventos (startup); devolve quantas."""
+    session = session_factory()
+    try:
+        try:
+            machine_ids = [
+                machine_id
+                for (machine_id,) in session.query(TelemetryEvents.machine_id).distinct().limit(EVENT_RING_MACHINES)
+            ]
+        except (OperationalError, ProgrammingError) as exc:
+            logger.info("event ring warm-load skipped", extra={"error": str(exc)})
+            return 0
+        return sum(1 for machine_id in machine_ids if _load_event_ring(session, machine_id))
+    finally:
+        session.close()
+
+
+def _reload_ring_page(db: Session, machine_id: str, limit: int) -> Optional[List[EventRecord]]:
+    """Recarrega o anel defasado/ausente e serve a página dele (None se a carga falhar)."""
+    if not _load_event_ring(db, machine_id):
+        return None
+    return EVENT_RING.page(machine_id, limit, EVENT_VERSIONS.key_version(machine_id))
+
+
+def _export_events(db: Session, machine_id: str, cursor: Optional[Tuple[datetime, int]]):
+    """NDJSON de todos os eventos anteriores ao cursor, página a página (memória constante)."""
+    while True:
+        try:
+            events = _fetch_events(db, machine_id, EVENTS_EXPORT_PAGE_SIZE, cursor)
+        except Exception as exc:
+            logger.warning(
+                "events export stopped",
+                extra={"machine_id": machine_id, "error": str(exc)},
             )
-        )
+            return
+        if events:
+            yield "".join(_event_model(event).model_dump_json() + "\n" for event in events).encode("utf-8")
+        if len(events) < EVENTS_EXPORT_PAGE_SIZE:
+            return
+        cursor = (events[-1].timestamp_utc, events[-1].id)
+        # Páginas curtas: nenhuma transação fica aberta durante o download inteiro
+        db.rollback()
 
-    return result
 
-def update_status(
+@router.get("/{machine_id}/events", response_model=List[MachineEvent])
+async def get_machine_events(
     machine_id: str,
-    rpm: float,
-    feed_mm_min: float,
-    state: str,
-    db: Session = None,
-    extra: Optional[dict] = None,
-    snapshot_ts: Optional[datetime] = None,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200, description="Number of events to return"),
+    before: Optional[str] = Query(None, description="Cursor 'timestamp,id' (header X-Next-Cursor da página anterior)"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson: exporta todos os eventos (ignora limit)"),
+    wait: float = Query(0, ge=0, le=STATUS_LONGPOLL_MAX_SEC, description="Long-poll: segundos aguardando novo evento"),
+    db: Session = Depends(get_db)
 ):
     """
-    Atualiza status no store e persiste evento no histórico.
-    Chamado por /ingest após validação.
-    """
-    # [ASSUNCAO] Mapear state legado para execution v0.1
-    execution_map = {
-        "running": "EXECUTING",
-        "stopped": "STOPPED", 
-        "idle": "READY"
-    }
-    
-    timestamp_utc = snapshot_ts or datetime.now(timezone.utc)
-    timestamp_str = timestamp_utc.isoformat().replace('+00:00', 'Z')
-    execution = execution_map.get(state, "READY")
-
-    spindle_load_pct = None
-    alarm_code = None
-    if extra:
-        spindle_load_pct = extra.get("spindle_load_pct")
-        alarm_code = extra.get("alarm_code")
+    Retorna histórico de eventos da máquina v0.2.
     
-    # Atualizar status em memória
-    status = MachineStatus(
+    Eventos são ordenados por timestamp_utc desc (mais recentes primeiro).
+    Limite padrão: 50 eventos, máximo: 200.
+
+    Paginação por cursor: quando a página vem cheia, o header X-Next-Cursor
+    traz o valor para `?before=` da próxima página (eventos mais antigos).
+    `format=ndjson` exporta todos os eventos a partir do cursor (ou do mais
+    recente), um JSON por linha, em streaming.
+
+    ETag / If-None-Match / `?wait=` como em /status: a versão muda quando
+    eventos novos da máquina são gravados, e o 304 dispensa a consulta ao banco.
+    """
+    cursor = _parse_cursor(before)
+    if format == "ndjson":
+        return StreamingResponse(
+            _export_events(db, machine_id, cursor),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{machine_id}-events.ndjson"'},
+        )
+
+    etag, not_modified = await _conditional(
+        request, lambda: _etag(EVENT_VERSIONS, machine_id, f"-{limit}-{before or ''}"), wait
+    )
+    headers = _revalidate_headers(etag)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    if cursor is None and limit <= EVENT_RING.capacity:
+        page = EVENT_RING.page(machine_id, limit, EVENT_VERSIONS.key_version(machine_id))
+        if page is None:
+            page = await run_db(_reload_ring_page, db, machine_id, limit)
+        if page is not None:
+            if len(page) == limit:
+                headers["X-Next-Cursor"] = f"{page[-1].timestamp.isoformat()},{page[-1].event_id}"
+            with timed("serialize"):
+                body = b"[" + b",".join(record.body for record in page) + b"]"
+            return Response(content=body, media_type="application/json", headers=headers)
+
+    events, next_cursor = await run_db(_query_events, db, machine_id, limit, cursor)
+    response.headers.update(headers)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return events
+
+# [ASSUNCAO] Mapear state legado para execution v0.1
+EXECUTION_MAP = {
+    "running": "EXECUTING",
+    "stopped": "STOPPED",
+    "idle": "READY",
+}
+
+
+def _build_status(
+    machine_id: str,
+    rpm: float,
+    feed_mm_min: float,
+    execution: str,
+    timestamp_utc: datetime,
+    spindle_load_pct: Optional[float],
+    alarm_code: Optional[str],
+) -> MachineStatus:
+    return MachineStatus(
         machine_id=machine_id,
         controller_family="MITSUBISHI_M8X",
-        timestamp_utc=timestamp_str,
+        timestamp_utc=timestamp_utc.isoformat().replace('+00:00', 'Z'),
         mode="AUTOMATIC",  # [ASSUNCAO] Assumir AUTOMATIC quando recebendo dados
         execution=execution,
         rpm=rpm,
@@ -232,30 +654,156 @@ def update_status(
         update_interval_ms=1000,
         source="mtconnect:sim"
     )
-    
-    LAST_STATUS[machine_id] = status
+
+
+def _event_values(
+    machine_id: str,
+    rpm: float,
+    feed_mm_min: float,
+    execution: str,
+    timestamp_utc: datetime,
+    spindle_load_pct: Optional[float],
+    alarm_code: Optional[str],
+) -> dict:
+    return {
+        "machine_id": machine_id,
+        "timestamp_utc": timestamp_utc,
+        "mode": "AUTOMATIC",
+        "execution": execution,
+        "rpm": rpm,
+        "feed_rate": feed_mm_min,
+        "spindle_load_pct": spindle_load_pct,
+        "tool_id": None,
+        "alarm_code": alarm_code,
+        "alarm_message": None,
+        "part_count": None,
+        "controller_family": "MITSUBISHI_M8X",
+        "source": "mtconnect:sim",
+    }
+
+
+def _extra_fields(extra: Optional[dict]) -> tuple:
+    if not extra:
+        return None, None
+    return extra.get("spindle_load_pct"), extra.get("alarm_code")
+
+
+def update_status(
+    machine_id: str,
+    rpm: float,
+    feed_mm_min: float,
+    state: str,
+    db: Session = None,
+    extra: Optional[dict] = None,
+    snapshot_ts: Optional[datetime] = None,
+):
+    """
+    Atualiza status no store e persiste evento no histórico.
+    Chamado por /ingest após validação.
+    """
+    timestamp_utc = snapshot_ts or datetime.now(timezone.utc)
+    execution = EXECUTION_MAP.get(state, "READY")
+    spindle_load_pct, alarm_code = _extra_fields(extra)
+
+    with timed("status"):
+        # Atualizar status em memória
+        LAST_STATUS[machine_id] = _build_status(
+            machine_id, rpm, feed_mm_min, execution, timestamp_utc, spindle_load_pct, alarm_code
+        )
+        STATUS_BROKER.notify()
+        if db is not None:
+            event_rows = EVENT_COMPRESSOR.offer(
+                _event_values(
+                    machine_id, rpm, feed_mm_min, execution, timestamp_utc, spindle_load_pct, alarm_code
+                )
+            )
     
     # [v0.2] Persistir evento no histórico (assíncrono/lightweight)
     if db is not None:
+        if not event_rows:
+            return
         try:
-            event = TelemetryEvents(
-                machine_id=machine_id,
-                timestamp_utc=timestamp_utc,
-                mode="AUTOMATIC",
-                execution=execution,
-                rpm=rpm,
-                feed_rate=feed_mm_min,
-                spindle_load_pct=spindle_load_pct,
-                tool_id=None,
-                alarm_code=alarm_code,
-                alarm_message=None,
-                part_count=None,
-                controller_family="MITSUBISHI_M8X",
-                source="mtconnect:sim"
-            )
-            db.add(event)
-            db.commit()
+            events = [TelemetryEvents(**row) for row in event_rows]
+            db.add_all(events)
+            db.flush()
+            event_ids = [event.id for event in events]
+            with timed("commit"):
+                db.commit()
+            mark_events_written(event_rows, event_ids)
+            STATUS_BROKER.publish_events(event_rows)
         except Exception as e:
             # [ASSUNCAO] Não bloquear o status se falhar o histórico
             print(f"Warning: Failed to persist event to history: {e}")
             db.rollback()
+
+
+@timed("status")
+def apply_status_batch(samples: Sequence) -> List[dict]:
+    """
+    Atualiza LAST_STATUS uma única vez por máquina (amostra mais recente)
+    e devolve as linhas de evento que passaram pelo EVENT_COMPRESSOR,
+    sem gravar no banco. Quem grava publica os eventos no broker depois
+    do commit (como em update_status).
+
+    `samples` são objetos com machine_id, ts, rpm, feed_mm_min, state e extra.
+    """
+    latest: Dict[str, object] = {}
+    event_rows: List[dict] = []
+    # O compressor compara com o último evento da máquina: oferecer em ordem de ts
+    for sample in sorted(samples, key=lambda s: s.ts):
+        execution = EXECUTION_MAP.get(sample.state, "READY")
+        spindle_load_pct, alarm_code = _extra_fields(sample.extra)
+        event_rows.extend(
+            EVENT_COMPRESSOR.offer(
+                _event_values(
+                    sample.machine_id,
+                    sample.rpm,
+                    sample.feed_mm_min,
+                    execution,
+                    sample.ts,
+                    spindle_load_pct,
+                    alarm_code,
+                )
+            )
+        )
+        current = latest.get(sample.machine_id)
+        if current is None or sample.ts >= current.ts:
+            latest[sample.machine_id] = sample
+
+    for machine_id, sample in latest.items():
+        spindle_load_pct, alarm_code = _extra_fields(sample.extra)
+        LAST_STATUS[machine_id] = _build_status(
+            machine_id,
+            sample.rpm,
+            sample.feed_mm_min,
+            EXECUTION_MAP.get(sample.state, "READY"),
+            sample.ts,
+            spindle_load_pct,
+            alarm_code,
+        )
+    STATUS_BROKER.notify()
+    return event_rows
+
+
+def update_status_batch(samples: Sequence, db: Session = None) -> None:
+    """
+    Versão em lote de update_status para /ingest/batch.
+
+    Os eventos vão para o histórico num único INSERT multi-linha.
+    """
+    event_rows = apply_status_batch(samples)
+    if db is None or not event_rows:
+        return
+    try:
+        event_ids = insert_events(db, event_rows)
+        with timed("commit"):
+            db.commit()
+        mark_events_written(event_rows, event_ids)
+        STATUS_BROKER.publish_events(event_rows)
+    except Exception as exc:
+        # [ASSUNCAO] Não bloquear o status se falhar o histórico
+        logger.warning(
+            "failed to persist event batch to history",
+            extra={"events": len(event_rows), "error": str(exc)},
+        )
+        db.rollback()
@@ -0,0 +1,152 @@
+"""Admission control for the ingest path: bounded in-flight work + per-machine token buckets."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class AdmissionController:
+    """Decides whether ingest work may run now or must be retried later.
+
+    - At most `max_in_flight` ingest requests/frames run DB work at the same
+      time; `try_enter` never blocks, it returns a retry-after instead, so a
+      burst from many gateways turns into fast 429s rather than a queue that
+      drains the engine pool and starves readers.
+    - Each machine owns a token bucket refilled at `machine_rate` samples/s up
+      to `machine_burst`. A request larger than the burst is admitted only
+      when the bucket is full (the bucket goes into debt), so oversized
+      catch-up batches are slowed down instead of rejected forever.
+
+    `0` disables either limit. Accepted/rejected sample counts are kept per
+    second over the last `window_sec` seconds to report rates.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        machine_rate: float = 50.0,
+        machine_burst: float = 3000.0,
+        retry_after_sec: float = 1.0,
+        window_sec: int = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_in_flight = max(0, max_in_flight)
+        self._rate = max(0.0, machine_rate)
+        self._burst = max(1.0, machine_burst)
+        self._retry_after = max(0.0, retry_after_sec)
+        self._window = max(1, window_sec)
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_seen_in_flight = 0
+        self._buckets: Dict[str, _TokenBucket] = {}
+        # [segundo, aceitas, recusadas] dos últimos `window_sec` segundos
+        self._history: Deque[List[int]] = deque()
+        self._accepted = 0
+        self._rejected_overload = 0
+        self._rejected_rate = 0
+
+    # --------------------------------------------------------------- in-flight
+
+    def try_enter(self, samples: int = 1) -> Optional[float]:
+        """Reserve an in-flight slot; returns None when admitted, else seconds to wait.
+
+        `samples` is only used to account the rejected rate in samples/s.
+        """
+        with self._lock:
+            if self._max_in_flight and self._in_flight >= self._max_in_flight:
+                self._rejected_overload += samples
+                self._record_locked(0, samples)
+                return self._retry_after
+            self._in_flight += 1
+            self._max_seen_in_flight = max(self._max_seen_in_flight, self._in_flight)
+            return None
+
+    def leave(self) -> None:
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    # ------------------------------------------------------------ rate limits
+
+    def take_tokens(self, counts: Mapping[str, int]) -> Dict[str, float]:
+        """Consume `counts[machine]` tokens per machine.
+
+        Returns the machines that are over budget with their retry-after in
+        seconds; nothing is consumed for those machines.
+        """
+        throttled: Dict[str, float] = {}
+        with self._lock:
+            now = self._clock()
+            accepted = rejected = 0
+            for machine_id, count in counts.items():
+                if not self._rate:
+                    accepted += count
+                    continue
+                bucket = self._buckets.get(machine_id)
+                if bucket is None:
+                    bucket = self._buckets[machine_id] = _TokenBucket(self._burst, now)
+                else:
+                    bucket.tokens = min(self._burst, bucket.tokens + (now - bucket.updated) * self._rate)
+                    bucket.updated = now
+                needed = min(count, self._burst)
+                if bucket.tokens >= needed:
+                    bucket.tokens -= count
+                    accepted += count
+                else:
+                    throttled[machine_id] = (needed - bucket.tokens) / self._rate
+                    rejected += count
+            self._accepted += accepted
+            self._rejected_rate += rejected
+            self._record_locked(accepted, rejected)
+        return throttled
+
+    # ----------------------------------------------------------------- metrics
+
+    def _record_locked(self, accepted: int, rejected: int) -> None:
+        second = int(self._clock())
+        if self._history and self._history[-1][0] == second:
+            self._history[-1][1] += accepted
+            self._history[-1][2] += rejected
+        else:
+            self._history.append([second, accepted, rejected])
+        while self._history and self._history[0][0] <= second - self._window:
+            self._history.popleft()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            self._record_locked(0, 0)
+            accepted = sum(entry[1] for entry in self._history)
+            rejected = sum(entry[2] for entry in self._history)
+            return {
+                "in_flight": self._in_flight,
+                "in_flight_max_seen": self._max_seen_in_flight,
+                "max_in_flight": self._max_in_flight,
+                "machine_rate": self._rate,
+                "machine_burst": self._burst,
+                "accepted_samples": self._accepted,
+                "rejected_overload": self._rejected_overload,
+                "rejected_rate_limited": self._rejected_rate,
+                "accepted_per_s": round(accepted / self._window, 2),
+                "rejected_per_s": round(rejected / self._window, 2),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._in_flight = 0
+            self._max_seen_in_flight = 0
+            self._buckets.clear()
+            self._history.clear()
+            self._accepted = 0
+            self._rejected_overload = 0
+            self._rejected_rate = 0
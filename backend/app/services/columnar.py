@@ -0,0 +1,94 @@
+"""Column-oriented encoders for query results (history analytics).
+
+Rows coming from the DB cursor are transposed chunk by chunk into one
+Python list per column (`zip(*chunk)`), without building a dict per row.
+The buffers are then encoded either as JSON arrays per field or as an
+Apache Arrow IPC stream (pyarrow is optional; `arrow_available()` tells).
+
+Values are not rounded: columnar output targets notebooks, not the chart.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Sequence
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+TIME_COLUMNS = frozenset({"ts"})
+INTEGER_COLUMNS = frozenset({"sample_count", "sequence"})
+STRING_COLUMNS = frozenset({"machine_id", "state"})
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+class ColumnBuffers:
+    """One list per selected column, filled from cursor chunks."""
+
+    def __init__(self, names: Sequence[str]) -> None:
+        self.names = list(names)
+        self.values: List[List[Any]] = [[] for _ in self.names]
+
+    def extend(self, rows: Sequence[Sequence[Any]]) -> None:
+        if not rows:
+            return
+        for column, values in zip(self.values, zip(*rows)):
+            column.extend(values)
+
+    def extend_all(self, chunks: Iterable[Sequence[Sequence[Any]]]) -> "ColumnBuffers":
+        for chunk in chunks:
+            self.extend(chunk)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.values[0]) if self.values else 0
+
+
+def _iso(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+    return value
+
+
+def to_columnar_json(buffers: ColumnBuffers, aliases: Dict[str, str], **meta: Any) -> bytes:
+    """`{...meta, "count": n, "columns": {name: [values]}}`; timestamps as ISO 8601 UTC."""
+    columns = {}
+    for name, values in zip(buffers.names, buffers.values):
+        if name in TIME_COLUMNS:
+            values = [_iso(value) for value in values]
+        columns[aliases.get(name, name)] = values
+    payload = {**meta, "count": len(buffers), "columns": columns}
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _arrow_type(name: str):
+    if name in TIME_COLUMNS:
+        return pa.timestamp("us", tz="UTC")
+    if name in INTEGER_COLUMNS:
+        return pa.int64()
+    if name in STRING_COLUMNS:
+        return pa.string()
+    return pa.float64()
+
+
+def to_arrow_ipc(buffers: ColumnBuffers, aliases: Dict[str, str], **meta: Any) -> bytes:
+    """Arrow IPC stream (one record batch); `meta` goes into the schema metadata."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    arrays = [pa.array(values, type=_arrow_type(name)) for name, values in zip(buffers.names, buffers.values)]
+    table = pa.Table.from_arrays(
+        arrays,
+        names=[aliases.get(name, name) for name in buffers.names],
+    ).replace_schema_metadata({key: str(value) for key, value in meta.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,61 @@
+"""Bounded executor that keeps blocking SQLAlchemy work off the asyncio loop."""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from backend.app.config import DB_EXECUTION_MODE, DB_EXECUTOR_WORKERS
+from backend.app.services.timing import record
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, DB_EXECUTOR_WORKERS),
+                    thread_name_prefix="db-io",
+                )
+    return _executor
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking DB call from async code according to DB_EXECUTION_MODE.
+
+    - ``executor``: runs on a dedicated pool of DB_EXECUTOR_WORKERS threads, so a
+      slow commit never stalls the event loop (and /healthz) and concurrent DB
+      work is capped below the engine pool size.
+    - ``inline``: legacy behaviour, calls the function directly on the loop.
+
+    Context variables are propagated to the worker thread. The time spent
+    waiting for a free worker is recorded as the request's `db_acquire` phase.
+    """
+    if DB_EXECUTION_MODE == "inline":
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def call() -> T:
+        record("db_acquire", time.perf_counter() - submitted)
+        return func(*args, **kwargs)
+
+    return await loop.run_in_executor(_get_executor(), functools.partial(contextvars.copy_context().run, call))
+
+
+def shutdown_db_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,101 @@
+"""Largest-Triangle-Three-Buckets downsampling for chart series.
+
+Picks `threshold` points out of `n` keeping the visual shape of the series:
+first and last points are kept, the rest is split into equal buckets and
+each bucket contributes the point forming the largest triangle with the
+previously kept point and the average of the next bucket.
+
+Uses NumPy when installed (per-bucket areas are vectorized, the loop runs
+once per *output* point); otherwise a pure-Python version with the same
+result.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import Iterable, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy é opcional
+    np = None
+
+
+class SeriesBuffer:
+    """Append-only (x, y) float columns, filled chunk by chunk from a DB cursor."""
+
+    def __init__(self) -> None:
+        self.x = array("d")
+        self.y = array("d")
+
+    def extend(self, rows: Iterable[Tuple[float, float]]) -> None:
+        for x_value, y_value in rows:
+            self.x.append(float(x_value))
+            self.y.append(float(y_value or 0.0))
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+
+def _bucket_edges(n: int, threshold: int) -> List[int]:
+    # Bucket k (0..threshold-3) = [edges[k], edges[k+1]); edges[-1] == n - 1 (último ponto)
+    every = (n - 2) / (threshold - 2)
+    return [int(k * every) + 1 for k in range(threshold - 1)]
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    """Indices (ascending) of the points kept; `x` must be non-decreasing."""
+    n = len(x)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:max(threshold, 0)]
+    if np is not None:
+        return _lttb_numpy(x, y, threshold)
+    return _lttb_python(x, y, threshold)
+
+
+def _lttb_numpy(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    xs = np.frombuffer(x, dtype=np.float64) if isinstance(x, array) else np.asarray(x, dtype=np.float64)
+    ys = np.frombuffer(y, dtype=np.float64) if isinstance(y, array) else np.asarray(y, dtype=np.float64)
+    n = len(xs)
+    edges = np.asarray(_bucket_edges(n, threshold), dtype=np.int64)
+    counts = np.diff(edges)
+    # Média de cada bucket; o "próximo" do último bucket é o último ponto
+    next_x = np.append((np.add.reduceat(xs[: n - 1], edges[:-1]) / counts)[1:], xs[-1])
+    next_y = np.append((np.add.reduceat(ys[: n - 1], edges[:-1]) / counts)[1:], ys[-1])
+
+    selected = [0]
+    anchor = 0
+    for k in range(threshold - 2):
+        lo, hi = edges[k], edges[k + 1]
+        ax, ay = xs[anchor], ys[anchor]
+        area = np.abs((ax - next_x[k]) * (ys[lo:hi] - ay) - (ax - xs[lo:hi]) * (next_y[k] - ay))
+        anchor = int(lo + area.argmax())
+        selected.append(anchor)
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_python(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    n = len(x)
+    edges = _bucket_edges(n, threshold)
+    selected = [0]
+    anchor = 0
+    for k in range(threshold - 2):
+        lo, hi = edges[k], edges[k + 1]
+        if k + 2 < len(edges):
+            nlo, nhi = edges[k + 1], edges[k + 2]
+            next_x = sum(x[nlo:nhi]) / (nhi - nlo)
+            next_y = sum(y[nlo:nhi]) / (nhi - nlo)
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        ax, ay = x[anchor], y[anchor]
+        best, best_area = lo, -1.0
+        for index in range(lo, hi):
+            area = abs((ax - next_x) * (y[index] - ay) - (ax - x[index]) * (next_y - ay))
+            if area > best_area:
+                best, best_area = index, area
+        anchor = best
+        selected.append(anchor)
+    selected.append(n - 1)
+    return selected
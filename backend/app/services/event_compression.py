@@ -0,0 +1,182 @@
+"""Event compression for the telemetry_events history.
+
+A machine idling for a whole shift would otherwise write one identical event
+per sample. The compressor decides, per machine, which event rows are worth
+persisting:
+
+- ``deadband``: record on execution/mode/alarm change, when rpm, feed or
+  spindle load leave a deadband around the last *recorded* value, or when
+  ``heartbeat_sec`` elapsed since the last recorded event.
+- ``swinging_door``: same change/heartbeat rules, but analog values use
+  swinging-door trending (the deadband becomes the door width), which keeps
+  ramps with a few points instead of one per deadband step. When the door
+  closes the previous (held) sample is recorded, so rows may be emitted late.
+- ``off``: record every event (legacy behaviour).
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+MODES = ("off", "deadband", "swinging_door")
+_DISCRETE_FIELDS = ("execution", "mode", "alarm_code")
+
+
+@dataclass
+class _MachineState:
+    recorded: Optional[dict] = None
+    held: Optional[dict] = None
+    # swinging door: (slope_upper, slope_lower) per analog field
+    slopes: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    seen: int = 0
+    stored: int = 0
+
+
+def _seconds(row: dict) -> float:
+    ts: datetime = row["timestamp_utc"]
+    return ts.timestamp()
+
+
+class EventCompressor:
+    """Per-machine event filter; thread-safe, state kept in memory."""
+
+    def __init__(
+        self,
+        mode: str = "deadband",
+        rpm_deadband: float = 50.0,
+        feed_deadband: float = 25.0,
+        load_deadband: float = 5.0,
+        heartbeat_sec: float = 300.0,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Invalid event compression mode: {mode}. Must be one of: {', '.join(MODES)}")
+        self.mode = mode
+        self._deadbands = {
+            "rpm": rpm_deadband,
+            "feed_rate": feed_deadband,
+            "spindle_load_pct": load_deadband,
+        }
+        self._heartbeat = heartbeat_sec
+        self._machines: Dict[str, _MachineState] = {}
+        self._lock = threading.Lock()
+
+    def offer(self, row: dict) -> List[dict]:
+        """Feed one event row; returns the rows that must be persisted now."""
+        with self._lock:
+            state = self._machines.setdefault(row["machine_id"], _MachineState())
+            state.seen += 1
+            if self.mode == "off":
+                emitted = [row]
+            elif self.mode == "deadband":
+                emitted = self._deadband(state, row)
+            else:
+                emitted = self._swinging_door(state, row)
+            state.stored += len(emitted)
+            return emitted
+
+    def _discrete_change(self, last: dict, row: dict) -> bool:
+        return any(last.get(name) != row.get(name) for name in _DISCRETE_FIELDS)
+
+    def _heartbeat_due(self, last: dict, row: dict) -> bool:
+        return self._heartbeat > 0 and _seconds(row) - _seconds(last) >= self._heartbeat
+
+    def _outside_deadband(self, last: dict, row: dict) -> bool:
+        for name, width in self._deadbands.items():
+            old, new = last.get(name), row.get(name)
+            if (old is None) != (new is None):
+                return True
+            if old is not None and abs(new - old) > width:
+                return True
+        return False
+
+    def _deadband(self, state: _MachineState, row: dict) -> List[dict]:
+        last = state.recorded
+        if (
+            last is None
+            or self._discrete_change(last, row)
+            or self._heartbeat_due(last, row)
+            or self._outside_deadband(last, row)
+        ):
+            state.recorded = row
+            return [row]
+        return []
+
+    def _door_open(self, state: _MachineState, row: dict) -> bool:
+        """Narrow the door with `row`; False when it closes for any analog field."""
+        anchor = state.recorded
+        dt = _seconds(row) - _seconds(anchor)
+        if dt <= 0:
+            return not self._outside_deadband(anchor, row)
+        slopes: Dict[str, Tuple[float, float]] = {}
+        for name, width in self._deadbands.items():
+            base, value = anchor.get(name), row.get(name)
+            if (base is None) != (value is None):
+                return False
+            if base is None:
+                continue
+            upper, lower = state.slopes.get(name, (float("-inf"), float("inf")))
+            upper = max(upper, (value - base - width) / dt)
+            lower = min(lower, (value - base + width) / dt)
+            if upper > lower:
+                return False
+            slopes[name] = (upper, lower)
+        state.slopes = slopes
+        return True
+
+    def _swinging_door(self, state: _MachineState, row: dict) -> List[dict]:
+        anchor = state.recorded
+        if anchor is None:
+            state.recorded, state.held, state.slopes = row, None, {}
+            return [row]
+
+        if self._discrete_change(anchor, row) or self._heartbeat_due(anchor, row):
+            emitted = []
+            if state.held is not None and self._discrete_change(anchor, row):
+                # Fecha o trecho anterior no último ponto antes da mudança
+                emitted.append(state.held)
+            emitted.append(row)
+            state.recorded, state.held, state.slopes = row, None, {}
+            return emitted
+
+        if self._door_open(state, row):
+            state.held = row
+            return []
+
+        # Porta fechou: o ponto retido vira a nova âncora e a porta reabre a partir dele
+        held = state.held
+        if held is None:
+            state.recorded, state.slopes = row, {}
+            return [row]
+        state.recorded, state.held, state.slopes = held, None, {}
+        if self._door_open(state, row):
+            state.held = row
+        else:
+            state.recorded, state.slopes = row, {}
+            return [held, row]
+        return [held]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_machine = {
+                machine_id: {
+                    "seen": st.seen,
+                    "recorded": st.stored,
+                    "ratio": round(st.seen / st.stored, 2) if st.stored else None,
+                }
+                for machine_id, st in self._machines.items()
+            }
+        seen = sum(m["seen"] for m in per_machine.values())
+        stored = sum(m["recorded"] for m in per_machine.values())
+        return {
+            "mode": self.mode,
+            "seen": seen,
+            "recorded": stored,
+            "ratio": round(seen / stored, 2) if stored else None,
+            "per_machine": per_machine,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._machines.clear()
@@ -0,0 +1,119 @@
+"""Bounded per-machine ring buffer of recent events, serving /events from memory.
+
+Each machine keeps its newest `capacity` events as compact records holding
+the already-serialized JSON of the event, so a dashboard poll is a slice +
+join instead of ORDER BY ... LIMIT plus one pydantic model per row.
+
+A machine's ring is tagged with the event-version (see EVENT_VERSIONS in
+routers/status.py) it reflects. Events written by this process are appended
+only when the version they replaced is the ring's version; a write from
+another worker leaves the ring behind the shared version and it is reloaded
+from the DB on the next read. Rows inserted behind the API's back (seed
+scripts) do not bump the version and only show up after a reload/restart.
+The number of machines kept is bounded too (least recently used are dropped).
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from datetime import datetime
+from typing import Deque, Iterable, List, Optional, Tuple
+
+
+class EventRecord:
+    __slots__ = ("timestamp", "event_id", "body")
+
+    def __init__(self, timestamp: datetime, event_id: int, body: bytes) -> None:
+        self.timestamp = timestamp
+        self.event_id = event_id
+        self.body = body
+
+    @property
+    def sort_key(self) -> Tuple[datetime, int]:
+        return self.timestamp, self.event_id
+
+
+class _MachineRing:
+    __slots__ = ("records", "version", "complete")
+
+    def __init__(self, capacity: int, version: int, complete: bool) -> None:
+        self.records: Deque[EventRecord] = deque(maxlen=capacity)  # mais antigo à esquerda
+        self.version = version
+        # True quando o anel contém todos os eventos da máquina (menos que `capacity`)
+        self.complete = complete
+
+
+class EventRing:
+    def __init__(self, capacity: int = 200, max_machines: int = 4096) -> None:
+        self.capacity = max(1, capacity)
+        self._max_machines = max(1, max_machines)
+        self._lock = threading.Lock()
+        self._rings: "OrderedDict[str, _MachineRing]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def load(self, machine_id: str, newest_first: Iterable[EventRecord], version: int) -> None:
+        """Replace the ring of `machine_id` with up to `capacity` records read from the DB.
+
+        `version` must be read before the DB query, so a write racing the
+        load leaves the ring stale (reloaded later) rather than missing it.
+        """
+        records = list(newest_first)[: self.capacity]
+        ring = _MachineRing(self.capacity, version, complete=len(records) < self.capacity)
+        ring.records.extend(reversed(records))
+        with self._lock:
+            self._rings[machine_id] = ring
+            self._rings.move_to_end(machine_id)
+            while len(self._rings) > self._max_machines:
+                self._rings.popitem(last=False)
+
+    def append(self, machine_id: str, records: List[EventRecord], previous_version: int, version: int) -> None:
+        """Add freshly committed events; drops the ring if it missed a write in between."""
+        with self._lock:
+            ring = self._rings.get(machine_id)
+            if ring is None:
+                return
+            if ring.version != previous_version or any(record.event_id is None for record in records):
+                del self._rings[machine_id]
+                return
+            records = sorted(records, key=lambda record: record.sort_key)
+            if len(ring.records) + len(records) > self.capacity:
+                ring.complete = False  # os mais antigos saem (continuam só no banco)
+            if not records or not ring.records or records[0].sort_key > ring.records[-1].sort_key:
+                ring.records.extend(records)  # caso comum: tudo mais novo que o topo
+            else:
+                # Replay do spool pode trazer eventos mais antigos que o topo
+                merged = sorted([*ring.records, *records], key=lambda record: record.sort_key)
+                ring.records.clear()
+                ring.records.extend(merged[-self.capacity:])
+            ring.version = version
+
+    def __contains__(self, machine_id: object) -> bool:
+        return machine_id in self._rings
+
+    def page(self, machine_id: str, limit: int, version: int) -> Optional[List[EventRecord]]:
+        """Newest `limit` records, or None when the ring is missing/stale or too short."""
+        with self._lock:
+            ring = self._rings.get(machine_id)
+            if ring is None or ring.version != version or (limit > len(ring.records) and not ring.complete):
+                self._misses += 1
+                return None
+            self._rings.move_to_end(machine_id)
+            self._hits += 1
+            return list(islice(reversed(ring.records), limit))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "machines": len(self._rings),
+                "capacity": self.capacity,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._rings.clear()
+            self._hits = 0
+            self._misses = 0
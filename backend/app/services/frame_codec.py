@@ -0,0 +1,131 @@
+"""Compact binary frame format for telemetry ingest.
+
+Layout (little-endian), one frame per batch:
+
+    header   magic "CNTF" | version u8 | flags u8 | n_machines u16 | seq u32 | n_records u32
+    machines n_machines x (len u8 | machine_id utf-8)
+    records  n_records x (ts_ms i64 | machine_idx u16 | rpm f32 | feed_mm_min f32 | state u8)
+
+Each record is 19 bytes instead of ~120 bytes of JSON, carries an integer
+epoch-ms timestamp (no ISO-8601 parsing) and refers to the machine by index
+into the frame's machine table. Stdlib only so the standalone MTConnect
+adapter can import it without extra dependencies.
+"""
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "application/vnd.cnc-telemetry.frame"
+MAGIC = b"CNTF"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBBHII")
+_RECORD = struct.Struct("<qHffB")
+
+STATES: Tuple[str, ...] = ("running", "stopped", "idle")
+STATE_CODES: Dict[str, int] = {state: code for code, state in enumerate(STATES)}
+
+
+class FrameDecodeError(ValueError):
+    """Raised when a binary frame is truncated or malformed."""
+
+
+@dataclass
+class FrameBatch:
+    """Decoded frame kept as parallel column arrays (one entry per record)."""
+
+    seq: int
+    machine_ids: List[str]
+    ts_ms: Sequence[int] = field(default_factory=list)
+    machine_idx: Sequence[int] = field(default_factory=list)
+    rpm: Sequence[float] = field(default_factory=list)
+    feed_mm_min: Sequence[float] = field(default_factory=list)
+    state: Sequence[int] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ts_ms)
+
+
+def encode_frame(samples: Sequence[dict], seq: int = 0) -> bytes:
+    """Encode samples shaped like TelemetryPayload into one binary frame.
+
+    `timestamp` may be an ISO 8601 string, a datetime or epoch milliseconds.
+    """
+    machine_index: Dict[str, int] = {}
+    records = bytearray()
+    for sample in samples:
+        machine_id = sample["machine_id"]
+        idx = machine_index.setdefault(machine_id, len(machine_index))
+        records += _RECORD.pack(
+            _to_epoch_ms(sample["timestamp"]),
+            idx,
+            float(sample["rpm"]),
+            float(sample["feed_mm_min"]),
+            STATE_CODES[sample["state"]],
+        )
+
+    table = bytearray()
+    for machine_id in machine_index:
+        raw = machine_id.encode("utf-8")
+        if len(raw) > 255:
+            raise ValueError(f"machine_id too long for frame: {machine_id!r}")
+        table += bytes((len(raw),)) + raw
+
+    header = _HEADER.pack(MAGIC, VERSION, 0, len(machine_index), seq, len(samples))
+    return header + bytes(table) + bytes(records)
+
+
+def decode_frame(data: bytes) -> FrameBatch:
+    """Decode a whole frame into column arrays in a single pass over the records."""
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise FrameDecodeError("frame shorter than header")
+    magic, version, _flags, n_machines, seq, n_records = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise FrameDecodeError("bad magic")
+    if version != VERSION:
+        raise FrameDecodeError(f"unsupported frame version {version}")
+
+    offset = _HEADER.size
+    machine_ids: List[str] = []
+    for _ in range(n_machines):
+        if offset >= len(view):
+            raise FrameDecodeError("truncated machine table")
+        size = view[offset]
+        offset += 1
+        if offset + size > len(view):
+            raise FrameDecodeError("truncated machine table")
+        machine_ids.append(bytes(view[offset:offset + size]).decode("utf-8"))
+        offset += size
+
+    body = view[offset:]
+    if len(body) != n_records * _RECORD.size:
+        raise FrameDecodeError(
+            f"expected {n_records} records ({n_records * _RECORD.size} bytes), got {len(body)} bytes"
+        )
+    if n_records == 0:
+        return FrameBatch(seq=seq, machine_ids=machine_ids)
+
+    ts_ms, machine_idx, rpm, feed, state = zip(*_RECORD.iter_unpack(body))
+    return FrameBatch(
+        seq=seq,
+        machine_ids=machine_ids,
+        ts_ms=ts_ms,
+        machine_idx=machine_idx,
+        rpm=rpm,
+        feed_mm_min=feed,
+        state=state,
+    )
+
+
+def _to_epoch_ms(value) -> int:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(round(value.timestamp() * 1000))
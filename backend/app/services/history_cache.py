@@ -0,0 +1,148 @@
+"""LRU cache of aggregated /history results, invalidated per machine and time range.
+
+telemetry_5m/1h/1d only change when the rollup engine (services/rollup.py)
+rewrites buckets of a machine. The engine reports every rewritten raw-time
+range to a `RollupChangeLog`: a short per-machine list of (seq, start, end)
+kept in a shared StatusStore, so all workers see changes made by whichever
+worker ran the rollup. A cached result records the machine's seq read
+before its query and the raw-time span its buckets cover; it stays valid
+until a later change overlaps that span. Ingest at the head of the series
+therefore leaves closed past windows cached.
+
+If the log no longer holds every change since an entry was filled (more
+than `max_changes` rewrites of that machine), the entry is dropped.
+"""
+from __future__ import annotations
+
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from backend.app.services.status_store import StatusStore
+
+_LOG_HEADER = struct.Struct("<Q")  # último seq da máquina
+_CHANGE = struct.Struct("<Qqq")  # seq | início | fim (epoch s, fim exclusivo)
+
+Token = Tuple[int, int]  # (epoch do store, seq)
+
+
+class RollupChangeLog:
+    def __init__(self, store: StatusStore, max_changes: int = 12) -> None:
+        self._store = store
+        self._max_changes = max(1, max_changes)
+        # Um único escritor por processo; entre workers o motor de rollups já é serializado pelo banco
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _decode(raw: Optional[bytes]) -> Tuple[int, List[Tuple[int, int, int]]]:
+        if not raw:
+            return 0, []
+        (seq,) = _LOG_HEADER.unpack_from(raw)
+        changes = [
+            _CHANGE.unpack_from(raw, offset)
+            for offset in range(_LOG_HEADER.size, len(raw) - _CHANGE.size + 1, _CHANGE.size)
+        ]
+        return seq, changes
+
+    def record(self, machine_id: str, start: int, end: int) -> None:
+        with self._lock:
+            seq, changes = self._decode(self._store.get_bytes(machine_id))
+            seq += 1
+            changes = [*changes, (seq, start, end)][-self._max_changes:]
+            self._store.set_bytes(
+                machine_id,
+                _LOG_HEADER.pack(seq) + b"".join(_CHANGE.pack(*change) for change in changes),
+            )
+
+    def token(self, machine_id: str) -> Token:
+        seq, _changes = self._decode(self._store.get_bytes(machine_id))
+        return self._store.epoch, seq
+
+    def changed_since(self, machine_id: str, token: Token, start: int, end: int) -> bool:
+        epoch, seen = token
+        if epoch != self._store.epoch:
+            return True  # store recriado/limpo: seqs recomeçaram
+        seq, changes = self._decode(self._store.get_bytes(machine_id))
+        if seq == seen:
+            return False
+        if seq < seen or not changes or changes[0][0] > seen + 1:
+            return True  # histórico de mudanças truncado
+        return any(change_seq > seen and lo < end and hi > start for change_seq, lo, hi in changes)
+
+    def clear(self) -> None:
+        self._store.clear()
+
+
+class _Entry:
+    __slots__ = ("machine_id", "token", "start", "end", "value")
+
+    def __init__(self, machine_id: str, token: Token, start: int, end: int, value: Any) -> None:
+        self.machine_id = machine_id
+        self.token = token
+        self.start = start
+        self.end = end
+        self.value = value
+
+
+class HistoryCache:
+    """Bounded LRU; disabled until something maintains the rollups in-process (see main.py)."""
+
+    def __init__(self, changes: RollupChangeLog, max_entries: int = 512) -> None:
+        self.changes = changes
+        self.enabled = False
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self._max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self.changes.changed_since(entry.machine_id, entry.token, entry.start, entry.end):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self._invalidations += 1
+            entry = None
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, machine_id: str, token: Token, start: int, end: int, value: Any) -> None:
+        """Store a result; `token` must be read (changes.token) before running its query."""
+        with self._lock:
+            self._entries[key] = _Entry(machine_id, token, start, end, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.active,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+            self._invalidations = 0
+        self.enabled = False
+        self.changes.clear()
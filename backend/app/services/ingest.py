@@ -0,0 +1,487 @@
+"""Shared ingest path for telemetry samples (single, batch and M80 worker)."""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from backend.app.config import (
+    INGEST_DEDUP_CACHE_SIZE,
+    INGEST_SPOOL_DIR,
+    INGEST_SPOOL_DRAIN_BATCH,
+    INGEST_SPOOL_DRAIN_INTERVAL_SEC,
+    INGEST_SPOOL_ENABLED,
+    INGEST_SPOOL_FSYNC,
+    INGEST_SPOOL_MAX_MB,
+    INGEST_SPOOL_SEGMENT_MB,
+    INGEST_SPOOL_SLOW_COMMIT_MS,
+    WRITE_BEHIND_ENABLED,
+    WRITE_BEHIND_FLUSH_INTERVAL_SEC,
+    WRITE_BEHIND_FLUSH_ROWS,
+    WRITE_BEHIND_MAX_ROWS,
+)
+from backend.app.db import SessionLocal, Telemetry
+from backend.app.routers import status as status_router
+from backend.app.services import state_intervals
+from backend.app.services.spool import DiskSpool
+from backend.app.services.timing import timed
+from backend.app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_STORED = "stored"
+OUTCOME_DUPLICATE = "duplicate"
+OUTCOME_FAILED = "failed"
+OUTCOME_QUEUED = "queued"
+OUTCOME_SPOOLED = "spooled"
+OUTCOME_THROTTLED = "throttled"
+
+_write_behind: Optional[WriteBehindBuffer] = None
+_spool: Optional[DiskSpool] = None
+
+
+@dataclass
+class IngestSample:
+    """A validated telemetry sample ready to be persisted."""
+
+    machine_id: str
+    ts: datetime
+    rpm: float
+    feed_mm_min: float
+    state: str
+    sequence: Optional[int] = None
+    src: str = "mtconnect"
+    extra: Optional[dict[str, Any]] = None
+
+    def telemetry_row(self) -> dict[str, Any]:
+        return {
+            "ts": self.ts,
+            "machine_id": self.machine_id,
+            "rpm": self.rpm,
+            "feed_mm_min": self.feed_mm_min,
+            "state": self.state,
+            "sequence": self.sequence,
+            "src": self.src,
+        }
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp, accepting the trailing `Z` form."""
+
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class RecentKeyCache:
+    """Bounded LRU of recently ingested `(machine_id, ts)` keys.
+
+    Lets obvious replays (adapter retry storms) be rejected before they reach
+    the database. Keys are normalised to naive UTC so they compare equal to
+    timestamps returned by any dialect.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self._max_keys = max(0, max_keys)
+        self._keys: "OrderedDict[Tuple[str, datetime], None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def contains(self, key: Tuple[str, datetime]) -> bool:
+        if self._max_keys == 0:
+            return False
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add_many(self, keys: Iterable[Tuple[str, datetime]]) -> None:
+        if self._max_keys == 0:
+            return
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self._max_keys:
+                self._keys.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+
+
+_recent_keys = RecentKeyCache(INGEST_DEDUP_CACHE_SIZE)
+_duplicate_lock = threading.Lock()
+_duplicates_by_machine: Dict[str, Dict[str, int]] = {}
+
+
+def _sample_key(machine_id: str, ts: datetime) -> Tuple[str, datetime]:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return machine_id, ts
+
+
+def _count_duplicate(machine_id: str, source: str) -> None:
+    with _duplicate_lock:
+        counters = _duplicates_by_machine.setdefault(machine_id, {"cache": 0, "database": 0})
+        counters[source] += 1
+
+
+def get_duplicate_stats() -> Dict[str, Any]:
+    """Duplicate samples rejected per machine (LRU cache vs. database conflict)."""
+
+    with _duplicate_lock:
+        per_machine = {machine: dict(counts) for machine, counts in _duplicates_by_machine.items()}
+    return {
+        "cache_size": len(_recent_keys),
+        "total": sum(c["cache"] + c["database"] for c in per_machine.values()),
+        "per_machine": per_machine,
+    }
+
+
+def reset_duplicate_tracking() -> None:
+    _recent_keys.clear()
+    with _duplicate_lock:
+        _duplicates_by_machine.clear()
+
+
+def _conflict_free_insert(db: Session):
+    """`INSERT ... ON CONFLICT DO NOTHING RETURNING` for dialects that support it."""
+
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect.name == "sqlite" and dialect.insert_executemany_returning:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return (
+        dialect_insert(Telemetry)
+        .on_conflict_do_nothing()
+        .returning(Telemetry.machine_id, Telemetry.ts)
+    )
+
+
+def _insert_rows_individually(db: Session, rows: Sequence[dict[str, Any]]) -> List[Tuple[str, datetime]]:
+    """Fallback for dialects without ON CONFLICT: isolate each row in a savepoint."""
+
+    inserted: List[Tuple[str, datetime]] = []
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Telemetry), [row])
+            inserted.append(_sample_key(row["machine_id"], row["ts"]))
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def _reject_replays(
+    samples: Sequence[IngestSample],
+    outcomes: List[str],
+    check_cache: bool = True,
+) -> List[int]:
+    """Mark LRU hits and keys repeated inside the batch as duplicates.
+
+    Returns the positions of the samples that still need to be written.
+    """
+    seen: set[Tuple[str, datetime]] = set()
+    positions: List[int] = []
+    for index, sample in enumerate(samples):
+        key = _sample_key(sample.machine_id, sample.ts)
+        if check_cache and _recent_keys.contains(key):
+            _count_duplicate(sample.machine_id, "cache")
+            outcomes[index] = OUTCOME_DUPLICATE
+            continue
+        if key in seen:
+            _count_duplicate(sample.machine_id, "database")
+            outcomes[index] = OUTCOME_DUPLICATE
+            continue
+        seen.add(key)
+        positions.append(index)
+    return positions
+
+
+def _record_state_intervals(db: Session, stored: Sequence[IngestSample]) -> None:
+    """Fold stored samples into state_intervals without ever failing the raw insert.
+
+    Savepoint in the ingest transaction: intervals commit with the samples;
+    if the table is missing or the update fails only the savepoint is rolled
+    back and the gap is left to scripts/rollup_backfill.py.
+    """
+    if not stored:
+        return
+    try:
+        with db.begin_nested():
+            state_intervals.record_samples(db, stored)
+    except SQLAlchemyError as exc:
+        logger.warning(
+            "state intervals not updated",
+            extra={"samples": len(stored), "error": str(exc)},
+        )
+
+
+def store_telemetry(
+    db: Session,
+    samples: Sequence[IngestSample],
+    check_cache: bool = True,
+) -> List[str]:
+    """Insert samples into `telemetry` idempotently, in bulk.
+
+    Returns one outcome per sample (`stored` or `duplicate`). Replays are
+    filtered cheapest first: the recent-key LRU, repeated keys inside the same
+    batch, and finally `ON CONFLICT DO NOTHING` in the database, whose RETURNING
+    clause tells which rows were actually inserted.
+    """
+    outcomes: List[str] = [OUTCOME_DUPLICATE] * len(samples)
+    positions = _reject_replays(samples, outcomes, check_cache=check_cache)
+    if not positions:
+        return outcomes
+
+    keys = [_sample_key(samples[i].machine_id, samples[i].ts) for i in positions]
+    rows = [samples[i].telemetry_row() for i in positions]
+    stmt = _conflict_free_insert(db)
+    if stmt is not None:
+        inserted = {_sample_key(machine_id, ts) for machine_id, ts in db.execute(stmt, rows)}
+    else:
+        inserted = set(_insert_rows_individually(db, rows))
+    _record_state_intervals(db, [samples[i] for i, key in zip(positions, keys) if key in inserted])
+    with timed("commit"):
+        db.commit()
+
+    for index, key in zip(positions, keys):
+        if key in inserted:
+            outcomes[index] = OUTCOME_STORED
+        else:
+            _count_duplicate(key[0], "database")
+    _recent_keys.add_many(keys)
+    return outcomes
+
+
+def _flush_with(session_factory: Callable[[], Session]):
+    def flush(samples: List[IngestSample], events: List[dict]) -> None:
+        session = session_factory()
+        try:
+            if samples:
+                # As chaves já entraram no LRU no momento do enfileiramento
+                store_telemetry(session, samples, check_cache=False)
+            if events:
+                event_ids = status_router.insert_events(session, events)
+                with timed("commit"):
+                    session.commit()
+                status_router.mark_events_written(events, event_ids)
+                # Publica só depois do commit: o cliente que recebe o evento já o acha em /events
+                status_router.STATUS_BROKER.publish_events(events)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    return flush
+
+
+def _encode_spool_records(samples: Sequence[IngestSample], events: Sequence[dict]) -> List[bytes]:
+    records = []
+    for sample in samples:
+        row = sample.telemetry_row()
+        row["ts"] = sample.ts.isoformat()
+        row["extra"] = sample.extra
+        records.append(json.dumps({"t": row}, default=str).encode("utf-8"))
+    for event in events:
+        row = dict(event, timestamp_utc=event["timestamp_utc"].isoformat())
+        records.append(json.dumps({"e": row}, default=str).encode("utf-8"))
+    return records
+
+
+def _decode_spool_records(records: Sequence[bytes]) -> Tuple[List[IngestSample], List[dict]]:
+    samples: List[IngestSample] = []
+    events: List[dict] = []
+    for record in records:
+        item = json.loads(record)
+        if "t" in item:
+            row = item["t"]
+            row["ts"] = parse_timestamp(row["ts"])
+            samples.append(IngestSample(**row))
+        else:
+            row = item["e"]
+            row["timestamp_utc"] = parse_timestamp(row["timestamp_utc"])
+            events.append(row)
+    return samples, events
+
+
+def _spool_or_raise(flush: Callable[[List[IngestSample], List[dict]], None]):
+    """Write-behind flush that parks rows in the spool instead of failing."""
+
+    def flush_or_spool(samples: List[IngestSample], events: List[dict]) -> None:
+        try:
+            flush(samples, events)
+        except Exception as exc:
+            if _spool is None or not _spool.append(_encode_spool_records(samples, events)):
+                raise
+            _spool.mark_degraded()
+            logger.warning(
+                "write-behind flush failed, rows spooled to disk",
+                extra={"rows": len(samples) + len(events), "error": str(exc)},
+            )
+
+    return flush_or_spool
+
+
+def _spool_samples(samples: Sequence[IngestSample]) -> List[str]:
+    """Update the status store now and park telemetry + events in the spool."""
+
+    outcomes = [OUTCOME_SPOOLED] * len(samples)
+    positions = _reject_replays(samples, outcomes)
+    fresh = [samples[i] for i in positions]
+    if not fresh:
+        return outcomes
+    events = status_router.apply_status_batch(fresh)
+    if _spool.append(_encode_spool_records(fresh, events)):
+        _recent_keys.add_many(_sample_key(s.machine_id, s.ts) for s in fresh)
+    else:
+        logger.warning("ingest spool full, samples dropped", extra={"samples": len(fresh)})
+        for index in positions:
+            outcomes[index] = OUTCOME_FAILED
+    return outcomes
+
+
+def start_spool(
+    session_factory: Callable[[], Session] = SessionLocal,
+    directory: Optional[str] = None,
+) -> Optional[DiskSpool]:
+    """Open the disk spool (replaying segments left by a previous run) when enabled."""
+
+    global _spool
+    if not INGEST_SPOOL_ENABLED or _spool is not None:
+        return _spool
+    flush = _flush_with(session_factory)
+    _spool = DiskSpool(
+        directory or INGEST_SPOOL_DIR,
+        lambda records: flush(*_decode_spool_records(records)),
+        max_bytes=int(INGEST_SPOOL_MAX_MB * 1024 * 1024),
+        segment_bytes=int(INGEST_SPOOL_SEGMENT_MB * 1024 * 1024),
+        drain_batch=INGEST_SPOOL_DRAIN_BATCH,
+        drain_interval_sec=INGEST_SPOOL_DRAIN_INTERVAL_SEC,
+        fsync=INGEST_SPOOL_FSYNC,
+    )
+    _spool.start()
+    return _spool
+
+
+def stop_spool() -> None:
+    """Stop the drainer (one last drain attempt) and close the active segment."""
+
+    global _spool
+    if _spool is not None:
+        _spool.stop()
+        _spool = None
+
+
+def get_spool_status() -> Dict[str, Any]:
+    if _spool is None:
+        return {"enabled": False}
+    return {"enabled": True, **_spool.metrics()}
+
+
+def start_write_behind(session_factory: Callable[[], Session] = SessionLocal) -> Optional[WriteBehindBuffer]:
+    """Create and start the write-behind buffer when enabled in config."""
+
+    global _write_behind
+    if not WRITE_BEHIND_ENABLED or _write_behind is not None:
+        return _write_behind
+    _write_behind = WriteBehindBuffer(
+        _spool_or_raise(_flush_with(session_factory)),
+        max_rows=WRITE_BEHIND_MAX_ROWS,
+        flush_rows=WRITE_BEHIND_FLUSH_ROWS,
+        flush_interval_sec=WRITE_BEHIND_FLUSH_INTERVAL_SEC,
+    )
+    _write_behind.start()
+    return _write_behind
+
+
+def stop_write_behind() -> None:
+    """Flush pending rows and stop the buffer (called on shutdown)."""
+
+    global _write_behind
+    if _write_behind is not None:
+        _write_behind.stop()
+        _write_behind = None
+
+
+def get_write_behind_status() -> Dict[str, Any]:
+    if _write_behind is None:
+        return {"enabled": False}
+    return {"enabled": True, **_write_behind.metrics()}
+
+
+def ingest_samples(db: Session, samples: Sequence[IngestSample]) -> List[str]:
+    """Persist samples and fan them out to the status store and event history.
+
+    With write-behind enabled the status is updated immediately and both
+    tables are written later by the buffer's group commits. With the disk
+    spool enabled, samples that cannot be written (DB down, or slow / already
+    backlogged) are parked on disk and replayed by the spool drainer.
+    """
+
+    if not samples:
+        return []
+    if _write_behind is not None:
+        outcomes = [OUTCOME_QUEUED] * len(samples)
+        fresh = [samples[i] for i in _reject_replays(samples, outcomes)]
+        _recent_keys.add_many(_sample_key(s.machine_id, s.ts) for s in fresh)
+        if fresh:
+            _write_behind.submit(fresh, status_router.apply_status_batch(fresh))
+        return outcomes
+
+    if _spool is not None and _spool.degraded:
+        # Banco fora ou com backlog no disco: não furar a fila do drainer
+        return _spool_samples(samples)
+
+    started = time.perf_counter()
+    try:
+        outcomes = store_telemetry(db, samples)
+    except Exception as exc:
+        # Mantém o comportamento histórico do /ingest: falha de gravação não bloqueia o status
+        db.rollback()
+        logger.info(
+            "telemetry insert failed",
+            extra={"samples": len(samples), "error": str(exc)},
+        )
+        if _spool is not None:
+            _spool.mark_degraded()
+            return _spool_samples(samples)
+        outcomes = [OUTCOME_FAILED] * len(samples)
+    else:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if _spool is not None and 0 < INGEST_SPOOL_SLOW_COMMIT_MS < elapsed_ms:
+            _spool.mark_degraded()
+
+    # Replays não retrocedem o status nem geram eventos repetidos
+    fresh = [sample for sample, outcome in zip(samples, outcomes) if outcome != OUTCOME_DUPLICATE]
+    if not fresh:
+        return outcomes
+    if len(fresh) == 1:
+        sample = fresh[0]
+        status_router.update_status(
+            machine_id=sample.machine_id,
+            rpm=sample.rpm,
+            feed_mm_min=sample.feed_mm_min,
+            state=sample.state,
+            db=db,
+            extra=sample.extra,
+            snapshot_ts=sample.ts,
+        )
+    else:
+        status_router.update_status_batch(fresh, db=db)
+    return outcomes
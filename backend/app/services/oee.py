@@ -10,14 +10,9 @@ from sqlalchemy.exc import OperationalError, ProgrammingError
 
 import logging
 
-logger = logging.getLogger(__name__)
-
-try:
-    from backend.app.config import TELEMETRY_POLL_INTERVAL_SEC
-except Exception:  # pragma: no cover - config import fallback for scripts
-    TELEMETRY_POLL_INTERVAL_SEC = 1
+from backend.app.services.state_intervals import durations_or_estimate, window_durations
 
-SAMPLE_INTERVAL_SEC = max(float(TELEMETRY_POLL_INTERVAL_SEC or 1), 0.1)
+logger = logging.getLogger(__name__)
 
 
 def get_shift_times(shift: str, date: datetime.date) -> tuple:
@@ -141,7 +136,13 @@ def _calculate_oee_for_window(
     # Calculate metrics
     planned_time_min = (shift_end - shift_start).total_seconds() / 60
 
-    operating_time_min = (running_samples * SAMPLE_INTERVAL_SEC) / 60 if running_samples > 0 else 0
+    # Tempo em cada estado pelos intervalos (não depende do período de amostragem);
+    # janela sem intervalos (histórico sem backfill): amostras running x período de polling
+    durations = durations_or_estimate(
+        window_durations(db, [machine_id], shift_start, shift_end).get(machine_id),
+        {"running": running_samples},
+    )
+    operating_time_min = durations["running"] / 60
 
     # Availability = Operating Time / Planned Time
     availability = operating_time_min / planned_time_min if planned_time_min > 0 else 0
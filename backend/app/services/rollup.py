@@ -0,0 +1,616 @@
+"""Incremental rollups of `telemetry` into telemetry_5m / telemetry_1h / telemetry_1d.
+
+TimescaleDB deployments get these as continuous aggregates (db/aggregates.sql).
+On SQLite and plain PostgreSQL this engine maintains them as ordinary tables:
+
+- each run selects the samples *ingested* since the watermark (ingested_at,
+  not ts), so late samples (spool replay, gateway backlog) are picked up
+  however old their timestamp is;
+- only the 5-minute buckets touched by those samples are recomputed from raw
+  telemetry, then the hours and days containing them from the finer level
+  (sums, counts and min/max are stored, so coarser levels are exact);
+- the watermark is stored in rollup_watermark and advances in the same
+  transaction as the rollup rows. Each run re-reads `overlap_sec` behind it so
+  a sample committed after the previous run with an older ingested_at is not
+  lost; recomputing a bucket twice is harmless.
+
+Buckets are computed in SQL on epoch seconds (strftime on SQLite, EXTRACT on
+PostgreSQL), so only grouped rows reach Python. Samples with a NULL
+ingested_at (rows written by hand) are only covered by `backfill`.
+
+`summarize` answers arbitrary-range summaries from the same tables: whole
+days/hours/5m buckets inside the range plus raw rows for the edges.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    and_,
+    case,
+    cast,
+    delete,
+    extract,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from backend.app.config import ROLLUP_ENGINE, ROLLUP_INTERVAL_SEC, ROLLUP_OVERLAP_SEC
+from backend.app.db import (
+    Base,
+    RollupWatermark,
+    SessionLocal,
+    Telemetry,
+    Telemetry1d,
+    Telemetry1h,
+    Telemetry5m,
+    engine,
+)
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "telemetry"
+STATES = ("running", "stopped", "idle")  # desempate do state_mode nesta ordem
+# (machine_id, início, fim) em epoch s: intervalo de tempo cujos buckets foram reescritos
+ChangeFn = Callable[[str, int, int], None]
+ROLLUP_TABLES = (Telemetry5m.__table__, Telemetry1h.__table__, Telemetry1d.__table__, RollupWatermark.__table__)
+
+
+@dataclass(frozen=True)
+class _Level:
+    name: str
+    model: Any
+    width: int  # segundos
+    time_column: str
+    ratio_column: str
+    source: Any  # Telemetry (amostras) ou o nível anterior
+
+
+LEVEL_5M = _Level("5m", Telemetry5m, 300, "bucket", "uptime_ratio", Telemetry)
+LEVEL_1H = _Level("1h", Telemetry1h, 3600, "bucket", "uptime_ratio", Telemetry5m)
+LEVEL_1D = _Level("1d", Telemetry1d, 86400, "date", "availability", Telemetry1h)
+LEVELS = (LEVEL_5M, LEVEL_1H, LEVEL_1D)
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _epoch_to_dt(epoch: int) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _bucket_expr(dialect: str, column, width: int):
+    """Start of the `width`-second bucket of `column`, as integer epoch seconds."""
+    # Largura como literal: o GROUP BY do PostgreSQL precisa da expressão idêntica à do SELECT
+    size = literal_column(str(int(width)), Integer)
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), Integer) // size * size
+    return cast(func.floor(extract("epoch", column) / size), BigInteger) * size
+
+
+def _aggregates(source) -> List[Any]:
+    if source is Telemetry:
+        return [
+            func.count().label("sample_count"),
+            func.sum(Telemetry.rpm).label("rpm_sum"),
+            func.min(Telemetry.rpm).label("rpm_min"),
+            func.max(Telemetry.rpm).label("rpm_max"),
+            func.sum(Telemetry.feed_mm_min).label("feed_sum"),
+            func.min(Telemetry.feed_mm_min).label("feed_min"),
+            func.max(Telemetry.feed_mm_min).label("feed_max"),
+            *(
+                func.sum(case((Telemetry.state == state, 1), else_=0)).label(f"{state}_count")
+                for state in STATES
+            ),
+        ]
+    return [
+        func.sum(source.sample_count).label("sample_count"),
+        func.sum(source.rpm_sum).label("rpm_sum"),
+        func.min(source.rpm_min).label("rpm_min"),
+        func.max(source.rpm_max).label("rpm_max"),
+        func.sum(source.feed_sum).label("feed_sum"),
+        func.min(source.feed_min).label("feed_min"),
+        func.max(source.feed_max).label("feed_max"),
+        *(func.sum(getattr(source, f"{state}_count")).label(f"{state}_count") for state in STATES),
+    ]
+
+
+def _source_time(source):
+    if source is Telemetry:
+        return Telemetry.ts
+    return source.date if source is Telemetry1d else source.bucket
+
+
+def _rollup_row(level: _Level, machine_id: str, epoch: int, row) -> Dict[str, Any]:
+    count = int(row.sample_count or 0)
+    counts = {state: int(getattr(row, f"{state}_count") or 0) for state in STATES}
+    rpm_sum = float(row.rpm_sum or 0.0)
+    feed_sum = float(row.feed_sum or 0.0)
+    return {
+        level.time_column: _epoch_to_dt(epoch),
+        "machine_id": machine_id,
+        "sample_count": count,
+        "rpm_sum": rpm_sum,
+        "rpm_min": row.rpm_min,
+        "rpm_max": row.rpm_max,
+        "rpm_avg": rpm_sum / count if count else None,
+        "feed_sum": feed_sum,
+        "feed_min": row.feed_min,
+        "feed_max": row.feed_max,
+        "feed_avg": feed_sum / count if count else None,
+        "running_count": counts["running"],
+        "stopped_count": counts["stopped"],
+        "idle_count": counts["idle"],
+        "state_mode": max(STATES, key=lambda state: counts[state]) if count else None,
+        level.ratio_column: counts["running"] / count if count else None,
+    }
+
+
+def _ranges(epochs: Iterable[int], width: int) -> List[Tuple[int, int]]:
+    """Collapse bucket starts into [start, end) runs of consecutive buckets."""
+    runs: List[Tuple[int, int]] = []
+    for epoch in sorted(set(epochs)):
+        if runs and runs[-1][1] == epoch:
+            runs[-1] = (runs[-1][0], epoch + width)
+        else:
+            runs.append((epoch, epoch + width))
+    return runs
+
+
+def _rolled_up(until: Optional[datetime]):
+    """Raw samples a rollup built with watermark `until` contains."""
+    if until is None:
+        return true()
+    return or_(Telemetry.ingested_at <= until, Telemetry.ingested_at.is_(None))
+
+
+def recompute(
+    db: Session,
+    level: _Level,
+    machine_id: str,
+    start: int,
+    end: int,
+    until: Optional[datetime] = None,
+) -> int:
+    """Rebuild the `level` rows of one machine for buckets in [start, end) epoch seconds.
+
+    Delete + insert instead of a dialect-specific upsert; buckets left without
+    source rows disappear. With `until`, only samples ingested up to it are
+    counted, so the rollups hold exactly "everything up to the watermark" and
+    `summarize` can add what came later from raw rows. Returns rows written.
+    """
+    dialect = db.get_bind().dialect.name
+    source_time = _source_time(level.source)
+    bucket = _bucket_expr(dialect, source_time, level.width).label("bucket_epoch")
+    conditions = [
+        level.source.machine_id == machine_id,
+        source_time >= _epoch_to_dt(start),
+        source_time < _epoch_to_dt(end),
+    ]
+    if level.source is Telemetry:
+        conditions.append(_rolled_up(until))
+    query = select(bucket, *_aggregates(level.source)).where(*conditions).group_by(bucket)
+    rows = [_rollup_row(level, machine_id, int(row.bucket_epoch), row) for row in db.execute(query)]
+    target_time = getattr(level.model, level.time_column)
+    db.execute(
+        delete(level.model).where(
+            level.model.machine_id == machine_id,
+            target_time >= _epoch_to_dt(start),
+            target_time < _epoch_to_dt(end),
+        )
+    )
+    if rows:
+        db.execute(insert(level.model), rows)
+    return len(rows)
+
+
+def _cascade(db: Session, touched: Dict[str, Set[int]], until: datetime) -> Dict[str, int]:
+    """Recompute the touched 5m buckets per machine and the hours/days containing them."""
+    written = {level.name: 0 for level in LEVELS}
+    for machine_id, epochs in touched.items():
+        for level in LEVELS:
+            epochs = {epoch - epoch % level.width for epoch in epochs}
+            for start, end in _ranges(epochs, level.width):
+                written[level.name] += recompute(db, level, machine_id, start, end, until)
+    return written
+
+
+def read_watermark(db: Session) -> Optional[datetime]:
+    watermark = db.execute(
+        select(RollupWatermark.watermark).where(RollupWatermark.name == WATERMARK_NAME)
+    ).scalar_one_or_none()
+    return _utc(watermark) if watermark is not None else None
+
+
+def _touched_buckets(db: Session, since: Optional[datetime], until: datetime) -> Dict[str, Set[int]]:
+    dialect = db.get_bind().dialect.name
+    bucket = _bucket_expr(dialect, Telemetry.ts, LEVEL_5M.width).label("bucket_epoch")
+    conditions = [Telemetry.ingested_at <= until]
+    if since is not None:
+        conditions.append(Telemetry.ingested_at > since)
+    query = select(Telemetry.machine_id, bucket).where(and_(*conditions)).distinct()
+    touched: Dict[str, Set[int]] = {}
+    for machine_id, epoch in db.execute(query):
+        touched.setdefault(machine_id, set()).add(int(epoch))
+    return touched
+
+
+def native_aggregates(db: Session) -> bool:
+    """True when telemetry_5m is a view (TimescaleDB continuous aggregate) rather than a table."""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    relkind = db.execute(
+        text(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = 'telemetry_5m' AND n.nspname = current_schema()"
+        )
+    ).scalar()
+    return relkind in ("v", "m")
+
+
+@dataclass
+class Partial:
+    """Mergeable aggregates of raw samples (same fields the rollup tables store)."""
+
+    sample_count: int = 0
+    rpm_sum: float = 0.0
+    rpm_min: Optional[float] = None
+    rpm_max: Optional[float] = None
+    feed_sum: float = 0.0
+    feed_min: Optional[float] = None
+    feed_max: Optional[float] = None
+    running_count: int = 0
+    stopped_count: int = 0
+    idle_count: int = 0
+
+    def add(self, row) -> None:
+        """Merge one row of `_aggregates` (an empty selection has sample_count NULL/0)."""
+        if not row.sample_count:
+            return
+        self.sample_count += int(row.sample_count)
+        self.rpm_sum += float(row.rpm_sum or 0.0)
+        self.feed_sum += float(row.feed_sum or 0.0)
+        for state in STATES:
+            setattr(self, f"{state}_count", getattr(self, f"{state}_count") + int(getattr(row, f"{state}_count") or 0))
+        self.rpm_min = _merge(min, self.rpm_min, row.rpm_min)
+        self.rpm_max = _merge(max, self.rpm_max, row.rpm_max)
+        self.feed_min = _merge(min, self.feed_min, row.feed_min)
+        self.feed_max = _merge(max, self.feed_max, row.feed_max)
+
+
+def _merge(pick, current: Optional[float], value) -> Optional[float]:
+    if value is None:
+        return current
+    return float(value) if current is None else pick(current, float(value))
+
+
+# (início, fim, fim inclusivo?) de um pedaço lido das amostras brutas
+RawPiece = Tuple[datetime, datetime, bool]
+
+
+def plan_range(
+    from_dt: datetime,
+    to_dt: datetime,
+    levels: Sequence[_Level] = (LEVEL_1D, LEVEL_1H, LEVEL_5M),
+) -> Tuple[List[Tuple[_Level, int, int]], List[RawPiece]]:
+    """Cover from_dt <= ts <= to_dt with whole buckets, coarsest first, and raw edges.
+
+    Returns ([(level, start, end)] in epoch seconds, [raw pieces]); a 30-day
+    range becomes ~29 days + a few hours + a few 5m buckets + two short raw edges.
+    """
+    buckets: List[Tuple[_Level, int, int]] = []
+    raw: List[RawPiece] = []
+
+    def cover(lo: datetime, hi: datetime, inclusive: bool, remaining: Sequence[_Level]) -> None:
+        if lo > hi or (lo == hi and not inclusive):
+            return
+        if not remaining:
+            raw.append((lo, hi, inclusive))
+            return
+        level, finer = remaining[0], remaining[1:]
+        first = math.ceil(lo.timestamp() / level.width) * level.width
+        last = math.floor(hi.timestamp() / level.width) * level.width  # fim do último bucket inteiro
+        if last <= first:
+            cover(lo, hi, inclusive, finer)
+            return
+        cover(lo, _epoch_to_dt(first), False, finer)
+        buckets.append((level, first, last))
+        cover(_epoch_to_dt(last), hi, inclusive, finer)
+
+    cover(_utc(from_dt), _utc(to_dt), True, levels)
+    return buckets, raw
+
+
+def _raw_condition(piece: RawPiece):
+    start, end, inclusive = piece
+    return and_(Telemetry.ts >= start, Telemetry.ts <= end if inclusive else Telemetry.ts < end)
+
+
+def summarize(db: Session, machine_id: str, from_dt: datetime, to_dt: datetime) -> Partial:
+    """Aggregates of the samples with from_dt <= ts <= to_dt, equal to a raw scan.
+
+    Whole buckets come from the rollups, which hold every sample ingested up
+    to the watermark; samples ingested after it inside those buckets, and the
+    partial buckets at both edges, come from raw rows. Without a watermark
+    (rollups not maintained here, e.g. TimescaleDB) it is a plain raw scan.
+    """
+    return summarize_many(db, [machine_id], from_dt, to_dt).get(machine_id, Partial())
+
+
+def summarize_many(
+    db: Session,
+    machine_ids: Optional[Sequence[str]],
+    from_dt: datetime,
+    to_dt: datetime,
+) -> Dict[str, Partial]:
+    """`summarize` for several machines (None = all) with one GROUP BY query per source.
+
+    Machines without samples in the range are absent from the result.
+    """
+    try:
+        watermark = read_watermark(db)
+    except (OperationalError, ProgrammingError):
+        db.rollback()  # tabela rollup_watermark ausente
+        watermark = None
+
+    if watermark is None:
+        buckets, raw = [], [(_utc(from_dt), _utc(to_dt), True)]
+    else:
+        buckets, raw = plan_range(from_dt, to_dt)
+
+    totals: Dict[str, Partial] = {}
+
+    def merge(query) -> None:
+        for row in db.execute(query):
+            totals.setdefault(row.machine_id, Partial()).add(row)
+
+    for level in LEVELS:
+        spans = [(start, end) for piece_level, start, end in buckets if piece_level is level]
+        if not spans:
+            continue
+        bucket_time = getattr(level.model, level.time_column)
+        merge(
+            select(level.model.machine_id, *_aggregates(level.model))
+            .where(
+                level.model.machine_id.in_(machine_ids) if machine_ids is not None else true(),
+                or_(*(and_(bucket_time >= _epoch_to_dt(start), bucket_time < _epoch_to_dt(end)) for start, end in spans)),
+            )
+            .group_by(level.model.machine_id)
+        )
+
+    raw_conditions = [_raw_condition(piece) for piece in raw]
+    if buckets:
+        # Chegou depois do watermark: ainda não está nos rollups
+        raw_conditions.append(
+            and_(
+                Telemetry.ingested_at > watermark,
+                or_(*(
+                    and_(Telemetry.ts >= _epoch_to_dt(start), Telemetry.ts < _epoch_to_dt(end))
+                    for _level, start, end in buckets
+                )),
+            )
+        )
+    if raw_conditions:
+        merge(
+            select(Telemetry.machine_id, *_aggregates(Telemetry))
+            .where(
+                Telemetry.machine_id.in_(machine_ids) if machine_ids is not None else true(),
+                or_(*raw_conditions),
+            )
+            .group_by(Telemetry.machine_id)
+        )
+    return totals
+
+
+class RollupEngine:
+    """Keeps the rollup tables up to date from a background thread."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval_sec: float = 30.0,
+        overlap_sec: float = 120.0,
+        on_change: Optional[ChangeFn] = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self._on_change = on_change
+        self._interval = max(0.1, interval_sec)
+        self._overlap = timedelta(seconds=max(0.0, overlap_sec))
+        self._run_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._runs = 0
+        self._errors = 0
+        self._rows_written = 0
+        self._last_run_ms = 0.0
+        self._watermark: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self._interval * 2))
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._interval):
+            try:
+                self.run_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("rollup run failed", extra={"error": str(exc)})
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Roll up everything ingested since the watermark; returns rows written per level."""
+        until = _utc(now) if now is not None else datetime.now(timezone.utc)
+        started = time.perf_counter()
+        with self._run_lock:
+            db = self._session_factory()
+            try:
+                # FOR UPDATE serializa workers no PostgreSQL (no SQLite o lock é do banco todo)
+                state = db.execute(
+                    select(RollupWatermark).where(RollupWatermark.name == WATERMARK_NAME).with_for_update()
+                ).scalar_one_or_none()
+                since = _utc(state.watermark) - self._overlap if state is not None else None
+                touched = _touched_buckets(db, since, until)
+                written = _cascade(db, touched, until)
+                if state is None:
+                    db.add(RollupWatermark(name=WATERMARK_NAME, watermark=until, updated_at=until))
+                elif until > _utc(state.watermark):
+                    state.watermark = until
+                    state.updated_at = until
+                db.commit()
+            except Exception:
+                db.rollback()
+                self._errors += 1
+                raise
+            finally:
+                db.close()
+        for machine_id, epochs in touched.items():
+            for start, end in _ranges(epochs, LEVEL_5M.width):
+                self._notify(machine_id, start, end)
+        self._runs += 1
+        self._rows_written += sum(written.values())
+        self._last_run_ms = (time.perf_counter() - started) * 1000
+        self._watermark = until
+        return written
+
+    def backfill(
+        self,
+        from_dt: datetime,
+        to_dt: datetime,
+        machine_ids: Optional[Sequence[str]] = None,
+    ) -> Dict[str, int]:
+        """Recompute every bucket of the UTC days overlapping [from_dt, to_dt), one day per commit.
+
+        Independent of the watermark: use it after importing old data or for
+        rows without ingested_at.
+        """
+        day = LEVEL_1D.width
+        first = int(_utc(from_dt).timestamp()) // day * day
+        last = int(_utc(to_dt).timestamp())
+        written = {level.name: 0 for level in LEVELS}
+        with self._run_lock:
+            for start in range(first, max(last, first + 1), day):
+                db = self._session_factory()
+                try:
+                    # Mesmo corte do incremental: o que chegou depois do watermark fica para ele
+                    until = read_watermark(db)
+                    machines = machine_ids
+                    if machines is None:
+                        machines = db.execute(
+                            select(Telemetry.machine_id)
+                            .where(Telemetry.ts >= _epoch_to_dt(start), Telemetry.ts < _epoch_to_dt(start + day))
+                            .distinct()
+                        ).scalars().all()
+                        # Dias que perderam todas as amostras ainda podem ter rollups a apagar
+                        machines = set(machines) | set(
+                            db.execute(
+                                select(Telemetry1d.machine_id).where(Telemetry1d.date == _epoch_to_dt(start))
+                            ).scalars()
+                        )
+                    for machine_id in machines:
+                        for level in LEVELS:
+                            written[level.name] += recompute(db, level, machine_id, start, start + day, until)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                finally:
+                    db.close()
+                for machine_id in machines:
+                    self._notify(machine_id, start, start + day)
+        return written
+
+    def _notify(self, machine_id: str, start: int, end: int) -> None:
+        # Depois do commit: quem recebe (cache do /history) relê dados já visíveis
+        if self._on_change is None:
+            return
+        try:
+            self._on_change(machine_id, start, end)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("rollup change listener failed", extra={"machine_id": machine_id, "error": str(exc)})
+
+    def metrics(self) -> Dict[str, Any]:
+        lag = None
+        if self._watermark is not None:
+            lag = round((datetime.now(timezone.utc) - self._watermark).total_seconds(), 1)
+        return {
+            "runs": self._runs,
+            "errors": self._errors,
+            "rows_written": self._rows_written,
+            "last_run_ms": round(self._last_run_ms, 2),
+            "watermark_lag_sec": lag,
+        }
+
+
+_engine: Optional[RollupEngine] = None
+
+
+def create_rollup_tables(bind=None) -> None:
+    """Create the rollup tables that do not exist yet (no-op for existing views)."""
+    Base.metadata.create_all(bind=bind or engine, tables=list(ROLLUP_TABLES))
+
+
+def start_rollups(
+    session_factory: Callable[[], Session] = SessionLocal,
+    on_change: Optional[ChangeFn] = None,
+) -> Optional[RollupEngine]:
+    """Start the background rollup engine according to ROLLUP_ENGINE."""
+
+    global _engine
+    if ROLLUP_ENGINE == "off" or _engine is not None:
+        return _engine
+    db = session_factory()
+    try:
+        if ROLLUP_ENGINE == "auto" and native_aggregates(db):
+            logger.info("telemetry_5m is a continuous aggregate; built-in rollups disabled")
+            return None
+        create_rollup_tables(db.get_bind())
+    finally:
+        db.close()
+    _engine = RollupEngine(
+        session_factory,
+        interval_sec=ROLLUP_INTERVAL_SEC,
+        overlap_sec=ROLLUP_OVERLAP_SEC,
+        on_change=on_change,
+    )
+    _engine.start()
+    return _engine
+
+
+def stop_rollups() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
+
+
+def get_rollup_status() -> Dict[str, Any]:
+    if _engine is None:
+        return {"enabled": False}
+    return {"enabled": True, **_engine.metrics()}
@@ -0,0 +1,249 @@
+"""Disk-backed append-only spool used while the database is slow or down."""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DrainFn = Callable[[List[bytes]], None]
+
+_RECORD_HEADER = struct.Struct("<II")  # payload length | crc32(payload)
+_SEGMENT_PREFIX = "spool-"
+_SEGMENT_SUFFIX = ".seg"
+
+
+class DiskSpool:
+    """Segmented on-disk queue of opaque records, drained by a background thread.
+
+    Records are appended to the active segment file as ``length | crc32 |
+    payload``; a segment is sealed once it reaches `segment_bytes` (or when the
+    drainer needs it) and a new one is started. The drainer replays sealed
+    segments oldest first, `drain_batch` records per `drain_fn` call, and
+    deletes a segment only after all of its records were accepted, so a crash
+    replays at most one segment (the consumer must be idempotent). A torn
+    tail (crash mid-write) fails its checksum and is skipped and counted.
+
+    Total size is capped at `max_bytes`: appends that would exceed it are
+    rejected and counted, the caller decides what to do with the records.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        drain_fn: DrainFn,
+        max_bytes: int = 512 * 1024 * 1024,
+        segment_bytes: int = 8 * 1024 * 1024,
+        drain_batch: int = 5000,
+        drain_interval_sec: float = 2.0,
+        fsync: bool = True,
+    ) -> None:
+        self._dir = Path(directory)
+        self._drain_fn = drain_fn
+        self._max_bytes = max(1, max_bytes)
+        self._segment_bytes = max(_RECORD_HEADER.size + 1, min(segment_bytes, self._max_bytes))
+        self._drain_batch = max(1, drain_batch)
+        self._drain_interval = max(0.01, drain_interval_sec)
+        self._fsync = fsync
+
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._append_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._active: Optional[Tuple[Path, Any]] = None
+        self._active_bytes = 0
+        existing = self._segments()
+        self._next_segment = self._segment_number(existing[-1]) + 1 if existing else 1
+        self._pending_bytes = sum(path.stat().st_size for path in existing)
+        # Registros já aceitos de um segmento parcialmente drenado (falha no meio)
+        self._drained_offsets: Dict[Path, int] = {}
+        self._degraded_until = 0.0
+
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._records_spooled = 0
+        self._records_drained = 0
+        self._records_rejected = 0
+        self._corrupt_records = 0
+        self._drain_errors = 0
+        self._last_drain_rate = 0.0
+        self._last_drain_at: Optional[float] = None
+
+    # ------------------------------------------------------------------ state
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._pending_bytes
+
+    @property
+    def degraded(self) -> bool:
+        """True while records are waiting on disk or the DB was recently marked unhealthy."""
+        return self._pending_bytes > 0 or time.monotonic() < self._degraded_until
+
+    def mark_degraded(self) -> None:
+        """Route new writes to the spool until the next drain pass succeeds."""
+        self._degraded_until = time.monotonic() + self._drain_interval
+        self._wakeup.set()
+
+    # ---------------------------------------------------------------- writing
+
+    def append(self, records: Sequence[bytes]) -> bool:
+        """Append records durably; returns False (nothing written) when over the size cap."""
+        if not records:
+            return True
+        frames = [_RECORD_HEADER.pack(len(r), zlib.crc32(r)) + r for r in records]
+        size = sum(len(f) for f in frames)
+        with self._append_lock:
+            if self._pending_bytes + size > self._max_bytes:
+                self._records_rejected += len(records)
+                return False
+            for frame in frames:
+                if self._active is None or self._active_bytes + len(frame) > self._segment_bytes:
+                    self._seal_locked()
+                    self._open_locked()
+                _path, handle = self._active
+                handle.write(frame)
+                self._active_bytes += len(frame)
+            _path, handle = self._active
+            handle.flush()
+            if self._fsync:
+                os.fsync(handle.fileno())
+            self._pending_bytes += size
+            self._records_spooled += len(records)
+        self._wakeup.set()
+        return True
+
+    def _open_locked(self) -> None:
+        path = self._dir / f"{_SEGMENT_PREFIX}{self._next_segment:010d}{_SEGMENT_SUFFIX}"
+        self._next_segment += 1
+        self._active = (path, open(path, "ab"))
+        self._active_bytes = 0
+
+    def _seal_locked(self) -> None:
+        if self._active is not None:
+            self._active[1].close()
+            self._active = None
+            self._active_bytes = 0
+
+    # --------------------------------------------------------------- draining
+
+    def _segments(self) -> List[Path]:
+        return sorted(self._dir.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}"))
+
+    @staticmethod
+    def _segment_number(path: Path) -> int:
+        return int(path.name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+
+    @staticmethod
+    def _read_segment(path: Path) -> Tuple[List[bytes], int]:
+        """Valid records of a segment and how many corrupt records ended it (0 or 1)."""
+        data = path.read_bytes()
+        records: List[bytes] = []
+        offset = 0
+        while offset < len(data):
+            if offset + _RECORD_HEADER.size > len(data):
+                return records, 1
+            length, crc = _RECORD_HEADER.unpack_from(data, offset)
+            start = offset + _RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                # Cauda rasgada (queda no meio da escrita): o resto do segmento é descartado
+                logger.warning("spool segment has a corrupt record", extra={"segment": path.name, "offset": offset})
+                return records, 1
+            records.append(payload)
+            offset = start + length
+        return records, 0
+
+    def drain_once(self) -> int:
+        """Replay every pending segment; returns the number of records drained.
+
+        Stops at the first `drain_fn` failure, leaving the rest on disk.
+        """
+        with self._drain_lock:
+            with self._append_lock:
+                self._seal_locked()
+                segments = self._segments()
+            started = time.perf_counter()
+            drained = 0
+            try:
+                for path in segments:
+                    records, corrupt = self._read_segment(path)
+                    done = self._drained_offsets.get(path, 0)
+                    while done < len(records):
+                        chunk = records[done:done + self._drain_batch]
+                        self._drain_fn(chunk)
+                        done += len(chunk)
+                        drained += len(chunk)
+                        self._records_drained += len(chunk)
+                        self._drained_offsets[path] = done
+                    size = path.stat().st_size
+                    path.unlink()
+                    self._drained_offsets.pop(path, None)
+                    self._corrupt_records += corrupt
+                    with self._append_lock:
+                        self._pending_bytes = max(0, self._pending_bytes - size)
+            except Exception as exc:  # noqa: BLE001
+                self._drain_errors += 1
+                self._degraded_until = time.monotonic() + self._drain_interval
+                logger.warning("spool drain failed", extra={"drained": drained, "error": str(exc)})
+            else:
+                self._degraded_until = 0.0
+            finally:
+                if drained:
+                    elapsed = max(time.perf_counter() - started, 1e-9)
+                    self._last_drain_rate = drained / elapsed
+                    self._last_drain_at = time.time()
+            return drained
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-spool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the drainer, try a last drain and close the active segment."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self._drain_interval * 4))
+            self._thread = None
+        if self._pending_bytes:
+            self.drain_once()
+        with self._append_lock:
+            self._seal_locked()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=self._drain_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            if self._pending_bytes:
+                self.drain_once()
+                # Após falha, espera o intervalo inteiro antes de sondar o banco de novo
+                if self._pending_bytes:
+                    self._stopping.wait(self._drain_interval)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending_bytes": self._pending_bytes,
+            "pending_segments": len(self._segments()),
+            "capacity_bytes": self._max_bytes,
+            "degraded": self.degraded,
+            "records_spooled": self._records_spooled,
+            "records_drained": self._records_drained,
+            "records_rejected": self._records_rejected,
+            "corrupt_records": self._corrupt_records,
+            "drain_errors": self._drain_errors,
+            "drain_rate_per_s_last": round(self._last_drain_rate, 1),
+            "last_drain_at": self._last_drain_at,
+        }
@@ -0,0 +1,238 @@
+"""Run-length encoded machine states, maintained at ingest.
+
+Each `state_intervals` row is a run of consecutive samples of one machine in
+the same state, covering [start_ts, end_ts). A sample holds its state until
+the next sample when that one arrives within `max_gap` seconds; after a
+longer gap nothing is known about the machine, so the run ends at its last
+sample and the next sample opens a new run. The open (latest) run of a
+machine therefore ends at its last sample.
+
+Durations per state over any window are the clipped lengths of the few
+intervals overlapping it, independent of the poll rate and of dropped
+samples.
+
+Samples newer than the open run extend it in memory (one read, a handful of
+writes per batch). Older samples (spool replay, gateway backlog) rebuild the
+intervals around them from raw telemetry; `rebuild` does the same for a
+whole range (scripts/rollup_backfill.py).
+
+Windows without intervals (history older than the table, not backfilled)
+fall back to sample counts times the poll interval (`estimated_durations`).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import OperationalError, ProgrammingError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from backend.app.config import STATE_INTERVAL_MAX_GAP_SEC, TELEMETRY_POLL_INTERVAL_SEC
+from backend.app.db import Base, SessionLocal, StateInterval, Telemetry, engine
+
+logger = logging.getLogger(__name__)
+
+STATES = ("running", "stopped", "idle")
+# Estimativa antiga (amostras x período de polling), só para janelas sem intervalos
+SAMPLE_INTERVAL_SEC = max(float(TELEMETRY_POLL_INTERVAL_SEC or 1), 0.1)
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _max_gap(max_gap_sec: Optional[float]) -> timedelta:
+    return timedelta(seconds=STATE_INTERVAL_MAX_GAP_SEC if max_gap_sec is None else max_gap_sec)
+
+
+def build_runs(
+    samples: Iterable[Tuple[datetime, str]],
+    max_gap: timedelta,
+    seed: Optional[dict] = None,
+) -> List[dict]:
+    """Group (ts, state) samples sorted by ts into interval rows, continuing `seed`."""
+    runs: List[dict] = [seed] if seed is not None else []
+    for ts, state in samples:
+        current = runs[-1] if runs else None
+        if current is not None and ts - current["end_ts"] <= max_gap:
+            current["end_ts"] = ts  # a amostra anterior vale até esta
+            if current["state"] == state:
+                current["sample_count"] += 1
+                continue
+        runs.append({"start_ts": ts, "end_ts": ts, "state": state, "sample_count": 1})
+    return runs
+
+
+def _insert_runs(db: Session, machine_id: str, runs: Sequence[dict]) -> None:
+    if runs:
+        db.execute(insert(StateInterval), [dict(run, machine_id=machine_id) for run in runs])
+
+
+def rebuild(
+    db: Session,
+    machine_id: str,
+    from_dt: datetime,
+    to_dt: datetime,
+    max_gap_sec: Optional[float] = None,
+) -> int:
+    """Recompute from raw telemetry the intervals of one machine around [from_dt, to_dt].
+
+    Every interval that a sample in the range could join or split (within
+    `max_gap` of it) is deleted and rebuilt, up to the next untouched
+    interval. Does not commit; returns the number of intervals written.
+    """
+    max_gap = _max_gap(max_gap_sec)
+    from_dt, to_dt = _utc(from_dt), _utc(to_dt)
+    affected = db.execute(
+        select(StateInterval.start_ts, StateInterval.end_ts).where(
+            StateInterval.machine_id == machine_id,
+            StateInterval.end_ts >= from_dt - max_gap,
+            StateInterval.start_ts <= to_dt + max_gap,
+        ).with_for_update()
+    ).all()
+    lo = min([from_dt, *(_utc(start) for start, _end in affected)])
+    successor = db.execute(
+        select(func.min(StateInterval.start_ts)).where(
+            StateInterval.machine_id == machine_id,
+            StateInterval.start_ts > to_dt + max_gap,
+        )
+    ).scalar()
+    successor = _utc(successor) if successor is not None else None
+
+    db.execute(
+        delete(StateInterval).where(
+            StateInterval.machine_id == machine_id,
+            StateInterval.end_ts >= from_dt - max_gap,
+            StateInterval.start_ts <= to_dt + max_gap,
+        )
+    )
+    query = select(Telemetry.ts, Telemetry.state).where(Telemetry.machine_id == machine_id, Telemetry.ts >= lo)
+    if successor is not None:
+        query = query.where(Telemetry.ts < successor)
+    runs = build_runs(((_utc(ts), state) for ts, state in db.execute(query.order_by(Telemetry.ts))), max_gap)
+    if runs and successor is not None and successor - runs[-1]["end_ts"] <= max_gap:
+        runs[-1]["end_ts"] = successor
+    _insert_runs(db, machine_id, runs)
+    return len(runs)
+
+
+def record_samples(db: Session, samples: Iterable, max_gap_sec: Optional[float] = None) -> None:
+    """Fold newly stored samples (anything with machine_id, ts, state) into the intervals.
+
+    Runs in the caller's transaction, so intervals commit with the samples.
+    """
+    max_gap = _max_gap(max_gap_sec)
+    by_machine: Dict[str, List[Tuple[datetime, str]]] = {}
+    for sample in samples:
+        by_machine.setdefault(sample.machine_id, []).append((_utc(sample.ts), sample.state))
+
+    for machine_id, points in by_machine.items():
+        points.sort()
+        # FOR UPDATE: dois workers estendendo o mesmo intervalo aberto (PostgreSQL)
+        open_run = db.execute(
+            select(StateInterval.start_ts, StateInterval.end_ts, StateInterval.state, StateInterval.sample_count)
+            .where(StateInterval.machine_id == machine_id)
+            .order_by(StateInterval.start_ts.desc())
+            .limit(1)
+            .with_for_update()
+        ).one_or_none()
+        if open_run is not None and points[0][0] <= _utc(open_run.end_ts):
+            # Amostras atrasadas: refaz os intervalos em volta a partir das amostras brutas
+            rebuild(db, machine_id, points[0][0], points[-1][0], max_gap.total_seconds())
+            continue
+
+        seed = None
+        if open_run is not None:
+            seed = {
+                "start_ts": _utc(open_run.start_ts),
+                "end_ts": _utc(open_run.end_ts),
+                "state": open_run.state,
+                "sample_count": open_run.sample_count,
+            }
+        runs = build_runs(points, max_gap, seed)
+        if seed is not None:
+            first = runs.pop(0)
+            db.execute(
+                update(StateInterval)
+                .where(StateInterval.machine_id == machine_id, StateInterval.start_ts == first["start_ts"])
+                .values(end_ts=first["end_ts"], sample_count=first["sample_count"])
+            )
+        _insert_runs(db, machine_id, runs)
+
+
+def state_durations(db: Session, machine_id: str, from_dt: datetime, to_dt: datetime) -> Dict[str, float]:
+    """Seconds spent in each state within [from_dt, to_dt)."""
+    return state_durations_many(db, [machine_id], from_dt, to_dt).get(machine_id, dict.fromkeys(STATES, 0.0))
+
+
+def state_durations_many(
+    db: Session,
+    machine_ids: Optional[Sequence[str]],
+    from_dt: datetime,
+    to_dt: datetime,
+) -> Dict[str, Dict[str, float]]:
+    """`state_durations` per machine (None = all machines with intervals in the window)."""
+    from_dt, to_dt = _utc(from_dt), _utc(to_dt)
+    query = select(StateInterval.machine_id, StateInterval.state, StateInterval.start_ts, StateInterval.end_ts).where(
+        StateInterval.end_ts > from_dt,
+        StateInterval.start_ts < to_dt,
+    )
+    if machine_ids is not None:
+        query = query.where(StateInterval.machine_id.in_(machine_ids))
+    durations: Dict[str, Dict[str, float]] = {}
+    for machine_id, state, start, end in db.execute(query):
+        seconds = (min(_utc(end), to_dt) - max(_utc(start), from_dt)).total_seconds()
+        per_state = durations.setdefault(machine_id, dict.fromkeys(STATES, 0.0))
+        if seconds > 0:
+            per_state[state] = per_state.get(state, 0.0) + seconds
+    return durations
+
+
+def window_durations(
+    db: Session,
+    machine_ids: Optional[Sequence[str]],
+    from_dt: datetime,
+    to_dt: datetime,
+) -> Dict[str, Dict[str, float]]:
+    """`state_durations_many`, empty when state_intervals is missing or unreadable."""
+    try:
+        return state_durations_many(db, machine_ids, from_dt, to_dt)
+    except (OperationalError, ProgrammingError) as exc:
+        db.rollback()
+        logger.info("state intervals unavailable, using sample counts", extra={"error": str(exc)})
+        return {}
+
+
+def estimated_durations(counts: Dict[str, int]) -> Dict[str, float]:
+    """Seconds per state from sample counts (`{state: count}`) times the poll interval."""
+    return {state: float(counts.get(state) or 0) * SAMPLE_INTERVAL_SEC for state in STATES}
+
+
+def durations_or_estimate(durations: Optional[Dict[str, float]], counts: Dict[str, int]) -> Dict[str, float]:
+    """Interval durations of a window, or the sample-count estimate when it has none."""
+    if durations and any(durations.values()):
+        return durations
+    return estimated_durations(counts)
+
+
+def create_state_interval_table(bind=None) -> None:
+    """Create `state_intervals` if it does not exist yet (ingest writes to it)."""
+    Base.metadata.create_all(bind=bind or engine, tables=[StateInterval.__table__])
+
+
+def ensure_state_interval_table(session_factory: Callable[[], Session] = SessionLocal) -> bool:
+    """Startup: create the table on databases that predate it; False if that failed."""
+    db = session_factory()
+    try:
+        create_state_interval_table(db.get_bind())
+        return True
+    except SQLAlchemyError as exc:
+        # Sem a tabela o ingest continua gravando as amostras (intervalos via rollup_backfill)
+        logger.warning("state_intervals table not created", extra={"error": str(exc)})
+        return False
+    finally:
+        db.close()
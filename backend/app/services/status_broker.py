@@ -0,0 +1,222 @@
+"""Push channel for machine status changes and new events (SSE / WebSocket)."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from backend.app.services.status_store import StatusStore
+
+logger = logging.getLogger(__name__)
+
+_RESYNC = object()
+
+
+def _jsonable_event(row: dict) -> Dict[str, Any]:
+    return {
+        key: (value.isoformat().replace("+00:00", "Z") if isinstance(value, datetime) else value)
+        for key, value in row.items()
+    }
+
+
+class Subscriber:
+    """One push client: a machine filter and a bounded message queue.
+
+    When the client falls `queue_size` messages behind, its queue is emptied
+    and replaced by a single resync marker; the next message it reads is a
+    fresh snapshot of its machines, so a slow dashboard costs bounded memory
+    and converges to the current state instead of replaying every change.
+    """
+
+    def __init__(self, broker: "StatusBroker", machine_ids: Optional[Iterable[str]], queue_size: int) -> None:
+        self._broker = broker
+        self.machine_ids: Optional[Set[str]] = set(machine_ids) if machine_ids is not None else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.resyncs = 0
+        self._resync_pending = False
+
+    def wants(self, machine_id: str) -> bool:
+        return self.machine_ids is None or machine_id in self.machine_ids
+
+    def offer(self, message: Any) -> None:
+        if self._resync_pending:
+            return  # o snapshot de resync já vai refletir esta mudança
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+            self._resync_pending = True
+            self.resyncs += 1
+
+    def subscribe(self, machine_ids: Iterable[str]) -> None:
+        added = [m for m in machine_ids if self.machine_ids is not None and m not in self.machine_ids]
+        if self.machine_ids is not None:
+            self.machine_ids.update(added)
+        if added:
+            self.offer(self._broker.snapshot(added))
+
+    def unsubscribe(self, machine_ids: Iterable[str]) -> None:
+        if self.machine_ids is not None:
+            self.machine_ids.difference_update(machine_ids)
+
+    async def next(self) -> Dict[str, Any]:
+        message = await self.queue.get()
+        if message is _RESYNC:
+            self._resync_pending = False
+            return self._broker.snapshot(self.machine_ids, resync=True)
+        return message
+
+
+class StatusBroker:
+    """Fans status diffs and event rows out to subscribers on the event loop.
+
+    Status changes are detected from the shared StatusStore's version, so
+    writes made by any worker process reach this worker's subscribers;
+    `notify()` (called by update_status) only wakes the poll early. Event rows
+    are pushed by `publish_events()` from the process that ingested them.
+    Both are thread-safe: ingest runs on the DB executor threads.
+    """
+
+    def __init__(
+        self,
+        store: StatusStore,
+        interval_sec: float = 0.25,
+        queue_size: int = 256,
+    ) -> None:
+        self._store = store
+        self._interval = max(0.01, interval_sec)
+        self._queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._last_bytes: Dict[str, bytes] = {}
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._version: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._messages_sent = 0
+
+    # ------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        """Start the poll task on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        self._loop = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def reset(self) -> None:
+        self._last_bytes.clear()
+        self._last.clear()
+        self._version = None
+
+    # -------------------------------------------------- producers (any thread)
+
+    def notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and self._subscribers:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:  # loop encerrado
+                pass
+
+    def publish_events(self, rows: List[dict]) -> None:
+        loop = self._loop
+        if loop is not None and rows and self._subscribers:
+            try:
+                loop.call_soon_threadsafe(self._fanout_events, rows)
+            except RuntimeError:
+                pass
+
+    # ------------------------------------------------------- loop-side work
+
+    def subscribe(self, machine_ids: Optional[Iterable[str]] = None) -> Subscriber:
+        """Register a client; its first message is a snapshot of its machines."""
+        subscriber = Subscriber(self, machine_ids, self._queue_size)
+        self.poll()
+        subscriber.offer(self.snapshot(subscriber.machine_ids))
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def snapshot(self, machine_ids: Optional[Iterable[str]], resync: bool = False) -> Dict[str, Any]:
+        ids = sorted(self._last) if machine_ids is None else [m for m in machine_ids if m in self._last]
+        message: Dict[str, Any] = {"type": "snapshot", "machines": [self._last[m] for m in ids]}
+        if resync:
+            message["resync"] = True
+        return message
+
+    def poll(self) -> int:
+        """Diff the store against the last published view; returns machines changed."""
+        version = self._store.version
+        if version == self._version:
+            return 0
+        self._version = version
+        changed = 0
+        for machine_id, raw in self._store.snapshot_bytes().items():
+            if self._last_bytes.get(machine_id) == raw:
+                continue
+            current = json.loads(raw)
+            previous = self._last.get(machine_id)
+            self._last_bytes[machine_id] = raw
+            self._last[machine_id] = current
+            changed += 1
+            if previous is None:
+                message = {"type": "status", "machine_id": machine_id, "changed": current, "full": True}
+            else:
+                diff = {key: value for key, value in current.items() if previous.get(key) != value}
+                message = {"type": "status", "machine_id": machine_id, "changed": diff}
+            self._fanout(machine_id, message)
+        return changed
+
+    def _fanout(self, machine_id: str, message: Dict[str, Any]) -> None:
+        for subscriber in self._subscribers:
+            if subscriber.wants(machine_id):
+                subscriber.offer(message)
+                self._messages_sent += 1
+
+    def _fanout_events(self, rows: List[dict]) -> None:
+        for row in rows:
+            self._fanout(row["machine_id"], {
+                "type": "event",
+                "machine_id": row["machine_id"],
+                "event": _jsonable_event(row),
+            })
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._subscribers:
+                continue
+            try:
+                self.poll()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("status push poll failed", extra={"error": str(exc)})
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "messages_sent": self._messages_sent,
+            "resyncs": sum(s.resyncs for s in self._subscribers),
+            "tracked_machines": len(self._last),
+        }
@@ -0,0 +1,417 @@
+"""Status store shared by every API worker process.
+
+`LAST_STATUS` used to be a per-process dict, so with several uvicorn workers
+each process answered `/status` from its own view. The stores here keep the
+latest status of each machine as serialized bytes behind a MutableMapping
+interface:
+
+- ``MemoryStatusStore``: per-process, for single-worker runs and tests.
+- ``MmapStatusStore``: fixed-slot table in a memory-mapped file (``/dev/shm``
+  when available, otherwise a regular file in the temp dir) that all workers
+  map. Writers serialize on an in-process lock plus an OS file lock; readers
+  take no lock and use a per-slot seqlock (version counter, odd while a write
+  is in progress) to detect and retry torn reads.
+
+Both expose a global version and per-key versions that change on each write,
+plus an `epoch` that changes whenever versions could repeat (new process or
+file, clear, delete), so `(epoch, key_version)` can be used as an ETag.
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+try:  # Windows
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+Encode = Callable[[Any], bytes]
+Decode = Callable[[bytes], Any]
+
+_MAGIC = b"CNST"
+_LAYOUT_VERSION = 2
+_FILE_HEADER = struct.Struct("<4sIIIQ")  # magic | layout | n_slots | slot_size | global version
+_EPOCH = struct.Struct("<I")  # logo após o header
+_FILE_HEADER_SIZE = 64
+_SLOT_HEADER = struct.Struct("<QHI2x")  # seq | key_len | value_len
+_KEY_SIZE = 64
+_EMPTY = 0
+_TOMBSTONE = 0xFFFF
+_READ_RETRIES = 1000
+
+
+def default_store_path(name: str = "cnc-telemetry-status.bin") -> Path:
+    shm = Path("/dev/shm")
+    base = shm if shm.is_dir() and os.access(shm, os.W_OK) else Path(tempfile.gettempdir())
+    return base / name
+
+
+def _new_epoch() -> int:
+    return struct.unpack("<I", os.urandom(4))[0]
+
+
+class StatusStore(MutableMapping):
+    """Mapping of machine_id -> status, stored as bytes via `encode`/`decode`."""
+
+    def __init__(self, encode: Encode, decode: Decode) -> None:
+        self._encode = encode
+        self._decode = decode
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set_bytes(self, key: str, value: bytes) -> Tuple[int, int]:
+        """Store `value`; returns (previous key version, new key version), read atomically with the write."""
+        raise NotImplementedError
+
+    def key_version(self, key: str) -> int:
+        """Version of `key` (0 when absent); changes on every write of that key."""
+        raise NotImplementedError
+
+    @property
+    def version(self) -> int:
+        """Global version, incremented on every write to the store."""
+        raise NotImplementedError
+
+    @property
+    def epoch(self) -> int:
+        """Changes when key versions may restart or repeat (ETags must not match across it)."""
+        raise NotImplementedError
+
+    def snapshot_bytes(self, keys: Optional[Iterable[str]] = None) -> Dict[str, bytes]:
+        """Serialized values of `keys` (all keys when None); absent keys are skipped."""
+        result: Dict[str, bytes] = {}
+        for key in (self if keys is None else keys):
+            raw = self.get_bytes(key)
+            if raw is not None:
+                result[key] = raw
+        return result
+
+    def __getitem__(self, key: str) -> Any:
+        raw = self.get_bytes(key)
+        if raw is None:
+            raise KeyError(key)
+        return self._decode(raw)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set_bytes(key, self._encode(value))
+
+
+class MemoryStatusStore(StatusStore):
+    def __init__(self, encode: Encode, decode: Decode) -> None:
+        super().__init__(encode, decode)
+        self._items: Dict[str, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._epoch = _new_epoch()
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        item = self._items.get(key)
+        return item[1] if item is not None else None
+
+    def set_bytes(self, key: str, value: bytes) -> Tuple[int, int]:
+        with self._lock:
+            previous = self._items.get(key, (0, b""))[0]
+            self._version += 1
+            self._items[key] = (self._version, value)
+            return previous, self._version
+
+    def key_version(self, key: str) -> int:
+        item = self._items.get(key)
+        return item[0] if item is not None else 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            del self._items[key]
+            self._version += 1
+
+    def snapshot_bytes(self, keys: Optional[Iterable[str]] = None) -> Dict[str, bytes]:
+        if keys is None:
+            return {key: value for key, (_version, value) in list(self._items.items())}
+        return super().snapshot_bytes(keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._version += 1
+
+
+class _FileLock:
+    """Exclusive cross-process lock on the first byte of an open file."""
+
+    def __init__(self, fd: int) -> None:
+        self._fd = fd
+
+    def __enter__(self) -> "_FileLock":
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        elif msvcrt is not None:  # pragma: no cover - Windows
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        elif msvcrt is not None:  # pragma: no cover - Windows
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+
+class MmapStatusStore(StatusStore):
+    """Open-addressing hash table of fixed-size slots in a shared mmap."""
+
+    def __init__(
+        self,
+        encode: Encode,
+        decode: Decode,
+        path: Optional[Path] = None,
+        slots: int = 4096,
+        slot_size: int = 1024,
+    ) -> None:
+        super().__init__(encode, decode)
+        if slot_size <= _SLOT_HEADER.size + _KEY_SIZE:
+            raise ValueError(f"slot_size must be larger than {_SLOT_HEADER.size + _KEY_SIZE} bytes")
+        self.path = Path(path) if path is not None else default_store_path()
+        self._slots = max(1, slots)
+        self._slot_size = slot_size
+        self._value_size = slot_size - _SLOT_HEADER.size - _KEY_SIZE
+        self._size = _FILE_HEADER_SIZE + self._slots * self._slot_size
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with _FileLock(self._fd):
+            self._init_file_locked()
+        self._map = mmap.mmap(self._fd, self._size)
+
+    def _init_file_locked(self) -> None:
+        expected = _FILE_HEADER.pack(_MAGIC, _LAYOUT_VERSION, self._slots, self._slot_size, 0)[:16]
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        current = os.read(self._fd, 16)
+        if os.fstat(self._fd).st_size == self._size and current == expected:
+            return
+        # Arquivo novo ou de outro layout: recria zerado
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, self._size)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, _FILE_HEADER.pack(_MAGIC, _LAYOUT_VERSION, self._slots, self._slot_size, 0))
+        os.write(self._fd, _EPOCH.pack(_new_epoch()))
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    # ---------------------------------------------------------------- layout
+
+    def _offset(self, slot: int) -> int:
+        return _FILE_HEADER_SIZE + slot * self._slot_size
+
+    def _probe(self, key: bytes) -> Iterator[int]:
+        start = zlib.crc32(key) % self._slots
+        for step in range(self._slots):
+            yield (start + step) % self._slots
+
+    @staticmethod
+    def _encode_key(key: str) -> bytes:
+        raw = key.encode("utf-8")
+        if not raw or len(raw) > _KEY_SIZE:
+            raise ValueError(f"status store key must be 1..{_KEY_SIZE} bytes: {key!r}")
+        return raw
+
+    def _read_slot(
+        self,
+        slot: int,
+        want_key: Optional[bytes] = None,
+        any_value: bool = False,
+    ) -> Tuple[int, int, bytes, Optional[bytes]]:
+        """Consistent (seq, key_len, key, value) snapshot of a slot (seqlock read).
+
+        The value is only copied when the slot holds `want_key` (or any key
+        with `any_value`).
+        """
+        base = self._offset(slot)
+        view = self._map
+        for _ in range(_READ_RETRIES):
+            seq, key_len, value_len = _SLOT_HEADER.unpack_from(view, base)
+            if seq & 1:
+                continue
+            key = b""
+            value = None
+            if key_len not in (_EMPTY, _TOMBSTONE):
+                key_start = base + _SLOT_HEADER.size
+                key = view[key_start:key_start + key_len]
+                wanted = any_value or (want_key is not None and key == want_key)
+                if wanted and value_len <= self._value_size:
+                    value_start = key_start + _KEY_SIZE
+                    value = view[value_start:value_start + value_len]
+            if struct.unpack_from("<Q", view, base)[0] == seq:
+                return seq, key_len, key, value
+        raise RuntimeError("status store slot kept changing during read")
+
+    def _find(self, key: bytes) -> Tuple[Optional[int], int, Optional[bytes]]:
+        """(slot, seq, value) of `key`, or (None, 0, None) when absent."""
+        for slot in self._probe(key):
+            seq, key_len, stored_key, value = self._read_slot(slot, key)
+            if key_len == _EMPTY:
+                break
+            if key_len != _TOMBSTONE and stored_key == key:
+                return slot, seq, value
+        return None, 0, None
+
+    def _write_slot_locked(self, slot: int, key_len: int, key: bytes, value: bytes) -> None:
+        base = self._offset(slot)
+        seq = struct.unpack_from("<Q", self._map, base)[0]
+        struct.pack_into("<Q", self._map, base, seq + 1)  # ímpar: escrita em andamento
+        key_start = base + _SLOT_HEADER.size
+        self._map[key_start:key_start + len(key)] = key
+        value_start = key_start + _KEY_SIZE
+        self._map[value_start:value_start + len(value)] = value
+        _SLOT_HEADER.pack_into(self._map, base, seq + 1, key_len, len(value))
+        struct.pack_into("<Q", self._map, base, seq + 2)
+        version_at = _FILE_HEADER.size - 8
+        struct.pack_into("<Q", self._map, version_at, struct.unpack_from("<Q", self._map, version_at)[0] + 1)
+
+    # ------------------------------------------------------------- interface
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            raw_key = self._encode_key(key)
+        except ValueError:
+            return None  # chave que nunca caberia num slot: certamente ausente
+        _slot, _seq, value = self._find(raw_key)
+        return value
+
+    def set_bytes(self, key: str, value: bytes) -> Tuple[int, int]:
+        raw_key = self._encode_key(key)
+        if len(value) > self._value_size:
+            raise ValueError(f"status for {key!r} is {len(value)} bytes (slot holds {self._value_size})")
+        with self._lock, _FileLock(self._fd):
+            target = None
+            previous = 0
+            for slot in self._probe(raw_key):
+                seq, key_len, stored_key, _value = self._read_slot(slot)
+                if key_len == _EMPTY:
+                    target = slot if target is None else target
+                    break
+                if key_len == _TOMBSTONE:
+                    target = slot if target is None else target
+                elif stored_key == raw_key:
+                    target = slot
+                    previous = seq
+                    break
+            if target is None:
+                raise ValueError(f"status store is full ({self._slots} slots)")
+            self._write_slot_locked(target, len(raw_key), raw_key, value)
+            return previous, struct.unpack_from("<Q", self._map, self._offset(target))[0]
+
+    def key_version(self, key: str) -> int:
+        try:
+            raw_key = self._encode_key(key)
+        except ValueError:
+            return 0
+        _slot, seq, _value = self._find(raw_key)
+        return seq
+
+    @property
+    def version(self) -> int:
+        return struct.unpack_from("<Q", self._map, _FILE_HEADER.size - 8)[0]
+
+    @property
+    def epoch(self) -> int:
+        return _EPOCH.unpack_from(self._map, _FILE_HEADER.size)[0]
+
+    def _rotate_epoch_locked(self) -> None:
+        # A chave pode voltar num slot de seq menor: versões antigas deixam de valer
+        _EPOCH.pack_into(self._map, _FILE_HEADER.size, _new_epoch())
+
+    def __delitem__(self, key: str) -> None:
+        raw_key = self._encode_key(key)
+        with self._lock, _FileLock(self._fd):
+            slot, _seq, _value = self._find(raw_key)
+            if slot is None:
+                raise KeyError(key)
+            self._write_slot_locked(slot, _TOMBSTONE, b"", b"")
+            self._rotate_epoch_locked()
+
+    def __iter__(self) -> Iterator[str]:
+        keys = []
+        for slot in range(self._slots):
+            _seq, key_len, key, _value = self._read_slot(slot)
+            if key_len not in (_EMPTY, _TOMBSTONE):
+                keys.append(key.decode("utf-8"))
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def snapshot_bytes(self, keys: Optional[Iterable[str]] = None) -> Dict[str, bytes]:
+        if keys is not None:
+            return super().snapshot_bytes(keys)
+        # Uma única varredura dos slots, copiando chave e valor juntos
+        result: Dict[str, bytes] = {}
+        for slot in range(self._slots):
+            _seq, key_len, key, value = self._read_slot(slot, any_value=True)
+            if key_len not in (_EMPTY, _TOMBSTONE) and value is not None:
+                result[key.decode("utf-8")] = value
+        return result
+
+    def clear(self) -> None:
+        with self._lock, _FileLock(self._fd):
+            for slot in range(self._slots):
+                _seq, key_len, _key, _value = self._read_slot(slot)
+                if key_len != _EMPTY:
+                    self._write_slot_locked(slot, _EMPTY, b"", b"")
+            self._rotate_epoch_locked()
+
+
+def create_status_store(
+    backend: str,
+    encode: Encode,
+    decode: Decode,
+    path: Optional[str] = None,
+    slots: int = 4096,
+    slot_size: int = 1024,
+) -> StatusStore:
+    """Build the configured store; falls back to memory if the mmap file cannot be opened."""
+    if backend == "memory":
+        return MemoryStatusStore(encode, decode)
+    if backend != "mmap":
+        raise ValueError(f"Invalid status store backend: {backend}. Must be one of: memory, mmap")
+    try:
+        return MmapStatusStore(encode, decode, Path(path) if path else None, slots, slot_size)
+    except OSError:
+        logger.warning(
+            "shared status store unavailable, using per-process memory store",
+            exc_info=True,
+        )
+        return MemoryStatusStore(encode, decode)
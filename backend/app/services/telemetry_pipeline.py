@@ -2,11 +2,10 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime
 from typing import Any, Optional
 
-from backend.app.db import SessionLocal, Telemetry
-from backend.app.routers import status as status_router
+from backend.app.db import SessionLocal
+from backend.app.services.ingest import IngestSample, ingest_samples, parse_timestamp
 from backend.app.services.m80_adapter import M80Adapter
 
 logger = logging.getLogger(__name__)
@@ -29,34 +28,19 @@ def process_m80_snapshot() -> None:
     ingest: dict[str, Any] = payload["ingest"]
     extra: dict[str, Any] = payload.get("extra", {})
 
-    timestamp = datetime.fromisoformat(ingest["timestamp"].replace("Z", "+00:00"))
+    sample = IngestSample(
+        machine_id=ingest["machine_id"],
+        ts=parse_timestamp(ingest["timestamp"]),
+        rpm=ingest["rpm"],
+        feed_mm_min=ingest["feed_mm_min"],
+        state=ingest["state"],
+        sequence=None,
+        src="m80-adapter",
+        extra=extra,
+    )
 
     session = SessionLocal()
     try:
-        telemetry_row = Telemetry(
-            ts=timestamp,
-            machine_id=ingest["machine_id"],
-            rpm=ingest["rpm"],
-            feed_mm_min=ingest["feed_mm_min"],
-            state=ingest["state"],
-            sequence=None,
-            src="m80-adapter",
-        )
-        session.add(telemetry_row)
-        try:
-            session.commit()
-        except Exception as exc:
-            session.rollback()
-            logger.info("telemetry insert skipped", extra={"error": str(exc)})
-
-        status_router.update_status(
-            machine_id=ingest["machine_id"],
-            rpm=ingest["rpm"],
-            feed_mm_min=ingest["feed_mm_min"],
-            state=ingest["state"],
-            db=session,
-            extra=extra,
-            snapshot_ts=timestamp,
-        )
+        ingest_samples(session, [sample])
     finally:
         session.close()
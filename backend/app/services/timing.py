@@ -0,0 +1,190 @@
+"""Per-request phase timers (Server-Timing) and latency histograms for /metrics.
+
+The HTTP middleware opens a `RequestTimer` in a context variable; code on the
+request path adds phase durations with `timed(phase)` / `record(phase, s)`.
+Because `run_db` copies the context into the DB thread, phases measured there
+land on the same request. Work outside any request (write-behind flushes,
+spool drains) is recorded under route="background".
+
+Phases:
+- ``validation``: body decode + payload validation;
+- ``db_acquire``: wait for a DB executor slot (the executor is sized below
+  the engine pool, so this is where DB contention queues up);
+- ``sql``: time inside cursor.execute (SQLAlchemy engine events);
+- ``commit``: explicit session commits;
+- ``status``: status store write + event compression;
+- ``serialize``: building response bodies the routes serialize themselves.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PHASES = ("validation", "db_acquire", "sql", "commit", "status", "serialize")
+
+# Limites superiores (s) dos buckets, no formato de histograma do Prometheus
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+
+class LatencyHistograms:
+    """Thread-safe set of cumulative-bucket histograms keyed by (name, labels)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, Labels], _Histogram] = {}
+
+    def observe(self, name: str, labels: Labels, seconds: float) -> None:
+        with self._lock:
+            histogram = self._series.get((name, labels))
+            if histogram is None:
+                histogram = self._series[(name, labels)] = _Histogram(len(self._buckets))
+            for index, bound in enumerate(self._buckets):
+                if seconds <= bound:
+                    histogram.counts[index] += 1
+                    break
+            histogram.total += seconds
+            histogram.count += 1
+
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines (TYPE + buckets, _sum, _count)."""
+        with self._lock:
+            series = sorted(
+                ((name, labels, list(h.counts), h.total, h.count) for (name, labels), h in self._series.items()),
+                key=lambda item: (item[0], item[1]),
+            )
+        lines: List[str] = []
+        declared = set()
+        for name, labels, counts, total, count in series:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels
+    )
+    return "{" + body + "}"
+
+
+class RequestTimer:
+    __slots__ = ("started", "phases")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in self.phases.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+HISTOGRAMS = LatencyHistograms()
+_current: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def begin_request() -> Tuple[RequestTimer, Token]:
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def end_request(timer: RequestTimer, token: Token, method: str, route: str, status_code: int) -> str:
+    """Close the request: feed the histograms and return the Server-Timing value."""
+    _current.reset(token)
+    total = time.perf_counter() - timer.started
+    HISTOGRAMS.observe(
+        "cnc_http_request_duration_seconds",
+        (("method", method), ("route", route), ("status", str(status_code))),
+        total,
+    )
+    for phase, seconds in timer.phases.items():
+        HISTOGRAMS.observe("cnc_http_phase_duration_seconds", (("phase", phase), ("route", route)), seconds)
+    return timer.server_timing(total)
+
+
+def record(phase: str, seconds: float) -> None:
+    timer = _current.get()
+    if timer is not None:
+        timer.add(phase, seconds)
+    else:
+        HISTOGRAMS.observe("cnc_http_phase_duration_seconds", (("phase", phase), ("route", "background")), seconds)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started)
+
+
+def mark_validation() -> None:
+    """Record the time between request start and handler entry as `validation`.
+
+    For routes whose body FastAPI/pydantic validates before calling the handler.
+    """
+    timer = _current.get()
+    if timer is not None:
+        timer.add("validation", time.perf_counter() - timer.started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("timing_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("timing_query_start")
+    if starts:
+        record("sql", time.perf_counter() - starts.pop())
+
+
+def _handle_error(context) -> None:
+    # Statement que falhou não passa por after_cursor_execute
+    starts = context.connection.info.get("timing_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_sqlalchemy() -> None:
+    """Time every cursor execute of every engine (idempotent)."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
@@ -0,0 +1,150 @@
+"""Write-behind buffer that groups telemetry/event rows into few commits."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+FlushFn = Callable[[List[Any], List[dict]], None]
+
+
+class WriteBehindBuffer:
+    """Bounded in-process queue flushed by a background thread.
+
+    Rows are flushed when `flush_rows` rows are pending or `flush_interval_sec`
+    elapsed since the last flush, whichever comes first. The queue never holds
+    more than `max_rows` rows: a producer that would exceed the bound flushes
+    synchronously first (caller-runs), so memory stays bounded without dropping
+    data while the database keeps up. Rows of a failed flush are requeued while
+    there is room and counted as dropped otherwise.
+    """
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        max_rows: int = 10000,
+        flush_rows: int = 500,
+        flush_interval_sec: float = 0.5,
+    ) -> None:
+        self._flush_fn = flush_fn
+        self._max_rows = max(1, max_rows)
+        self._flush_rows = max(1, min(flush_rows, self._max_rows))
+        self._flush_interval = max(0.01, flush_interval_sec)
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._samples: List[Any] = []
+        self._events: List[dict] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._flushes = 0
+        self._flush_errors = 0
+        self._rows_flushed = 0
+        self._rows_dropped = 0
+        self._max_depth = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._samples) + len(self._events)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher thread and flush whatever is still pending."""
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self._flush_interval * 4))
+            self._thread = None
+        self.flush()
+
+    def submit(self, samples: Sequence[Any], events: Sequence[dict]) -> None:
+        incoming = len(samples) + len(events)
+        if self.depth + incoming > self._max_rows:
+            self.flush()
+        with self._cond:
+            self._samples.extend(samples)
+            self._events.extend(events)
+            depth = self.depth
+            self._max_depth = max(self._max_depth, depth)
+            if depth >= self._flush_rows:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Flush pending rows in one group commit; returns the number of rows written."""
+        with self._flush_lock:
+            with self._cond:
+                samples, events = self._samples, self._events
+                self._samples, self._events = [], []
+            rows = len(samples) + len(events)
+            if rows == 0:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self._flush_fn(samples, events)
+            except Exception as exc:  # noqa: BLE001
+                self._flush_errors += 1
+                self._requeue(samples, events)
+                logger.warning(
+                    "write-behind flush failed",
+                    extra={"rows": rows, "error": str(exc)},
+                )
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._flushes += 1
+            self._rows_flushed += rows
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return rows
+
+    def _requeue(self, samples: List[Any], events: List[dict]) -> None:
+        with self._cond:
+            room = self._max_rows - self.depth
+            keep_samples = samples[:max(0, room)]
+            room -= len(keep_samples)
+            keep_events = events[:max(0, room)]
+            self._samples[:0] = keep_samples
+            self._events[:0] = keep_events
+            self._rows_dropped += len(samples) - len(keep_samples) + len(events) - len(keep_events)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self.depth >= self._flush_rows or self._stopping.is_set(),
+                    timeout=self._flush_interval,
+                )
+            if self._stopping.is_set():
+                break
+            self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        avg_ms = self._total_flush_ms / self._flushes if self._flushes else 0.0
+        return {
+            "queue_depth": self.depth,
+            "queue_max_depth": self._max_depth,
+            "queue_capacity": self._max_rows,
+            "flushes": self._flushes,
+            "flush_errors": self._flush_errors,
+            "rows_flushed": self._rows_flushed,
+            "rows_dropped": self._rows_dropped,
+            "flush_latency_ms_last": round(self._last_flush_ms, 3),
+            "flush_latency_ms_avg": round(avg_ms, 3),
+            "flush_latency_ms_max": round(self._max_flush_ms, 3),
+        }
@@ -0,0 +1,10 @@
+-- Índice composto para a paginação por cursor de /v1/machines/{id}/events
+-- (WHERE machine_id = ? AND (timestamp_utc, id) < (?, ?) ORDER BY timestamp_utc DESC, id DESC).
+-- Bancos criados antes dele só têm os índices simples em machine_id e timestamp_utc.
+-- PostgreSQL: prefira CREATE INDEX CONCURRENTLY para não bloquear a ingestão.
+
+CREATE INDEX IF NOT EXISTS ix_telemetry_events_machine_ts_id
+    ON telemetry_events (machine_id, timestamp_utc DESC, id DESC);
+
+-- Coberto pelo prefixo do índice acima
+DROP INDEX IF EXISTS ix_telemetry_events_machine_id;
@@ -0,0 +1,9 @@
+-- Índice usado pelo motor de rollups embutido (app/services/rollup.py), que a cada
+-- rodada lê as amostras com ingested_at posterior ao watermark.
+-- As tabelas telemetry_5m/1h/1d e rollup_watermark são criadas pela API no startup
+-- (ROLLUP_ENGINE=auto|on); no TimescaleDB continuam sendo os continuous aggregates
+-- de aggregates.sql e este índice não é necessário.
+-- PostgreSQL: prefira CREATE INDEX CONCURRENTLY para não bloquear a ingestão.
+
+CREATE INDEX IF NOT EXISTS ix_telemetry_ingested_at
+    ON telemetry (ingested_at);
@@ -18,7 +18,8 @@ CREATE TABLE IF NOT EXISTS telemetry (
 SELECT create_hypertable('telemetry', 'ts', if_not_exists=>TRUE);
 
 -- Indexes for fast queries
-CREATE INDEX IF NOT EXISTS idx_machine_ts 
+-- UNIQUE garante a idempotência (machine_id+ts) usada pelo INSERT ... ON CONFLICT DO NOTHING
+CREATE UNIQUE INDEX IF NOT EXISTS idx_machine_ts 
   ON telemetry(machine_id, ts DESC);
 
 CREATE INDEX IF NOT EXISTS idx_state_ts 
@@ -41,5 +42,17 @@ ALTER TABLE telemetry SET (
 
 SELECT add_compression_policy('telemetry', INTERVAL '7 days', if_not_exists=>TRUE);
 
+-- Intervalos de estado mantidos pelo ingest (ver state_intervals.sql)
+CREATE TABLE IF NOT EXISTS state_intervals (
+  machine_id VARCHAR(50) NOT NULL,
+  start_ts TIMESTAMPTZ NOT NULL,
+  end_ts TIMESTAMPTZ NOT NULL,
+  state VARCHAR(20) NOT NULL,
+  sample_count BIGINT NOT NULL DEFAULT 1,
+  PRIMARY KEY (machine_id, start_ts)
+);
+CREATE INDEX IF NOT EXISTS ix_state_intervals_machine_end ON state_intervals(machine_id, end_ts);
+
 -- Grant permissions
 GRANT ALL ON telemetry TO cnc_user;
+GRANT ALL ON state_intervals TO cnc_user;
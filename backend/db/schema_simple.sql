@@ -20,8 +20,20 @@ CREATE INDEX IF NOT EXISTS idx_telemetry_machine_ts ON telemetry(machine_id, ts
 CREATE INDEX IF NOT EXISTS idx_telemetry_state_ts ON telemetry(state, ts DESC) WHERE state != 'idle';
 CREATE INDEX IF NOT EXISTS idx_telemetry_sequence ON telemetry(sequence) WHERE sequence IS NOT NULL;
 
+-- Intervalos de estado mantidos pelo ingest (ver state_intervals.sql)
+CREATE TABLE IF NOT EXISTS state_intervals (
+  machine_id VARCHAR(50) NOT NULL,
+  start_ts TIMESTAMPTZ NOT NULL,
+  end_ts TIMESTAMPTZ NOT NULL,
+  state VARCHAR(20) NOT NULL,
+  sample_count BIGINT NOT NULL DEFAULT 1,
+  PRIMARY KEY (machine_id, start_ts)
+);
+CREATE INDEX IF NOT EXISTS ix_state_intervals_machine_end ON state_intervals(machine_id, end_ts);
+
 -- Grant permissions
 GRANT ALL ON telemetry TO cnc_user;
+GRANT ALL ON state_intervals TO cnc_user;
 
 -- Note: Para produção, recomenda-se TimescaleDB para:
 -- - Hypertables (particionamento automático)
@@ -0,0 +1,20 @@
+-- Intervalos de estado por máquina (app/services/state_intervals.py): cada linha é uma
+-- sequência de amostras no mesmo estado, [start_ts, end_ts). Mantida pelo ingest na mesma
+-- transação das amostras; resumo (/history/summary) e OEE somam a duração dos intervalos.
+-- Também incluída em schema.sql / schema_simple.sql para bancos novos.
+-- Histórico já gravado antes desta tabela:
+--   python -m backend.scripts.rollup_backfill --from 2025-11-01 --to 2025-11-05
+
+CREATE TABLE IF NOT EXISTS state_intervals (
+  machine_id VARCHAR(50) NOT NULL,
+  start_ts TIMESTAMPTZ NOT NULL,
+  end_ts TIMESTAMPTZ NOT NULL,
+  state VARCHAR(20) NOT NULL,
+  sample_count BIGINT NOT NULL DEFAULT 1,
+  PRIMARY KEY (machine_id, start_ts)
+);
+
+CREATE INDEX IF NOT EXISTS ix_state_intervals_machine_end
+    ON state_intervals (machine_id, end_ts);
+
+GRANT ALL ON state_intervals TO cnc_user;
@@ -6,20 +6,35 @@ Use `app.config.settings` for host/port/database overrides.
 import asyncio
 import logging
 
-from fastapi import Depends, FastAPI, Request, Response
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Literal
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session
 
 # Import routers
-from backend.app.config import ENABLE_M80_WORKER, TELEMETRY_POLL_INTERVAL_SEC
-from backend.app.routers import history, oee, status
-
-# Import DB
-from backend.app.db import Telemetry, get_db
+from backend.app.config import (
+    ENABLE_M80_WORKER,
+    EVENT_RING_WARM_LOAD,
+    STATE_INTERVAL_AUTO_CREATE,
+    TELEMETRY_POLL_INTERVAL_SEC,
+)
+from backend.app.db import SessionLocal
+from backend.app.routers import history, ingest, oee, status
+
+from backend.app.services.db_executor import run_db, shutdown_db_executor
+from backend.app.services.ingest import (
+    get_duplicate_stats,
+    get_spool_status,
+    get_write_behind_status,
+    start_spool,
+    start_write_behind,
+    stop_spool,
+    stop_write_behind,
+)
+from backend.app.services.rollup import get_rollup_status, start_rollups, stop_rollups
+from backend.app.services.state_intervals import ensure_state_interval_table
 from backend.app.services.telemetry_pipeline import process_m80_snapshot
+from backend.app.services.timing import HISTOGRAMS, begin_request, end_request, instrument_sqlalchemy
 from backend.app.services.worker_monitor import (
     mark_worker_enabled,
     mark_snapshot_success,
@@ -37,10 +52,14 @@ logger = logging.getLogger("cnc-telemetry")
 
 app = FastAPI(title="CNC Telemetry API", version=APP_VERSION)
 _m80_worker_task: asyncio.Task | None = None
+# Tempo de SQL por requisição (Server-Timing) e por histograma (/metrics)
+instrument_sqlalchemy()
 
 # Wire routers
+app.include_router(ingest.router)
 app.include_router(status.router)
 app.include_router(history.router)
+app.include_router(history.fleet_router)
 app.include_router(oee.router)
 
 # CORS
@@ -50,8 +69,8 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=False,
     allow_methods=["GET","POST","OPTIONS"],
-    allow_headers=["Content-Type","X-Request-Id","X-Contract-Fingerprint"],
-    expose_headers=["X-Contract-Fingerprint","X-Request-Id","Server-Timing"],
+    allow_headers=["Content-Type","X-Request-Id","X-Contract-Fingerprint","If-None-Match"],
+    expose_headers=["X-Contract-Fingerprint","X-Request-Id","Server-Timing","ETag","X-Next-Cursor"],
     max_age=600
 )
 
@@ -79,7 +98,7 @@ async def _m80_worker_loop() -> None:
         if ENABLE_M80_WORKER:
             try:
                 snapshot_ts = datetime.now(timezone.utc)
-                process_m80_snapshot()
+                await run_db(process_m80_snapshot)
                 mark_snapshot_success(snapshot_ts)
             except Exception as exc:  # noqa: BLE001
                 logger.warning(
@@ -94,6 +113,22 @@ async def _m80_worker_loop() -> None:
 async def log_startup() -> None:
     logger.info("CNC Telemetry API starting", extra={"version": APP_VERSION})
     global _m80_worker_task
+    # Spool antes do write-behind: flush com falha cai no disco em vez de descartar
+    if start_spool() is not None:
+        logger.info("Ingest disk spool started")
+    if start_write_behind() is not None:
+        logger.info("Write-behind ingest buffer started")
+    status.STATUS_BROKER.start()
+    if STATE_INTERVAL_AUTO_CREATE:
+        # O ingest grava state_intervals; bancos anteriores (ex.: telemetry_beta.db) não têm a tabela
+        await run_db(ensure_state_interval_table, SessionLocal)
+    if await run_db(start_rollups, SessionLocal, history.HISTORY_CACHE.changes.record) is not None:
+        # Cache de /history só com os rollups mantidos aqui: são eles que avisam o que mudou
+        history.HISTORY_CACHE.enabled = True
+        logger.info("Rollup engine started (telemetry_5m/1h/1d)")
+    if EVENT_RING_WARM_LOAD:
+        machines = await run_db(status.warm_event_ring)
+        logger.info("Event ring warm-loaded", extra={"machines": machines})
     mark_worker_enabled(ENABLE_M80_WORKER)
     if ENABLE_M80_WORKER and _m80_worker_task is None:
         loop = asyncio.get_running_loop()
@@ -118,6 +153,26 @@ async def stop_workers() -> None:
             logger.info("M80 telemetry worker cancelled")
         finally:
             _m80_worker_task = None
+    await status.STATUS_BROKER.stop()
+    stop_rollups()
+    # Grava o que restou na fila de write-behind antes de encerrar
+    stop_write_behind()
+    stop_spool()
+    shutdown_db_executor()
+
+
+def _service_metrics() -> dict:
+    return {
+        "write_behind": get_write_behind_status(),
+        "ingest_duplicates": get_duplicate_stats(),
+        "ingest_spool": get_spool_status(),
+        "ingest_admission": ingest.ADMISSION.metrics(),
+        "event_compression": status.EVENT_COMPRESSOR.stats(),
+        "status_push": status.STATUS_BROKER.metrics(),
+        "event_ring": status.EVENT_RING.metrics(),
+        "rollups": get_rollup_status(),
+        "history_cache": history.HISTORY_CACHE.metrics(),
+    }
 
 
 @app.get("/healthz", tags=["infra"])
@@ -128,63 +183,51 @@ async def healthz():
         "version": APP_VERSION,
     }
     payload.update(get_worker_status())
+    payload.update(_service_metrics())
     return payload
 
+
+def _gauge_lines(prefix: str, values: dict) -> list:
+    # Só folhas numéricas/booleanas; dicts aninhados (ex.: per_machine) ficam no /healthz
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f"cnc_{prefix}{key} {value}")
+    return lines
+
+
+@app.get("/metrics", tags=["infra"])
+async def metrics():
+    """Métricas no formato texto do Prometheus: histogramas de latência + contadores do /healthz."""
+    lines = HISTOGRAMS.render()
+    lines.extend(_gauge_lines("", get_worker_status()))
+    for section, values in _service_metrics().items():
+        lines.extend(_gauge_lines(f"{section}_", values))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.middleware("http")
 async def headers(req, call_next):
-    res = await call_next(req)
-    res.headers.update({
+    timer, token = begin_request()
+    try:
+        res = await call_next(req)
+    except Exception:
+        end_request(timer, token, req.method, "unmatched", 500)
+        raise
+    # Template da rota (não o path) para não explodir a cardinalidade do /metrics
+    route = req.scope.get("route")
+    res.headers["Server-Timing"] = end_request(
+        timer, token, req.method, getattr(route, "path", "unmatched"), res.status_code
+    )
+    # Só preenche o que a rota não definiu (ex.: ETag + Cache-Control: no-cache em /status)
+    for name, value in {
         "Cache-Control":"no-store",
         "Vary":"Origin, Accept-Encoding",
-        "Server-Timing":"app;dur=1",
         "X-Contract-Fingerprint":"010191590cf1"
-    })
+    }.items():
+        res.headers.setdefault(name, value)
     return res
 
-class TelemetryPayload(BaseModel):
-    machine_id: str = Field(..., pattern=r"^[a-zA-Z0-9-]+$")
-    timestamp: str  # ISO 8601
-    rpm: float = Field(..., ge=0, le=30000)
-    feed_mm_min: float = Field(..., ge=0, le=10000)
-    state: Literal["running", "stopped", "idle"]
-
-@app.post("/v1/telemetry/ingest", status_code=201)
-async def ingest_telemetry(payload: TelemetryPayload, db: Session = Depends(get_db)):
-    """Ingerir dados de telemetria (idempotência: machine_id+timestamp)"""
-    
-    # Parse timestamp
-    ts = datetime.fromisoformat(payload.timestamp.replace('Z', '+00:00'))
-    
-    # Persistir em TimescaleDB
-    try:
-        db_record = Telemetry(
-            ts=ts,
-            machine_id=payload.machine_id,
-            rpm=payload.rpm,
-            feed_mm_min=payload.feed_mm_min,
-            state=payload.state,
-            sequence=None  # TODO: extrair do MTConnect se disponível
-        )
-        db.add(db_record)
-        db.commit()
-    except Exception as e:
-        # Se já existe (duplicate key), apenas atualizar status
-        db.rollback()
-        print(f"DB insert failed (possibly duplicate): {e}")
-    
-    # Atualizar status em memória (para /status endpoint) + persistir evento v0.2
-    status.update_status(
-        machine_id=payload.machine_id,
-        rpm=payload.rpm,
-        feed_mm_min=payload.feed_mm_min,
-        state=payload.state,
-        db=db  # [v0.2] Passar sessão DB para persistir histórico
-    )
-    
-    return {
-        "ingested": True,
-        "machine_id": payload.machine_id,
-        "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-    }
-
+# Endpoints /v1/telemetry/ingest e /ingest/batch movidos para app/routers/ingest.py
 # Endpoint /v1/machines/{id}/status movido para app/routers/status.py
@@ -17,6 +17,11 @@ from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 import logging
 
+try:
+    from app.services.frame_codec import CONTENT_TYPE as FRAME_CONTENT_TYPE, encode_frame
+except ImportError:  # importado como backend.mtconnect_adapter
+    from backend.app.services.frame_codec import CONTENT_TYPE as FRAME_CONTENT_TYPE, encode_frame
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(message)s'
@@ -83,12 +88,15 @@ class MTConnectAdapter:
         agent_url: str,
         api_url: str,
         machine_id: str,
-        poll_interval: float = 2.0
+        poll_interval: float = 2.0,
+        ingest_format: str = "json"
     ):
         self.agent_url = agent_url.rstrip('/')
         self.api_url = api_url.rstrip('/')
         self.machine_id = machine_id
         self.poll_interval = poll_interval
+        # "json" → POST /ingest; "frame" → frame binário compacto em /ingest/batch
+        self.ingest_format = ingest_format
         
         self.client = httpx.AsyncClient(timeout=10.0)
         self.next_sequence: Optional[int] = None
@@ -250,17 +258,34 @@ class MTConnectAdapter:
     
     async def ingest(self, payload: Dict[str, Any]) -> bool:
         """POST /v1/telemetry/ingest com idempotência"""
+        headers = {
+            "X-Request-Id": f"{self.machine_id}-{payload['timestamp']}",
+            "X-Contract-Fingerprint": "010191590cf1"
+        }
         try:
-            response = await self.client.post(
-                f"{self.api_url}/v1/telemetry/ingest",
-                json=payload,
-                headers={
-                    "X-Request-Id": f"{self.machine_id}-{payload['timestamp']}",
-                    "X-Contract-Fingerprint": "010191590cf1"
-                }
-            )
+            # 429 = backend sobrecarregado: respeitar Retry-After em vez de insistir
+            for attempt in range(3):
+                if self.ingest_format == "frame":
+                    response = await self.client.post(
+                        f"{self.api_url}/v1/telemetry/ingest/batch",
+                        content=encode_frame([payload]),
+                        headers={**headers, "Content-Type": FRAME_CONTENT_TYPE}
+                    )
+                    throttled = response.status_code == 200 and response.json().get("throttled")
+                else:
+                    response = await self.client.post(
+                        f"{self.api_url}/v1/telemetry/ingest",
+                        json=payload,
+                        headers=headers
+                    )
+                    throttled = False
+                if response.status_code != 429 and not throttled:
+                    break
+                retry_after = float(response.headers.get("Retry-After", self.poll_interval))
+                logger.warning(f"Ingest limitado pelo backend, nova tentativa em {retry_after:.0f}s")
+                await asyncio.sleep(retry_after)
             
-            if response.status_code in (200, 201):
+            if response.status_code in (200, 201) and not throttled:
                 self.samples_sent += 1
                 return True
             else:
@@ -344,7 +369,8 @@ async def main():
         agent_url=os.getenv("AGENT_URL", "http://localhost:5000"),
         api_url=os.getenv("API_URL", "http://localhost:8001"),
         machine_id=os.getenv("MACHINE_ID", "ABR-850"),
-        poll_interval=float(os.getenv("POLL_INTERVAL", "2.0"))
+        poll_interval=float(os.getenv("POLL_INTERVAL", "2.0")),
+        ingest_format=os.getenv("INGEST_FORMAT", "json")
     )
     
     duration = os.getenv("DURATION_MIN")
@@ -0,0 +1,112 @@
+"""Benchmark: formatos de /history (json, ndjson, columnar, arrow).
+
+Mede, para a mesma consulta raw, o tempo da requisição (consulta + encode),
+o tamanho do payload e o tempo de parse no cliente. Usa um SQLite temporário
+populado com `--rows` amostras de uma máquina.
+
+Rodar a partir da raiz do repositório:
+    python -m backend.scripts.bench_history_formats --rows 100000 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict
+
+_DB_DIR = tempfile.mkdtemp(prefix="cnc-bench-")
+os.environ["TELEMETRY_DATABASE_URL"] = f"sqlite:///{Path(_DB_DIR) / 'bench.db'}"
+os.environ.setdefault("ENABLE_M80_WORKER", "0")
+os.environ.setdefault("ROLLUP_ENGINE", "off")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from backend.app.db import Base, Telemetry, engine  # noqa: E402
+from backend.app.services.columnar import arrow_available  # noqa: E402
+from backend.main import app  # noqa: E402
+
+MACHINE_ID = "BENCH-001"
+START = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+def _seed(rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    states = ("running", "running", "running", "idle", "stopped")
+    with engine.begin() as conn:
+        for offset in range(0, rows, 10000):
+            conn.execute(
+                insert(Telemetry),
+                [
+                    {
+                        "ts": START + timedelta(seconds=index),
+                        "machine_id": MACHINE_ID,
+                        "rpm": 3000.0 + (index % 97) * 1.5,
+                        "feed_mm_min": 800.0 + (index % 31),
+                        "state": states[index % len(states)],
+                        "sequence": index + 1,
+                        "src": "bench",
+                    }
+                    for index in range(offset, min(rows, offset + 10000))
+                ],
+            )
+
+
+def _parse_arrow(body: bytes):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(body).read_all()
+
+
+PARSERS: Dict[str, Callable[[bytes], object]] = {
+    "json": json.loads,
+    "ndjson": lambda body: [json.loads(line) for line in body.splitlines()],
+    "columnar": json.loads,
+    "arrow": _parse_arrow,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="Amostras raw no intervalo")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por formato (mediana)")
+    parser.add_argument("--formats", default="json,ndjson,columnar,arrow", help="Formatos a comparar")
+    args = parser.parse_args()
+
+    _seed(args.rows)
+    to_ts = (START + timedelta(seconds=args.rows)).isoformat().replace("+00:00", "Z")
+    url = (
+        f"/v1/machines/{MACHINE_ID}/history?resolution=raw&limit={args.rows}"
+        f"&from_ts={START.isoformat().replace('+00:00', 'Z')}&to_ts={to_ts}"
+    )
+
+    print(f"{'format':<10} {'request':>10} {'parse':>10} {'payload':>12} {'bytes/row':>10}")
+    with TestClient(app) as client:
+        for fmt in (item.strip() for item in args.formats.split(",")):
+            if fmt == "arrow" and not arrow_available():
+                print(f"{fmt:<10} (pyarrow não instalado)")
+                continue
+            request_ms, parse_ms, size = [], [], 0
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get(f"{url}&format={fmt}")
+                request_ms.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+                size = len(response.content)
+                started = time.perf_counter()
+                PARSERS[fmt](response.content)
+                parse_ms.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{fmt:<10} {statistics.median(request_ms):>8.1f}ms {statistics.median(parse_ms):>8.1f}ms "
+                f"{size / 1024:>10.1f}KB {size / max(1, args.rows):>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark: CPU por amostra no decode+validação do ingest (JSON vs frame binário).
+
+Mede apenas o caminho de parsing do /v1/telemetry/ingest/batch (sem banco):
+- json:   json.loads + TelemetryPayload + datetime.fromisoformat por amostra
+- ndjson: idem, uma linha por amostra
+- frame:  services/frame_codec.decode_frame (colunas num único passe) + validação
+
+Rodar a partir da raiz do repositório:
+    python -m backend.scripts.bench_ingest_decode --samples 5000 --machines 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("ENABLE_M80_WORKER", "0")
+
+from backend.app.routers.ingest import (  # noqa: E402
+    _decode_batch_body,
+    _validate_frame,
+    _validate_items,
+)
+from backend.app.services.frame_codec import decode_frame, encode_frame  # noqa: E402
+
+
+def _build_samples(count: int, machines: int) -> list[dict]:
+    base = datetime(2025, 11, 14, 6, 0, tzinfo=timezone.utc)
+    states = ("running", "stopped", "idle")
+    return [
+        {
+            "machine_id": f"CNC-{idx % machines:03d}",
+            "timestamp": (base + timedelta(milliseconds=idx * 250)).isoformat().replace("+00:00", "Z"),
+            "rpm": float(3000 + idx % 500),
+            "feed_mm_min": float(800 + idx % 300),
+            "state": states[idx % 3],
+        }
+        for idx in range(count)
+    ]
+
+
+def _cpu_us_per_sample(fn, body: bytes, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        fn(body)
+        best = min(best, time.process_time() - started)
+    return best * 1e6 / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--machines", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = _build_samples(args.samples, args.machines)
+    bodies = {
+        "json": json.dumps(samples).encode(),
+        "ndjson": "\n".join(json.dumps(s) for s in samples).encode(),
+        "frame": encode_frame(samples),
+    }
+    decoders = {
+        "json": lambda body: _validate_items(_decode_batch_body(body, "application/json")),
+        "ndjson": lambda body: _validate_items(_decode_batch_body(body, "application/x-ndjson")),
+        "frame": lambda body: _validate_frame(decode_frame(body)),
+    }
+
+    print(f"{args.samples} amostras, {args.machines} máquinas")
+    print(f"{'format':<8} {'bytes/sample':>13} {'cpu us/sample':>14}")
+    for name, body in bodies.items():
+        cpu = _cpu_us_per_sample(decoders[name], body, args.samples, args.repeat)
+        print(f"{name:<8} {len(body) / args.samples:>13.1f} {cpu:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
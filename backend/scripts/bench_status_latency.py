@@ -0,0 +1,118 @@
+"""Benchmark: latência de /status e /healthz sob ingest concorrente.
+
+Compara DB_EXECUTION_MODE=inline (commit bloqueando o event loop) com
+DB_EXECUTION_MODE=executor (I/O de banco no pool dedicado). Usa um SQLite
+temporário e um atraso artificial por commit para simular fsync lento.
+
+Rodar a partir da raiz do repositório:
+    python -m backend.scripts.bench_status_latency --ingesters 16 --duration 5 --commit-delay-ms 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+_DB_DIR = tempfile.mkdtemp(prefix="cnc-bench-")
+os.environ["TELEMETRY_DATABASE_URL"] = f"sqlite:///{Path(_DB_DIR) / 'bench.db'}"
+os.environ.setdefault("ENABLE_M80_WORKER", "0")
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from backend.app.db import Base, engine  # noqa: E402
+from backend.app.services import db_executor  # noqa: E402
+from backend.main import app  # noqa: E402
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _ingester(client: httpx.AsyncClient, machine_id: str, stop_at: float) -> int:
+    sent = 0
+    while time.perf_counter() < stop_at:
+        ts = time.time() + sent * 1e-3
+        payload = {
+            "machine_id": machine_id,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + f".{int(ts * 1e6) % 1000000:06d}Z",
+            "rpm": 3200.0,
+            "feed_mm_min": 900.0,
+            "state": "running",
+        }
+        await client.post("/v1/telemetry/ingest", json=payload)
+        sent += 1
+    return sent
+
+
+async def _prober(client: httpx.AsyncClient, path: str, stop_at: float, samples: List[float]) -> None:
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def _run_mode(mode: str, ingesters: int, duration: float) -> Dict[str, float]:
+    db_executor.DB_EXECUTION_MODE = mode
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop_at = time.perf_counter() + duration
+        status_ms: List[float] = []
+        health_ms: List[float] = []
+        tasks = [
+            asyncio.create_task(_ingester(client, f"BENCH-{mode}-{idx:03d}", stop_at))
+            for idx in range(ingesters)
+        ]
+        tasks.append(asyncio.create_task(_prober(client, "/v1/machines/BENCH-001/status", stop_at, status_ms)))
+        tasks.append(asyncio.create_task(_prober(client, "/healthz", stop_at, health_ms)))
+        results = await asyncio.gather(*tasks)
+    db_executor.shutdown_db_executor()
+
+    ingested = sum(r for r in results if isinstance(r, int))
+    return {
+        "ingest_per_s": ingested / duration,
+        "status_p50_ms": statistics.median(status_ms) if status_ms else 0.0,
+        "status_p99_ms": _percentile(status_ms, 99),
+        "healthz_p99_ms": _percentile(health_ms, 99),
+        "probes": len(status_ms),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ingesters", type=int, default=16, help="Clientes de ingest concorrentes")
+    parser.add_argument("--duration", type=float, default=5.0, help="Duração de cada modo (s)")
+    parser.add_argument("--commit-delay-ms", type=float, default=20.0, help="Atraso artificial por commit")
+    parser.add_argument("--modes", default="inline,executor", help="Modos a comparar")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if args.commit_delay_ms > 0:
+        delay = args.commit_delay_ms / 1000
+
+        @event.listens_for(engine, "commit")
+        def _slow_commit(conn):  # noqa: ARG001
+            time.sleep(delay)
+
+    print(f"{'mode':<10} {'ingest/s':>10} {'status p50':>11} {'status p99':>11} {'healthz p99':>12} {'probes':>7}")
+    for mode in args.modes.split(","):
+        stats = asyncio.run(_run_mode(mode.strip(), args.ingesters, args.duration))
+        print(
+            f"{mode:<10} {stats['ingest_per_s']:>10.1f} {stats['status_p50_ms']:>9.2f}ms "
+            f"{stats['status_p99_ms']:>9.2f}ms {stats['healthz_p99_ms']:>10.2f}ms {stats['probes']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Recalcula os rollups telemetry_5m/1h/1d e os intervalos de estado de um intervalo (dias UTC inteiros).
+
+Para dados importados/antigos ou amostras sem ingested_at, que o motor
+incremental (app/services/rollup.py) não enxerga pelo watermark, e para o
+histórico gravado antes de existir state_intervals. Usa o banco de
+TELEMETRY_DATABASE_URL; um commit por dia.
+
+Rodar a partir da raiz do repositório:
+    python -m backend.scripts.rollup_backfill --from 2025-11-01 --to 2025-11-05 [--machine CNC-01]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from backend.app.db import SessionLocal, Telemetry
+from backend.app.routers.history import HISTORY_CACHE
+from backend.app.services import state_intervals
+from backend.app.services.rollup import RollupEngine, create_rollup_tables, native_aggregates
+
+
+def _parse_day(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _rebuild_state_intervals(db, from_dt: datetime, to_dt: datetime, machine_ids) -> int:
+    machines = machine_ids or db.execute(
+        select(Telemetry.machine_id).where(Telemetry.ts >= from_dt, Telemetry.ts < to_dt).distinct()
+    ).scalars().all()
+    written = 0
+    # Do fim para o começo: cada dia é refeito só até o primeiro intervalo do dia seguinte
+    day_end = to_dt
+    while day_end > from_dt:
+        day = max(day_end - timedelta(days=1), from_dt)
+        for machine_id in machines:
+            written += state_intervals.rebuild(db, machine_id, day, day_end - timedelta(microseconds=1))
+        db.commit()
+        day_end = day
+    return written
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="from_ts", required=True, help="início (ISO 8601, UTC se sem fuso)")
+    parser.add_argument("--to", dest="to_ts", required=True, help="fim, exclusivo (ISO 8601)")
+    parser.add_argument("--machine", action="append", help="restringe a uma máquina (repetível)")
+    args = parser.parse_args(argv)
+
+    from_dt, to_dt = _parse_day(args.from_ts), _parse_day(args.to_ts)
+    if from_dt >= to_dt:
+        parser.error("--from deve ser anterior a --to")
+
+    db = SessionLocal()
+    try:
+        state_intervals.create_state_interval_table(db.get_bind())
+        intervals = _rebuild_state_intervals(db, from_dt, to_dt, args.machine)
+        print(f"intervalos de estado recalculados: {intervals}")
+        if native_aggregates(db):
+            print("telemetry_5m é continuous aggregate do TimescaleDB: use refresh_continuous_aggregate")
+            return 1
+        create_rollup_tables(db.get_bind())
+    finally:
+        db.close()
+
+    # Publica os dias recalculados no log compartilhado: workers da API descartam o cache afetado
+    engine = RollupEngine(SessionLocal, on_change=HISTORY_CACHE.changes.record)
+    written = engine.backfill(from_dt, to_dt, machine_ids=args.machine)
+    print("rollups recalculados: " + ", ".join(f"{level}={rows}" for level, rows in written.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,40 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.db import Base, get_db
-from app.routers import status as status_router
-from main import app as fastapi_app
+# [ASSUNCAO] main.py importa via pacote `backend.*`; os testes precisam usar os
+# mesmos módulos para que o override de get_db e o LAST_STATUS sejam os mesmos.
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# O worker M80 gravaria no banco real (telemetry_beta.db) durante o lifespan do TestClient.
+os.environ.setdefault("ENABLE_M80_WORKER", "0")
+# Spool em disco só nos testes que o abrem explicitamente (diretório temporário).
+os.environ.setdefault("INGEST_SPOOL_ENABLED", "0")
+# Warm-load do anel de eventos leria o banco real no startup do TestClient.
+os.environ.setdefault("EVENT_RING_WARM_LOAD", "0")
+# Rollups rodariam numa thread contra o banco real; os testes chamam o motor direto.
+os.environ.setdefault("ROLLUP_ENGINE", "off")
+# state_intervals seria criada no banco real no startup; o SQLite dos testes já a tem.
+os.environ.setdefault("STATE_INTERVAL_AUTO_CREATE", "0")
+# Store de status mmap isolado do /dev/shm usado por um servidor de dev rodando.
+os.environ.setdefault("STATUS_STORE_PATH", str(Path(tempfile.mkdtemp(prefix="cnc-status-")) / "status.bin"))
+
+from backend.app.db import Base, get_db
+from backend.app.routers import history as history_router
+from backend.app.routers import ingest as ingest_router
+from backend.app.routers import status as status_router
+from backend.app.services import ingest as ingest_service
+from backend.app.services import timing
+from backend.main import app as fastapi_app
 
 TEST_DATABASE_URL = "sqlite+pysqlite:///:memory:"
 engine = create_engine(
@@ -16,50 +44,8 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
-# Criar tabelas ORM e auxiliares necessárias para os endpoints de histórico
+# Criar tabelas ORM (inclui os rollups telemetry_5m/1h/1d usados pelo histórico)
 Base.metadata.create_all(bind=engine)
-AUX_TABLES = (
-    """
-    CREATE TABLE IF NOT EXISTS telemetry_5m (
-        bucket TEXT NOT NULL,
-        machine_id TEXT NOT NULL,
-        rpm_avg FLOAT,
-        rpm_max FLOAT,
-        rpm_min FLOAT,
-        feed_avg FLOAT,
-        feed_max FLOAT,
-        feed_min FLOAT,
-        state_mode TEXT,
-        sample_count INTEGER,
-        uptime_ratio FLOAT
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS telemetry_1h (
-        bucket TEXT NOT NULL,
-        machine_id TEXT NOT NULL,
-        rpm_avg FLOAT,
-        rpm_max FLOAT,
-        feed_avg FLOAT,
-        sample_count INTEGER,
-        uptime_ratio FLOAT
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS telemetry_1d (
-        date TEXT NOT NULL,
-        machine_id TEXT NOT NULL,
-        rpm_avg FLOAT,
-        rpm_max FLOAT,
-        feed_avg FLOAT,
-        sample_count INTEGER,
-        availability FLOAT
-    )
-    """,
-)
-with engine.begin() as conn:
-    for ddl in AUX_TABLES:
-        conn.exec_driver_sql(ddl)
 
 
 @pytest.fixture(scope="session")
@@ -93,6 +79,8 @@ def clean_db():
             "telemetry_5m",
             "telemetry_1h",
             "telemetry_1d",
+            "rollup_watermark",
+            "state_intervals",
             "oee_daily",
         ):
             session.execute(text(f"DELETE FROM {table}"))
@@ -100,6 +88,14 @@ def clean_db():
     finally:
         session.close()
     status_router.LAST_STATUS.clear()
+    status_router.EVENT_VERSIONS.clear()
+    status_router.EVENT_RING.reset()
+    status_router.EVENT_COMPRESSOR.reset()
+    status_router.STATUS_BROKER.reset()
+    ingest_router.ADMISSION.reset()
+    history_router.HISTORY_CACHE.reset()
+    ingest_service.reset_duplicate_tracking()
+    timing.HISTOGRAMS.reset()
     yield
 
 
@@ -109,6 +105,12 @@ def client(app):
         yield test_client
 
 
+@pytest.fixture()
+def session_factory():
+    """Fábrica de sessões do banco de teste (para serviços que abrem a própria sessão)."""
+    return TestingSessionLocal
+
+
 @pytest.fixture()
 def db_session():
     session = TestingSessionLocal()
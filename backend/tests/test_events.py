@@ -1,6 +1,7 @@
-﻿from datetime import datetime, timedelta, timezone
+﻿import json
+from datetime import datetime, timedelta, timezone
 
-from app.db import TelemetryEvents
+from backend.app.db import TelemetryEvents
 
 
 def seed_events(session, machine_id: str = "SIM_M80_01", count: int = 5):
@@ -51,3 +52,162 @@ def test_events_with_data_ordered_and_limited(client, db_session):
         for field in ('timestamp_utc', 'execution', 'mode', 'rpm', 'alarm_code', 'alarm_message'):
             assert field in item
 
+
+
+def test_events_keyset_pagination_and_ndjson_export(client, db_session):
+    seed_events(db_session, count=5)
+    # Mesmo timestamp do evento id=1: desempate pelo id no cursor
+    db_session.add(
+        TelemetryEvents(
+            id=6,
+            machine_id="SIM_M80_01",
+            timestamp_utc=datetime(2025, 11, 14, 12, 0, tzinfo=timezone.utc),
+            execution="STOPPED",
+            rpm=0.0,
+        )
+    )
+    db_session.commit()
+
+    seen = []
+    before = None
+    while True:
+        params = {"limit": 1, **({"before": before} if before else {})}
+        response = client.get("/v1/machines/SIM_M80_01/events", params=params)
+        assert response.status_code == 200
+        seen.extend((item["execution"], item["rpm"]) for item in response.json())
+        before = response.headers.get("x-next-cursor")
+        if before is None:
+            break
+    assert seen == [("STOPPED", 0.0)] + [("EXECUTING", 1500.0 + offset) for offset in range(5)]
+
+    export = client.get("/v1/machines/SIM_M80_01/events", params={"format": "ndjson"})
+    assert export.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in export.text.splitlines()]
+    assert [(item["execution"], item["rpm"]) for item in lines] == seen
+
+    assert client.get("/v1/machines/SIM_M80_01/events?before=ontem").status_code == 400
+
+
+def test_events_etag_changes_only_when_events_are_written(client):
+    sample = {
+        "machine_id": "CNC-01",
+        "timestamp": "2025-11-14T12:00:00Z",
+        "rpm": 1500.0,
+        "feed_mm_min": 250.0,
+        "state": "running",
+    }
+    client.post("/v1/telemetry/ingest", json=sample)
+    first = client.get("/v1/machines/CNC-01/events?limit=10")
+    etag = first.headers["etag"]
+    assert len(first.json()) == 1
+
+    assert client.get(
+        "/v1/machines/CNC-01/events?limit=10", headers={"If-None-Match": etag}
+    ).status_code == 304
+    # Outro limit é outra representação
+    assert client.get(
+        "/v1/machines/CNC-01/events?limit=5", headers={"If-None-Match": etag}
+    ).status_code == 200
+
+    client.post("/v1/telemetry/ingest", json=dict(sample, timestamp="2025-11-14T12:00:01Z", state="idle", rpm=0.0))
+    fresh = client.get("/v1/machines/CNC-01/events?limit=10", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert len(fresh.json()) == 2
+
+
+def test_events_are_compressed_by_deadband(client, db_session):
+    base_ts = datetime(2025, 11, 14, 12, 0, tzinfo=timezone.utc)
+    samples = [
+        # ocioso e estável: só o primeiro vira evento
+        *[("idle", 0.0, sec) for sec in range(0, 60)],
+        # mudança de estado sempre grava; rpm dentro do deadband não
+        ("running", 3000.0, 60),
+        ("running", 3020.0, 61),
+        ("running", 3200.0, 62),
+        # heartbeat de 300 s mesmo sem mudança
+        ("running", 3200.0, 62 + 300),
+    ]
+    batch = [
+        {
+            "machine_id": "CNC-07",
+            "timestamp": (base_ts + timedelta(seconds=sec)).isoformat().replace("+00:00", "Z"),
+            "rpm": rpm,
+            "feed_mm_min": 0.0,
+            "state": state,
+        }
+        for state, rpm, sec in samples
+    ]
+    assert client.post("/v1/telemetry/ingest/batch", json=batch).json()["ingested"] == len(batch)
+
+    events = client.get("/v1/machines/CNC-07/events?limit=200").json()
+    assert [(e["execution"], e["rpm"]) for e in reversed(events)] == [
+        ("READY", 0.0),
+        ("EXECUTING", 3000.0),
+        ("EXECUTING", 3200.0),
+        ("EXECUTING", 3200.0),
+    ]
+    assert db_session.query(TelemetryEvents).count() == 4
+
+    stats = client.get("/healthz").json()["event_compression"]
+    assert stats["mode"] == "deadband"
+    assert stats["per_machine"]["CNC-07"] == {"seen": 64, "recorded": 4, "ratio": 16.0}
+
+
+def test_swinging_door_keeps_ramp_endpoints():
+    from backend.app.services.event_compression import EventCompressor
+
+    compressor = EventCompressor(mode="swinging_door", rpm_deadband=10.0, heartbeat_sec=0)
+    base_ts = datetime(2025, 11, 14, 12, 0, tzinfo=timezone.utc)
+
+    def row(sec: int, rpm: float) -> dict:
+        return {
+            "machine_id": "CNC-01",
+            "timestamp_utc": base_ts + timedelta(seconds=sec),
+            "execution": "EXECUTING",
+            "mode": "AUTOMATIC",
+            "alarm_code": None,
+            "rpm": rpm,
+            "feed_rate": None,
+            "spindle_load_pct": None,
+        }
+
+    # rampa linear 0..1000 rpm, depois patamar
+    points = [row(sec, 100.0 * sec) for sec in range(11)] + [row(sec, 1000.0) for sec in range(11, 21)]
+    recorded = [r for point in points for r in compressor.offer(point)]
+    assert [(r["timestamp_utc"] - base_ts).seconds for r in recorded] == [0, 10]
+
+    # mudança de estado fecha o trecho no último ponto retido
+    stop = dict(row(21, 0.0), execution="STOPPED")
+    assert [(r["timestamp_utc"] - base_ts).seconds for r in compressor.offer(stop)] == [20, 21]
+
+
+def test_event_ring_serves_recent_events_from_memory(client, db_session, session_factory, monkeypatch):
+    from backend.app.routers import status as status_router
+
+    seed_events(db_session, machine_id="CNC-01", count=3)
+    assert status_router.warm_event_ring(session_factory) == 1
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("query should have been served by the event ring")
+
+    monkeypatch.setattr(status_router, "_fetch_events", no_db)
+    sample = {
+        "machine_id": "CNC-01",
+        "timestamp": "2025-11-14T12:05:00Z",
+        "rpm": 0.0,
+        "feed_mm_min": 0.0,
+        "state": "idle",
+    }
+    assert client.post("/v1/telemetry/ingest", json=sample).status_code == 201
+
+    response = client.get("/v1/machines/CNC-01/events?limit=2")
+    assert [(e["execution"], e["rpm"]) for e in response.json()] == [("READY", 0.0), ("EXECUTING", 1500.0)]
+    # Cursor da página em memória continua no banco
+    assert response.headers["x-next-cursor"].endswith(",1")
+    assert status_router.EVENT_RING.metrics()["hits"] == 1
+
+    # Escrita de outro worker (versão avançou sem passar por este processo): recarrega do banco
+    monkeypatch.undo()
+    status_router.EVENT_VERSIONS["CNC-01"] = "2025-11-14T12:06:00+00:00"
+    assert len(client.get("/v1/machines/CNC-01/events?limit=10").json()) == 4
+    assert status_router.EVENT_RING.metrics()["misses"] == 1
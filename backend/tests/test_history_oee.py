@@ -1,6 +1,9 @@
 ﻿from datetime import datetime, timedelta, timezone
 
-from app.db import Telemetry
+import pytest
+from sqlalchemy import select
+
+from backend.app.db import Telemetry
 
 
 def _seed_telemetry_samples(db_session, count=5):
@@ -41,3 +44,369 @@ def test_oee_shape(client):
     assert isinstance(payload, dict)
     for field in ('availability', 'performance', 'quality', 'oee'):
         assert field in payload
+
+
+def _ingest(client, ts, rpm, state='running', machine_id='CNC-01'):
+    response = client.post('/v1/telemetry/ingest', json={
+        'machine_id': machine_id,
+        'timestamp': ts,
+        'rpm': rpm,
+        'feed_mm_min': 100.0,
+        'state': state,
+    })
+    assert response.status_code in (200, 201), response.text
+
+
+def test_rollups_incremental_with_late_data(client, session_factory):
+    from backend.app.services.rollup import RollupEngine
+
+    rollups = RollupEngine(session_factory, overlap_sec=0)
+    _ingest(client, '2025-11-14T10:01:00Z', 1000.0)
+    _ingest(client, '2025-11-14T10:02:00Z', 3000.0, state='idle')
+    _ingest(client, '2025-11-14T10:07:00Z', 2000.0)
+    written = rollups.run_once()
+    assert written == {'5m': 2, '1h': 1, '1d': 1}
+
+    window = 'from_ts=2025-11-14T00:00:00Z&to_ts=2025-11-15T00:00:00Z'
+    rows = client.get(f'/v1/machines/CNC-01/history?resolution=5m&{window}').json()
+    assert [(row['timestamp_utc'][:19], row['rpm'], row['sample_count']) for row in rows] == [
+        ('2025-11-14T10:05:00', 2000.0, 1),
+        ('2025-11-14T10:00:00', 2000.0, 2),
+    ]
+    assert rows[1]['rpm_max'] == 3000.0 and rows[1]['uptime_ratio'] == 0.5
+
+    # Nada novo: nenhum bucket recalculado
+    assert rollups.run_once() == {'5m': 0, '1h': 0, '1d': 0}
+
+    # Amostra atrasada num bucket antigo: só ele (e a hora/dia que o contêm) é refeito
+    _ingest(client, '2025-11-14T10:03:00Z', 4000.0)
+    assert rollups.run_once() == {'5m': 1, '1h': 1, '1d': 1}
+
+    hourly = client.get(f'/v1/machines/CNC-01/history?resolution=1h&{window}').json()
+    assert hourly[0]['sample_count'] == 4 and hourly[0]['rpm'] == 2500.0
+    daily = client.get(f'/v1/machines/CNC-01/history?resolution=1d&{window}').json()
+    assert daily[0]['timestamp_utc'].startswith('2025-11-14T00:00:00')
+    assert daily[0]['sample_count'] == 4 and daily[0]['uptime_ratio'] == 0.75
+
+
+def test_history_summary_stitches_rollups_and_raw_edges(client, db_session, session_factory):
+    from backend.app.services.rollup import LEVEL_1D, LEVEL_1H, LEVEL_5M, RollupEngine, plan_range
+
+    ingested = datetime(2025, 11, 16, tzinfo=timezone.utc)
+    base = datetime(2025, 11, 13, 22, 0, tzinfo=timezone.utc)
+    states = ('running', 'running', 'idle', 'stopped')
+    samples = [
+        (base + timedelta(seconds=97 * index), 1000.0 + index % 13, 200.0 + index % 5, states[index % 4])
+        for index in range(1800)
+    ]
+    for index, (ts, rpm, feed, state) in enumerate(samples):
+        db_session.add(Telemetry(
+            ts=ts, machine_id='CNC-01', rpm=rpm, feed_mm_min=feed, state=state,
+            sequence=index, ingested_at=ingested,
+        ))
+    db_session.commit()
+    RollupEngine(session_factory, overlap_sec=0).run_once(now=ingested + timedelta(seconds=1))
+
+    # Chegou depois do rollup, dentro de um dia inteiro do intervalo
+    late = (datetime(2025, 11, 14, 12, 0, 30, tzinfo=timezone.utc), 9000.0, 50.0, 'stopped')
+    samples.append(late)
+    db_session.add(Telemetry(
+        ts=late[0], machine_id='CNC-01', rpm=late[1], feed_mm_min=late[2], state=late[3],
+        sequence=5000, ingested_at=ingested + timedelta(hours=1),
+    ))
+    db_session.commit()
+
+    from_dt = datetime(2025, 11, 13, 22, 3, 30, tzinfo=timezone.utc)
+    to_dt = datetime(2025, 11, 15, 1, 17, 0, tzinfo=timezone.utc)
+    buckets, raw = plan_range(from_dt, to_dt)
+    assert [level for level, _start, _end in buckets] == [LEVEL_5M, LEVEL_1H, LEVEL_1D, LEVEL_1H, LEVEL_5M]
+    assert raw[0][0] == from_dt and raw[-1] == (datetime(2025, 11, 15, 1, 15, tzinfo=timezone.utc), to_dt, True)
+
+    response = client.get(
+        '/v1/machines/CNC-01/history/summary?from_ts=2025-11-13T22:03:30Z&to_ts=2025-11-15T01:17:00Z'
+    )
+    assert response.status_code == 200
+    summary = response.json()
+
+    expected = [sample for sample in samples if from_dt <= sample[0] <= to_dt]
+    rpms = [sample[1] for sample in expected]
+    assert summary['total_samples'] == len(expected)
+    assert summary['statistics']['rpm'] == {
+        'avg': round(sum(rpms) / len(rpms), 1), 'max': 9000.0, 'min': min(rpms),
+    }
+    assert summary['statistics']['feed_mm_min']['avg'] == round(sum(sample[2] for sample in expected) / len(expected), 1)
+    assert summary['sample_distribution'] == {
+        state: sum(1 for sample in expected if sample[3] == state) for state in ('running', 'stopped', 'idle')
+    }
+
+
+def test_state_intervals_time_weighted_durations(client, db_session):
+    from backend.app.db import StateInterval
+    from backend.app.services import state_intervals
+
+    _ingest(client, '2025-11-14T10:00:00Z', 1000.0)
+    _ingest(client, '2025-11-14T10:00:05Z', 1000.0)
+    _ingest(client, '2025-11-14T10:00:10Z', 0.0, state='idle')
+    _ingest(client, '2025-11-14T10:00:13Z', 0.0, state='idle')
+    _ingest(client, '2025-11-14T10:00:15Z', 1000.0)
+    # Gap maior que STATE_INTERVAL_MAX_GAP_SEC (10 s): sem dados, não conta tempo
+    _ingest(client, '2025-11-14T10:01:00Z', 1000.0)
+    _ingest(client, '2025-11-14T10:01:04Z', 0.0, state='stopped')
+    # Atrasada: refaz os intervalos em volta dela
+    _ingest(client, '2025-11-14T10:00:20Z', 1000.0)
+
+    def intervals():
+        rows = db_session.execute(
+            select(StateInterval.start_ts, StateInterval.end_ts, StateInterval.state, StateInterval.sample_count)
+            .order_by(StateInterval.start_ts)
+        ).all()
+        db_session.commit()
+        return [(start.strftime('%H:%M:%S'), end.strftime('%H:%M:%S'), state, count) for start, end, state, count in rows]
+
+    incremental = intervals()
+    assert incremental == [
+        ('10:00:00', '10:00:10', 'running', 2),
+        ('10:00:10', '10:00:15', 'idle', 2),
+        ('10:00:15', '10:00:20', 'running', 2),
+        ('10:01:00', '10:01:04', 'running', 1),
+        ('10:01:04', '10:01:04', 'stopped', 1),
+    ]
+    state_intervals.rebuild(
+        db_session, 'CNC-01',
+        datetime(2025, 11, 14, tzinfo=timezone.utc), datetime(2025, 11, 15, tzinfo=timezone.utc),
+    )
+    db_session.commit()
+    assert intervals() == incremental
+
+    durations = state_intervals.state_durations(
+        db_session, 'CNC-01',
+        datetime(2025, 11, 14, 10, 0, 5, tzinfo=timezone.utc), datetime(2025, 11, 14, 11, tzinfo=timezone.utc),
+    )
+    assert durations == {'running': 14.0, 'stopped': 0.0, 'idle': 5.0}
+
+    oee = client.get('/v1/machines/CNC-01/oee?date=2025-11-14').json()
+    assert oee['operating_time_min'] == round(19 / 60, 2)
+    summary = client.get(
+        '/v1/machines/CNC-01/history/summary?from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T10:05:00Z'
+    ).json()
+    assert summary['total_samples'] == 8
+    assert summary['time_distribution']['total_min'] == round(24 / 60, 1)
+
+
+def test_missing_state_intervals_table_keeps_ingest_and_summaries(client, db_session):
+    from backend.app.db import StateInterval
+    from backend.app.services import state_intervals
+
+    bind = db_session.get_bind()
+    StateInterval.__table__.drop(bind)
+    try:
+        # Banco anterior à tabela: as amostras são gravadas mesmo assim
+        for second in range(0, 30, 5):
+            _ingest(client, f'2025-11-14T10:00:{second:02d}Z', 1000.0)
+        assert len(db_session.execute(select(Telemetry.ts)).all()) == 6
+        db_session.commit()
+
+        summary = client.get(
+            '/v1/machines/CNC-01/history/summary?from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T10:05:00Z'
+        )
+        assert summary.status_code == 200
+        estimated_min = round(6 * state_intervals.SAMPLE_INTERVAL_SEC / 60, 1)
+        assert summary.json()['time_distribution']['total_min'] == estimated_min
+        assert client.get('/v1/machines/CNC-01/oee?date=2025-11-14').status_code == 200
+    finally:
+        state_intervals.create_state_interval_table(bind)
+
+    # Tabela criada sem backfill: janela sem intervalos continua na estimativa por amostras
+    summary = client.get(
+        '/v1/machines/CNC-01/history/summary?from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T10:05:00Z'
+    ).json()
+    assert summary['time_distribution']['total_min'] == estimated_min
+
+
+def test_fleet_history_and_summary_match_per_machine(client, session_factory, monkeypatch):
+    from backend.app.routers import history as history_router
+    from backend.app.services.rollup import RollupEngine
+
+    for second, state in ((0, 'running'), (5, 'running'), (10, 'idle')):
+        _ingest(client, f'2025-11-14T10:00:{second:02d}Z', 1000.0 + second, state=state)
+    for second in (2, 6):
+        _ingest(client, f'2025-11-14T10:00:{second:02d}Z', 500.0, machine_id='CNC-02')
+    RollupEngine(session_factory, overlap_sec=0).run_once()
+
+    window = 'from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T11:00:00Z'
+    fleet = client.get(f'/v1/fleet/history/summary?ids=CNC-01,CNC-02,CNC-09&{window}').json()
+    assert [item['machine_id'] for item in fleet['machines']] == ['CNC-01', 'CNC-02']
+    assert fleet['missing'] == ['CNC-09']
+    for item in fleet['machines']:
+        single = client.get(f"/v1/machines/{item['machine_id']}/history/summary?{window}").json()
+        assert item == single
+
+    monkeypatch.setattr(history_router, 'MACHINE_GROUPS', {'linha-2': ['CNC-02']})
+    grouped = client.get(f'/v1/fleet/history/summary?group=linha-2&{window}').json()
+    assert [item['machine_id'] for item in grouped['machines']] == ['CNC-02']
+    assert client.get(f'/v1/fleet/history/summary?group=nope&{window}').status_code == 404
+
+    history = client.get(f'/v1/fleet/history?resolution=raw&limit=2&{window}').json()
+    assert sorted(history['machines']) == ['CNC-01', 'CNC-02'] and history['missing'] == []
+    for machine_id, rows in history['machines'].items():
+        assert rows == client.get(f'/v1/machines/{machine_id}/history?resolution=raw&limit=2&{window}').json()
+    bucketed = client.get(f'/v1/fleet/history?ids=CNC-02&resolution=5m&{window}').json()
+    assert bucketed['machines']['CNC-02'][0]['sample_count'] == 2
+
+
+def test_history_auto_resolution_and_fields_projection(client, session_factory):
+    from backend.app.services.rollup import RollupEngine
+
+    _ingest(client, '2025-11-14T10:01:00Z', 1000.0)
+    _ingest(client, '2025-11-14T10:02:00Z', 3000.0, state='idle')
+    RollupEngine(session_factory, overlap_sec=0).run_once()
+
+    def pick(window, min_points=None):
+        url = f'/v1/machines/CNC-01/history?resolution=auto&{window}'
+        response = client.get(url + (f'&min_points={min_points}' if min_points else ''))
+        assert response.status_code == 200
+        return response.headers['X-History-Resolution']
+
+    assert pick('from_ts=2025-11-01T00:00:00Z&to_ts=2025-11-15T00:00:00Z', 10) == '1d'
+    assert pick('from_ts=2025-11-13T00:00:00Z&to_ts=2025-11-15T00:00:00Z', 24) == '1h'
+    assert pick('from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T11:00:00Z', 12) == '5m'
+    assert pick('from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T11:00:00Z') == 'raw'
+
+    window = 'from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T11:00:00Z'
+    rows = client.get(f'/v1/machines/CNC-01/history?resolution=raw&fields=rpm,mode&{window}').json()
+    assert rows == [
+        {'timestamp_utc': '2025-11-14T10:02:00Z', 'rpm': 3000.0, 'mode': 'IDLE'},
+        {'timestamp_utc': '2025-11-14T10:01:00Z', 'rpm': 1000.0, 'mode': 'RUNNING'},
+    ]
+    # Colunas não pedidas nem chegam a ser selecionadas
+    columnar = client.get(f'/v1/machines/CNC-01/history?resolution=5m&format=columnar&fields=rpm,uptime_ratio&{window}')
+    assert set(columnar.json()['columns']) == {'timestamp_utc', 'rpm', 'uptime_ratio'}
+    csv_body = client.get(f'/v1/machines/CNC-01/history?resolution=raw&format=csv&fields=rpm&{window}').text
+    assert csv_body.splitlines()[0] == 'timestamp_utc,rpm'
+    assert client.get(f'/v1/machines/CNC-01/history?fields=rpm,bogus&{window}').status_code == 400
+
+
+def test_history_max_points_downsamples_raw(client, db_session):
+    base = datetime(2025, 11, 14, 10, 0, tzinfo=timezone.utc)
+    for offset in range(500):
+        db_session.add(Telemetry(
+            ts=base + timedelta(seconds=2 * offset),
+            machine_id='CNC-01',
+            rpm=9000.0 if offset == 250 else 1000.0 + offset % 7,
+            feed_mm_min=100.0,
+            state='running',
+            sequence=offset,
+        ))
+    db_session.commit()
+
+    window = 'from_ts=2025-11-14T10:00:00Z&to_ts=2025-11-14T11:00:00Z'
+    rows = client.get(f'/v1/machines/CNC-01/history?resolution=raw&max_points=50&limit=10&{window}').json()
+    assert len(rows) == 50
+    # Mais recente primeiro, extremos preservados e o pico não se perde
+    assert rows[0]['sequence'] == 499 and rows[-1]['timestamp_utc'] == '2025-11-14T10:00:00Z'
+    assert [row['timestamp_utc'] for row in rows] == sorted((row['timestamp_utc'] for row in rows), reverse=True)
+    assert max(row['rpm'] for row in rows) == 9000.0
+
+
+def test_lttb_numpy_and_python_agree():
+    import random
+
+    from backend.app.services import downsample
+
+    rng = random.Random(7)
+    xs = [float(i) for i in range(1000)]
+    ys = [rng.uniform(0, 100) for _ in xs]
+    expected = downsample._lttb_python(xs, ys, 100)
+    assert len(expected) == 100 and expected[0] == 0 and expected[-1] == 999
+    if downsample.np is not None:
+        assert downsample._lttb_numpy(xs, ys, 100) == expected
+    assert downsample.lttb_indices(xs, ys, 2000) == list(range(1000))
+
+
+def test_history_streams_ndjson_and_csv(client, db_session, monkeypatch):
+    import json
+
+    from backend.app.routers import history
+
+    # Lotes pequenos: o corpo sai em vários pedaços do cursor
+    monkeypatch.setattr(history, 'HISTORY_EXPORT_CHUNK_ROWS', 3)
+    base = datetime(2025, 11, 14, 10, 0, tzinfo=timezone.utc)
+    for offset in range(10):
+        db_session.add(Telemetry(
+            ts=base + timedelta(seconds=offset), machine_id='CNC-01', rpm=1000.0 + offset,
+            feed_mm_min=50.0, state='running', sequence=offset + 1,
+        ))
+    db_session.commit()
+
+    window = 'resolution=raw&limit=2&from_ts=2025-11-14T09:00:00Z&to_ts=2025-11-14T11:00:00Z'
+    response = client.get(f'/v1/machines/CNC-01/history?{window}&format=ndjson')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['sequence'] for line in lines] == list(range(10, 0, -1))  # limit não se aplica
+
+    response = client.get(f'/v1/machines/CNC-01/history?{window}&format=csv')
+    assert response.headers['content-type'].startswith('text/csv')
+    header, first, *rest = response.text.splitlines()
+    assert header.split(',')[:4] == ['timestamp_utc', 'machine_id', 'rpm', 'feed_mm_min']
+    assert first.startswith('2025-11-14T10:00:09Z,CNC-01,1009.0,50.0,RUNNING,EXECUTING')
+    assert len(rest) == 9
+
+
+def test_history_columnar_and_arrow_formats(client, db_session):
+    base = datetime(2025, 11, 14, 10, 0, tzinfo=timezone.utc)
+    for offset in range(3):
+        db_session.add(Telemetry(
+            ts=base + timedelta(seconds=offset), machine_id='CNC-01', rpm=1000.25 + offset,
+            feed_mm_min=50.0, state='idle' if offset else 'running', sequence=offset + 1,
+        ))
+    db_session.commit()
+
+    window = 'resolution=raw&from_ts=2025-11-14T09:00:00Z&to_ts=2025-11-14T11:00:00Z'
+    payload = client.get(f'/v1/machines/CNC-01/history?{window}&format=columnar').json()
+    assert payload['count'] == 3 and payload['resolution'] == 'raw'
+    columns = payload['columns']
+    assert columns['timestamp_utc'][0] == '2025-11-14T10:00:02Z'
+    assert columns['rpm'] == [1002.25, 1001.25, 1000.25]
+    assert columns['state'] == ['idle', 'idle', 'running']
+    assert columns['sequence'] == [3, 2, 1]
+
+    pa = pytest.importorskip('pyarrow')
+    response = client.get(f'/v1/machines/CNC-01/history?{window}&format=arrow')
+    assert response.headers['content-type'] == 'application/vnd.apache.arrow.stream'
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == list(columns)
+    assert table.column('rpm').to_pylist() == columns['rpm']
+    assert str(table.schema.field('timestamp_utc').type) == 'timestamp[us, tz=UTC]'
+
+
+def test_history_cache_invalidated_only_by_overlapping_rollups(client, session_factory):
+    from backend.app.routers.history import HISTORY_CACHE
+    from backend.app.services.rollup import RollupEngine
+
+    HISTORY_CACHE.enabled = True
+    rollups = RollupEngine(session_factory, overlap_sec=0, on_change=HISTORY_CACHE.changes.record)
+    _ingest(client, '2025-11-14T10:10:00Z', 1000.0)
+    _ingest(client, '2025-11-14T12:10:00Z', 2000.0)
+    rollups.run_once()
+
+    # Limites não alinhados caem no mesmo intervalo de buckets (mesma chave)
+    past = '/v1/machines/CNC-01/history?resolution=1h&from_ts=2025-11-14T09:30:00Z&to_ts=2025-11-14T11:59:00Z'
+    same_buckets = '/v1/machines/CNC-01/history?resolution=1h&from_ts=2025-11-14T09:01:00Z&to_ts=2025-11-14T11:00:00Z'
+    first = client.get(past).json()
+    assert [row['rpm'] for row in first] == [1000.0]
+    assert client.get(same_buckets).json() == first
+    assert HISTORY_CACHE.metrics()['hits'] == 1
+
+    # Dado novo só na hora 12:00: a janela passada continua em cache
+    _ingest(client, '2025-11-14T12:20:00Z', 3000.0)
+    rollups.run_once()
+    assert client.get(past).json() == first
+    assert HISTORY_CACHE.metrics()['hits'] == 2
+
+    # Amostra atrasada dentro da janela: invalida e relê
+    _ingest(client, '2025-11-14T10:40:00Z', 3000.0)
+    rollups.run_once()
+    assert [row['rpm'] for row in client.get(past).json()] == [2000.0]
+    metrics = HISTORY_CACHE.metrics()
+    assert metrics['invalidations'] == 1 and metrics['hits'] == 2
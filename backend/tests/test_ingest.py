@@ -0,0 +1,320 @@
+import json
+
+from backend.app.db import Telemetry, TelemetryEvents
+
+
+def _sample(machine_id: str, second: int, state: str = "running", rpm: float = 3000.0) -> dict:
+    return {
+        "machine_id": machine_id,
+        "timestamp": f"2025-11-14T12:00:{second:02d}Z",
+        "rpm": rpm,
+        "feed_mm_min": 500.0,
+        "state": state,
+    }
+
+
+def test_ingest_single_persists_and_updates_status(client, db_session):
+    response = client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 0))
+    assert response.status_code == 201
+    assert response.json()["ingested"] is True
+
+    assert db_session.query(Telemetry).count() == 1
+    status = client.get("/v1/machines/CNC-01/status").json()
+    assert status["execution"] == "EXECUTING"
+    assert status["rpm"] == 3000.0
+
+
+def test_ingest_batch_json_array_reports_per_item(client, db_session):
+    client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 0))
+
+    batch = [
+        _sample("CNC-01", 0),  # já existe no banco
+        _sample("CNC-01", 1),
+        _sample("CNC-01", 2, state="stopped", rpm=0.0),
+        _sample("CNC-02", 1),
+        _sample("CNC-02", 1),  # repetido dentro do lote
+        {"machine_id": "CNC-03", "timestamp": "2025-11-14T12:00:00Z", "rpm": -1, "feed_mm_min": 0, "state": "idle"},
+    ]
+    response = client.post("/v1/telemetry/ingest/batch", json=batch)
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["received"] == 6
+    assert body["ingested"] == 3
+    assert body["duplicates"] == 2
+    assert body["invalid"] == 1
+    assert [item["status"] for item in body["results"]] == [
+        "duplicate", "stored", "stored", "stored", "duplicate", "invalid",
+    ]
+
+    assert db_session.query(Telemetry).count() == 4
+    status = client.get("/v1/machines/CNC-01/status").json()
+    assert status["execution"] == "STOPPED"
+    assert status["timestamp_utc"] == "2025-11-14T12:00:02Z"
+
+
+def test_ingest_batch_ndjson(client, db_session):
+    body = "\n".join(json.dumps(_sample(f"CNC-{idx:02d}", idx)) for idx in range(10))
+    response = client.post(
+        "/v1/telemetry/ingest/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json()["ingested"] == 10
+    assert response.json()["machines"] == 10
+    assert db_session.query(TelemetryEvents).count() == 10
+
+
+def test_ingest_batch_rejects_non_array(client):
+    response = client.post("/v1/telemetry/ingest/batch", json={"machine_id": "CNC-01"})
+    assert response.status_code == 400
+
+
+def test_write_behind_defers_rows_until_flush(client, db_session, session_factory, monkeypatch):
+    from backend.app.services import ingest as ingest_service
+    from backend.app.services.write_behind import WriteBehindBuffer
+
+    buffer = WriteBehindBuffer(ingest_service._flush_with(session_factory), flush_interval_sec=60)
+    monkeypatch.setattr(ingest_service, "_write_behind", buffer)
+
+    response = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", idx, rpm=1000.0 * (idx + 1)) for idx in range(3)])
+    assert response.json()["queued"] == 3
+    assert db_session.query(Telemetry).count() == 0
+    # Status em memória é atualizado sem esperar o commit
+    assert client.get("/v1/machines/CNC-01/status").json()["timestamp_utc"] == "2025-11-14T12:00:02Z"
+
+    assert buffer.flush() == 6  # 3 amostras + 3 eventos
+    assert db_session.query(Telemetry).count() == 3
+    assert db_session.query(TelemetryEvents).count() == 3
+
+    metrics = buffer.metrics()
+    assert metrics["flushes"] == 1
+    assert metrics["queue_depth"] == 0
+    assert metrics["queue_max_depth"] == 6
+
+
+def test_write_behind_queue_is_bounded():
+    from backend.app.services.write_behind import WriteBehindBuffer
+
+    flushed = []
+    buffer = WriteBehindBuffer(lambda samples, events: flushed.append(len(samples)), max_rows=4)
+    buffer.submit([1, 2, 3], [])
+    buffer.submit([4, 5, 6], [])  # excederia o limite: produtor faz flush síncrono antes
+    assert flushed == [3]
+    assert buffer.depth == 3
+    buffer.stop()
+    assert flushed == [3, 3]
+
+
+def test_ingest_replays_are_rejected_and_counted(client, db_session):
+    from backend.app.services import ingest as ingest_service
+
+    batch = [_sample("CNC-01", idx, rpm=1000.0 * (idx + 1)) for idx in range(3)]
+    assert client.post("/v1/telemetry/ingest/batch", json=batch).json()["ingested"] == 3
+
+    # Retry storm do adapter: recusado pelo LRU, sem tocar o banco
+    replay = client.post("/v1/telemetry/ingest/batch", json=batch).json()
+    assert replay["duplicates"] == 3
+
+    # Com o LRU frio, o ON CONFLICT DO NOTHING do banco resolve
+    ingest_service._recent_keys.clear()
+    replay = client.post("/v1/telemetry/ingest/batch", json=batch + [_sample("CNC-01", 3, rpm=4000.0)]).json()
+    assert replay["duplicates"] == 3
+    assert replay["ingested"] == 1
+
+    assert db_session.query(Telemetry).count() == 4
+    assert db_session.query(TelemetryEvents).count() == 4
+
+    stats = ingest_service.get_duplicate_stats()
+    assert stats["per_machine"]["CNC-01"] == {"cache": 3, "database": 3}
+
+
+def test_ingest_stream_acks_frames_in_order(client, db_session):
+    with client.websocket_connect("/v1/telemetry/stream") as ws:
+        hello = ws.receive_json()
+        assert hello["type"] == "hello"
+        assert hello["window"] >= 1
+
+        for seq in (1, 2):
+            ws.send_json({"seq": seq, "samples": [_sample(f"GW-{m:02d}", seq) for m in range(5)]})
+        ws.send_json({"seq": 2, "samples": []})  # seq repetido
+        ws.send_json({"seq": 3, "samples": [_sample("GW-00", 3), {"machine_id": "GW-00"}]})
+
+        acks = [ws.receive_json() for _ in range(4)]
+
+    assert [(a["type"], a["seq"]) for a in acks if a["type"] == "ack"] == [("ack", 1), ("ack", 2), ("ack", 3)]
+    error = next(a for a in acks if a["type"] == "error")
+    assert error["seq"] == 2
+    last = next(a for a in acks if a["type"] == "ack" and a["seq"] == 3)
+    assert last["ingested"] == 1
+    assert last["invalid"] == 1
+    assert last["errors"][0]["index"] == 1
+
+    assert db_session.query(Telemetry).count() == 11
+    assert client.get("/v1/machines/GW-03/status").json()["timestamp_utc"] == "2025-11-14T12:00:02Z"
+
+
+def test_ingest_batch_binary_frame(client, db_session):
+    from backend.app.services.frame_codec import CONTENT_TYPE, decode_frame, encode_frame
+
+    samples = [_sample("CNC-01", idx, rpm=1234.5) for idx in range(3)] + [_sample("CNC-02", 0, state="idle", rpm=0.0)]
+    frame = encode_frame(samples)
+    assert len(frame) < len(json.dumps(samples)) / 3
+
+    decoded = decode_frame(frame)
+    assert decoded.machine_ids == ["CNC-01", "CNC-02"]
+    assert list(decoded.machine_idx) == [0, 0, 0, 1]
+
+    response = client.post("/v1/telemetry/ingest/batch", content=frame, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 200
+    assert response.json()["ingested"] == 4
+
+    status = client.get("/v1/machines/CNC-01/status").json()
+    assert status["rpm"] == 1234.5
+    assert status["timestamp_utc"] == "2025-11-14T12:00:02Z"
+    assert client.get("/v1/machines/CNC-02/status").json()["execution"] == "READY"
+
+    truncated = client.post("/v1/telemetry/ingest/batch", content=frame[:-3], headers={"Content-Type": CONTENT_TYPE})
+    assert truncated.status_code == 400
+
+
+def test_ingest_stream_binary_frame(client, db_session):
+    from backend.app.services.frame_codec import encode_frame
+
+    with client.websocket_connect("/v1/telemetry/stream") as ws:
+        ws.receive_json()
+        ws.send_bytes(encode_frame([_sample("GW-01", 0), _sample("GW-02", 0)], seq=7))
+        ack = ws.receive_json()
+
+    assert (ack["type"], ack["seq"], ack["ingested"]) == ("ack", 7, 2)
+    assert db_session.query(Telemetry).count() == 2
+
+
+def test_spool_parks_samples_while_database_is_down(client, db_session, session_factory, monkeypatch, tmp_path):
+    from backend.app.services import ingest as ingest_service
+    from backend.app.services.spool import DiskSpool
+
+    flush = ingest_service._flush_with(session_factory)
+    spool = DiskSpool(tmp_path, lambda records: flush(*ingest_service._decode_spool_records(records)))
+    monkeypatch.setattr(ingest_service, "_spool", spool)
+
+    def database_down(*args, **kwargs):
+        raise RuntimeError("connection refused")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(ingest_service, "store_telemetry", database_down)
+        summary = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", 0), _sample("CNC-02", 0)]).json()
+        assert summary["spooled"] == 2
+        assert spool.degraded
+
+    # Com backlog no disco, novas amostras seguem para o spool (ordem preservada)
+    client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 1, state="stopped", rpm=0.0))
+    assert db_session.query(Telemetry).count() == 0
+    assert client.get("/v1/machines/CNC-01/status").json()["execution"] == "STOPPED"
+
+    assert spool.drain_once() == 6  # 3 amostras + 3 eventos
+    assert db_session.query(Telemetry).count() == 3
+    assert db_session.query(TelemetryEvents).count() == 3
+    assert not spool.degraded
+
+    metrics = spool.metrics()
+    assert metrics["records_spooled"] == 6
+    assert metrics["records_drained"] == 6
+    assert metrics["pending_bytes"] == 0
+
+    summary = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", 2)]).json()
+    assert summary["ingested"] == 1
+
+
+def test_spool_recovers_segments_and_skips_torn_tail(tmp_path):
+    from backend.app.services.spool import DiskSpool
+
+    def database_down(records):
+        raise RuntimeError("connection refused")
+
+    spool = DiskSpool(tmp_path, database_down, segment_bytes=64)
+    assert spool.append([b"a" * 40, b"b" * 40, b"c" * 40])
+    spool.stop()  # última drenagem falha: segmentos ficam no disco
+    assert spool.metrics()["drain_errors"] == 1
+    segments = sorted(tmp_path.glob("spool-*.seg"))
+    assert len(segments) == 3
+    with segments[-1].open("ab") as handle:
+        handle.write(b"\x10\x00\x00\x00partial")  # queda no meio de uma escrita
+
+    drained = []
+    reopened = DiskSpool(tmp_path, drained.extend, max_bytes=256)
+    assert reopened.degraded
+    assert reopened.drain_once() == 3
+    assert drained == [b"a" * 40, b"b" * 40, b"c" * 40]
+    assert reopened.metrics()["corrupt_records"] == 1
+    assert list(tmp_path.glob("spool-*.seg")) == []
+
+    # Limite de tamanho: append recusado por inteiro
+    assert not reopened.append([b"x" * 200, b"y" * 200])
+    assert reopened.metrics()["records_rejected"] == 2
+
+
+def test_ingest_overload_returns_429_with_retry_after(client, monkeypatch):
+    from backend.app.routers import ingest as ingest_router
+    from backend.app.services.admission import AdmissionController
+
+    admission = AdmissionController(max_in_flight=1, retry_after_sec=2.5)
+    monkeypatch.setattr(ingest_router, "ADMISSION", admission)
+
+    assert admission.try_enter() is None  # outra requisição ocupando a única vaga
+    response = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", 0), _sample("CNC-01", 1)])
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+    admission.leave()
+    assert client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 0)).status_code == 201
+    metrics = admission.metrics()
+    assert metrics["rejected_overload"] == 2
+    assert metrics["accepted_samples"] == 1
+    assert metrics["in_flight"] == 0
+
+
+def test_ingest_per_machine_token_bucket(client, db_session, monkeypatch):
+    from backend.app.routers import ingest as ingest_router
+    from backend.app.services.admission import AdmissionController
+
+    now = [100.0]
+    admission = AdmissionController(machine_rate=1.0, machine_burst=2, clock=lambda: now[0])
+    monkeypatch.setattr(ingest_router, "ADMISSION", admission)
+
+    batch = [_sample("CNC-01", 0), _sample("CNC-01", 1), _sample("CNC-02", 0)]
+    assert client.post("/v1/telemetry/ingest/batch", json=batch).json()["ingested"] == 3
+
+    # CNC-01 esgotou o balde; CNC-02 ainda tem saldo
+    response = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", 2), _sample("CNC-02", 1)])
+    summary = response.json()
+    assert [r["status"] for r in summary["results"]] == ["throttled", "stored"]
+    assert response.headers["Retry-After"] == "1"
+
+    response = client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 2))
+    assert response.status_code == 429
+
+    now[0] += 1.0  # reabastece 1 token
+    assert client.post("/v1/telemetry/ingest", json=_sample("CNC-01", 2)).status_code == 201
+    assert db_session.query(Telemetry).count() == 5
+    assert admission.metrics()["rejected_rate_limited"] == 2
+
+
+def test_server_timing_phases_and_metrics_histograms(client):
+    response = client.post("/v1/telemetry/ingest/batch", json=[_sample("CNC-01", 0), _sample("CNC-02", 0)])
+    phases = {
+        entry.split(";")[0]: float(entry.split("dur=")[1])
+        for entry in response.headers["Server-Timing"].split(", ")
+    }
+    assert {"validation", "db_acquire", "sql", "commit", "status", "total"} <= set(phases)
+    assert phases["total"] >= phases["sql"]
+
+    metrics = client.get("/metrics").text
+    assert (
+        'cnc_http_request_duration_seconds_count{method="POST",route="/v1/telemetry/ingest/batch",status="200"} 1'
+        in metrics
+    )
+    assert 'cnc_http_phase_duration_seconds_bucket{phase="commit",route="/v1/telemetry/ingest/batch",le="+Inf"} 1' in metrics
+    # Contadores do /healthz no mesmo endpoint
+    assert "cnc_ingest_admission_accepted_samples 2" in metrics
@@ -1,4 +1,8 @@
-from app.routers import status as status_router
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.app.routers import status as status_router
 
 
 def test_status_contract(client):
@@ -45,3 +49,196 @@ def test_status_handles_null_fields(client):
     assert data["spindle_load_pct"] is None
     assert data["alarm_code"] is None
     assert data["alarm_message"] is None
+
+
+def test_status_etag_not_modified_and_long_poll(client):
+    import threading
+    import time
+
+    sample = {
+        "machine_id": "CNC-01",
+        "timestamp": "2025-11-14T12:00:00Z",
+        "rpm": 3000.0,
+        "feed_mm_min": 500.0,
+        "state": "running",
+    }
+    client.post("/v1/telemetry/ingest", json=sample)
+    first = client.get("/v1/machines/CNC-01/status")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    cached = client.get("/v1/machines/CNC-01/status", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    # Long-poll: a requisição fica presa até o status mudar
+    updated = status_router._build_status(
+        "CNC-01", 3500.0, 500.0, "EXECUTING", datetime(2025, 11, 14, 12, 0, 1, tzinfo=timezone.utc), None, None
+    )
+    timer = threading.Timer(0.3, status_router.LAST_STATUS.__setitem__, ("CNC-01", updated))
+    timer.start()
+    started = time.monotonic()
+    changed = client.get("/v1/machines/CNC-01/status?wait=5", headers={"If-None-Match": etag})
+    timer.join()
+    assert changed.status_code == 200
+    assert changed.json()["rpm"] == 3500.0
+    assert changed.headers["etag"] != etag
+    assert 0.2 < time.monotonic() - started < 5
+
+    # Sem mudança, o long-poll expira em 304
+    idle = client.get(
+        "/v1/machines/CNC-01/status?wait=0.3", headers={"If-None-Match": changed.headers["etag"]}
+    )
+    assert idle.status_code == 304
+
+
+def _write_status_in_other_process(path, machine_id):
+    from backend.app.services.status_store import MmapStatusStore
+
+    store = MmapStatusStore(bytes, bytes, path=path, slots=8)
+    store.set_bytes(machine_id, b'{"rpm": 1200}')
+    store.close()
+
+
+def test_mmap_status_store_is_shared_between_processes(tmp_path):
+    import multiprocessing
+
+    from backend.app.services.status_store import MmapStatusStore
+
+    path = tmp_path / "status.bin"
+    store = MmapStatusStore(bytes, bytes, path=path, slots=8)
+    store.set_bytes("CNC-01", b'{"rpm": 0}')
+    version = store.key_version("CNC-01")
+    assert version % 2 == 0 and version > 0
+
+    worker = multiprocessing.get_context("spawn").Process(
+        target=_write_status_in_other_process, args=(path, "CNC-01")
+    )
+    worker.start()
+    worker.join(timeout=30)
+    assert worker.exitcode == 0
+
+    # Leitor sem lock enxerga a escrita do outro processo, com versões novas
+    assert store.get_bytes("CNC-01") == b'{"rpm": 1200}'
+    assert store.key_version("CNC-01") > version
+    assert store.version == 2
+
+
+def test_mmap_status_store_mapping_semantics(tmp_path):
+    from backend.app.services.status_store import MmapStatusStore
+
+    store = MmapStatusStore(bytes, bytes, path=tmp_path / "status.bin", slots=4, slot_size=128)
+    for idx in range(4):
+        store[f"CNC-{idx}"] = f"status-{idx}".encode()
+    assert sorted(store) == ["CNC-0", "CNC-1", "CNC-2", "CNC-3"]
+    with pytest.raises(ValueError):
+        store["CNC-9"] = b"sem slot livre"
+
+    # Remoção deixa tombstone: o slot é reaproveitado e as cadeias de sondagem seguem válidas
+    del store["CNC-1"]
+    assert "CNC-1" not in store
+    store["CNC-9"] = b"ok"
+    assert store["CNC-9"] == b"ok"
+    assert all(store[f"CNC-{idx}"] == f"status-{idx}".encode() for idx in (0, 2, 3))
+    with pytest.raises(ValueError):
+        store["CNC-0"] = b"x" * 200  # maior que o slot
+
+    # Reabrir o arquivo mantém o conteúdo (outro worker / restart)
+    reopened = MmapStatusStore(bytes, bytes, path=tmp_path / "status.bin", slots=4, slot_size=128)
+    assert reopened["CNC-9"] == b"ok"
+    reopened.clear()
+    assert len(store) == 0
+
+
+def test_fleet_status_returns_many_machines_in_one_response(client):
+    batch = [
+        {
+            "machine_id": f"CNC-{idx:02d}",
+            "timestamp": "2025-11-14T12:00:00Z",
+            "rpm": 1000.0 + idx,
+            "feed_mm_min": 500.0,
+            "state": "running",
+        }
+        for idx in range(3)
+    ]
+    client.post("/v1/telemetry/ingest/batch", json=batch)
+
+    fleet = client.get("/v1/machines/status").json()
+    assert fleet["count"] == 3
+    assert [m["machine_id"] for m in fleet["machines"]] == ["CNC-00", "CNC-01", "CNC-02"]
+    # Mesmo contrato do endpoint por máquina
+    assert fleet["machines"][1] == client.get("/v1/machines/CNC-01/status").json()
+
+    subset = client.get("/v1/machines/status?ids=CNC-02,CNC-00,NOPE").json()
+    assert [m["machine_id"] for m in subset["machines"]] == ["CNC-02", "CNC-00"]
+    assert subset["missing"] == ["NOPE"]
+
+
+def _receive_until(ws, wanted_types):
+    received = {}
+    while not set(wanted_types) <= set(received):
+        message = ws.receive_json()
+        received[message["type"]] = message
+    return received
+
+
+def test_status_push_sends_snapshot_then_changed_fields(client):
+    sample = {
+        "machine_id": "CNC-01",
+        "timestamp": "2025-11-14T12:00:00Z",
+        "rpm": 3000.0,
+        "feed_mm_min": 500.0,
+        "state": "running",
+    }
+    with client.websocket_connect("/v1/machines/ws?ids=CNC-01") as ws:
+        assert ws.receive_json() == {"type": "snapshot", "machines": []}
+
+        client.post("/v1/telemetry/ingest", json=sample)
+        first = _receive_until(ws, ["status", "event"])
+        assert first["status"]["full"] is True
+        assert first["status"]["changed"]["rpm"] == 3000.0
+        assert first["event"]["event"]["execution"] == "EXECUTING"
+
+        client.post("/v1/telemetry/ingest", json=dict(sample, timestamp="2025-11-14T12:00:01Z", rpm=3500.0))
+        second = _receive_until(ws, ["status", "event"])
+        assert second["status"]["changed"] == {"timestamp_utc": "2025-11-14T12:00:01Z", "rpm": 3500.0}
+
+        # Lote: o evento chega pelo push só depois de gravado no histórico
+        client.post("/v1/telemetry/ingest/batch", json=[
+            dict(sample, timestamp="2025-11-14T12:00:02Z", rpm=0.0, state="idle"),
+            dict(sample, timestamp="2025-11-14T12:00:03Z", rpm=0.0, state="idle"),
+        ])
+        third = _receive_until(ws, ["status", "event"])
+        assert third["event"]["event"]["execution"] == "READY"
+        history = client.get("/v1/machines/CNC-01/events?limit=10").json()
+        assert any(event["execution"] == "READY" for event in history)
+
+        # Outra máquina não chega até assinar; a assinatura traz snapshot dela
+        client.post("/v1/telemetry/ingest", json=dict(sample, machine_id="CNC-02"))
+        ws.send_json({"action": "subscribe", "ids": ["CNC-02"]})
+        snapshot = ws.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert [m["machine_id"] for m in snapshot["machines"]] == ["CNC-02"]
+
+
+def test_status_push_slow_consumer_gets_resync_snapshot():
+    import asyncio
+
+    from backend.app.services.status_broker import StatusBroker
+    from backend.app.services.status_store import MemoryStatusStore
+
+    async def scenario():
+        store = MemoryStatusStore(lambda v: v, lambda v: v)
+        broker = StatusBroker(store, queue_size=2)
+        subscriber = broker.subscribe(["CNC-01"])
+        for rpm in range(5):
+            store.set_bytes("CNC-01", b'{"machine_id": "CNC-01", "rpm": %d}' % rpm)
+            broker.poll()
+        # Fila estourou: mensagens antigas descartadas, cliente recebe o estado atual
+        message = await subscriber.next()
+        assert message == {"type": "snapshot", "machines": [{"machine_id": "CNC-01", "rpm": 4}], "resync": True}
+        assert subscriber.queue.empty()
+        assert broker.metrics()["resyncs"] == 1
+
+    asyncio.run(scenario())
@@ -1,10 +1,19 @@
 import { useEffect, useState } from "react";
-import { fetchMachineStatus, fetchMachineEvents, MachineStatus, MachineEvent, ApiError } from "./lib/api";
+import {
+  fetchMachineStatus,
+  fetchMachineEvents,
+  subscribeMachineStream,
+  MachineStatus,
+  MachineEvent,
+  MachineStreamMessage,
+  ApiError,
+} from "./lib/api";
 import { OEECard } from "./components/OEECard";
 import { MACHINE_ID } from "./config/machine";
 
 const POLL_INTERVAL_MS = 1000;
-const EVENTS_POLL_INTERVAL_MS = 10000; // 10s para eventos
+const EVENTS_POLL_INTERVAL_MS = 10000; // 10s para eventos (fallback sem SSE)
+const EVENTS_LIMIT = 20;
 
 export default function App() {
   const [status, setStatus] = useState<MachineStatus | null>(null);
@@ -14,8 +23,18 @@ export default function App() {
   const [events, setEvents] = useState<MachineEvent[]>([]);
   const [eventsError, setEventsError] = useState<string | null>(null);
 
+  // Idade do último status recebido (push ou polling) define o badge de conexão
+  function updateConnection(data: MachineStatus) {
+    const timeDiff = Date.now() - new Date(data.timestamp_utc).getTime();
+    const maxDelay = 3 * data.update_interval_ms; // 3 seconds for 1s updates
+    setConnectionStatus(timeDiff > maxDelay ? "unstable" : "connected");
+  }
+
   useEffect(() => {
     let isMounted = true;
+    let intervalId: ReturnType<typeof setInterval> | undefined;
+    let eventsIntervalId: ReturnType<typeof setInterval> | undefined;
+    let closeStream: (() => void) | undefined;
 
     async function poll() {
       try {
@@ -24,18 +43,7 @@ export default function App() {
           setStatus(data);
           setError(null);
           setIsLoading(false);
-          
-          // Check connection status based on timestamp
-          const now = new Date();
-          const dataTime = new Date(data.timestamp_utc);
-          const timeDiff = now.getTime() - dataTime.getTime();
-          const maxDelay = 3 * data.update_interval_ms; // 3 seconds for 1s polling
-          
-          if (timeDiff > maxDelay) {
-            setConnectionStatus("unstable");
-          } else {
-            setConnectionStatus("connected");
-          }
+          updateConnection(data);
         }
       } catch (e) {
         if (isMounted) {
@@ -50,22 +58,10 @@ export default function App() {
       }
     }
 
-    poll();
-    const intervalId = setInterval(poll, POLL_INTERVAL_MS);
-
-    return () => {
-      isMounted = false;
-      clearInterval(intervalId);
-    };
-  }, []);
-
-  // [v0.2] useEffect para buscar eventos históricos
-  useEffect(() => {
-    let isMounted = true;
-
+    // [v0.2] Eventos históricos
     async function fetchEvents() {
       try {
-        const eventsData = await fetchMachineEvents(MACHINE_ID, 20);
+        const eventsData = await fetchMachineEvents(MACHINE_ID, EVENTS_LIMIT);
         if (isMounted) {
           setEvents(eventsData);
           setEventsError(null);
@@ -81,15 +77,61 @@ export default function App() {
       }
     }
 
-    // Buscar eventos imediatamente
+    function startPolling() {
+      if (intervalId !== undefined) return;
+      poll();
+      intervalId = setInterval(poll, POLL_INTERVAL_MS);
+      eventsIntervalId = setInterval(fetchEvents, EVENTS_POLL_INTERVAL_MS);
+    }
+
+    function handleMessage(message: MachineStreamMessage) {
+      if (!isMounted) return;
+      if (message.type === "snapshot") {
+        const current = message.machines.find((m) => m.machine_id === MACHINE_ID);
+        if (current) {
+          setStatus(current);
+          updateConnection(current);
+        }
+        setIsLoading(false);
+        setError(null);
+        if (message.resync) fetchEvents();
+      } else if (message.type === "status") {
+        setStatus((prev) => {
+          const next = { ...(prev ?? {}), ...message.changed } as MachineStatus;
+          updateConnection(next);
+          return next;
+        });
+      } else if (message.type === "event") {
+        setEvents((prev) => [message.event, ...prev].slice(0, EVENTS_LIMIT));
+      }
+    }
+
     fetchEvents();
-    
-    // Configurar polling de eventos (menos frequente)
-    const eventsIntervalId = setInterval(fetchEvents, EVENTS_POLL_INTERVAL_MS);
+    if (typeof EventSource !== "undefined") {
+      // Push: sem requisições enquanto nada muda; polling só se o stream falhar
+      closeStream = subscribeMachineStream([MACHINE_ID], handleMessage, () => {
+        closeStream?.();
+        closeStream = undefined;
+        startPolling();
+      });
+    } else {
+      startPolling();
+    }
+
+    // Sem mensagens, o badge ainda precisa envelhecer (recalcula localmente)
+    const staleCheckId = setInterval(() => {
+      setStatus((prev) => {
+        if (prev) updateConnection(prev);
+        return prev;
+      });
+    }, POLL_INTERVAL_MS);
 
     return () => {
       isMounted = false;
+      closeStream?.();
+      clearInterval(intervalId);
       clearInterval(eventsIntervalId);
+      clearInterval(staleCheckId);
     };
   }, []);
 
@@ -117,7 +159,7 @@ export default function App() {
               CNC-Genius Telemetria
             </h1>
             <p style={{fontSize:14, opacity:0.6, margin:0}}>
-              Monitoramento em tempo real • Atualização a cada 1s
+              Monitoramento em tempo real • Atualização por push (SSE)
             </p>
           </div>
           <div style={{display:"flex", gap:16, alignItems:"center"}}>
@@ -85,3 +85,29 @@ export async function fetchMachineEvents(machineId: string = MACHINE_ID, limit:
   
   return response.json();
 }
+
+export type MachineStreamMessage =
+  | { type: "snapshot"; machines: MachineStatus[]; resync?: boolean }
+  | { type: "status"; machine_id: string; changed: Partial<MachineStatus>; full?: boolean }
+  | { type: "event"; machine_id: string; event: MachineEvent };
+
+/**
+ * Assina o canal SSE de status/eventos (substitui o polling).
+ * Recebe um snapshot na conexão e depois só os campos alterados.
+ * @returns função que fecha a conexão
+ */
+export function subscribeMachineStream(
+  machineIds: string[],
+  onMessage: (message: MachineStreamMessage) => void,
+  onError: () => void,
+): () => void {
+  const url = `${API_BASE}/v1/machines/stream?ids=${encodeURIComponent(machineIds.join(","))}`;
+  const source = new EventSource(url);
+
+  for (const type of ["snapshot", "status", "event"]) {
+    source.addEventListener(type, (e) => onMessage(JSON.parse((e as MessageEvent).data)));
+  }
+  source.onerror = () => onError();
+
+  return () => source.close();
+}
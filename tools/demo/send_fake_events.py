@@ -5,6 +5,7 @@ Envia eventos artificiais para demonstrar o painel sem conexão com a CNC.
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import random
 import time
@@ -44,6 +45,17 @@ def parse_args() -> argparse.Namespace:
         default=0,
         help="Número de eventos a enviar (0 = loop infinito)",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Usar WebSocket /v1/telemetry/stream (uma conexão, frames com ack) em vez de um POST por evento",
+    )
+    parser.add_argument(
+        "--machines",
+        type=int,
+        default=1,
+        help="No modo --stream, simula um gateway com N máquinas (<machine-id>-01..N)",
+    )
     return parser.parse_args()
 
 
@@ -65,6 +77,39 @@ def send_payload(base_url: str, payload: dict, state: str, program: str) -> None
     print(f"[DEMO] {payload['timestamp']} :: {state:<8} ({program}) -> {resp.status_code}")
 
 
+def stream_payloads(base_url: str, machine_id: str, machines: int, interval: float, burst: int) -> None:
+    """Gateway: um frame por intervalo com uma amostra por máquina, respeitando a janela de ack."""
+    try:
+        from websockets.sync.client import connect
+    except ImportError as exc:  # pragma: no cover - depende do ambiente
+        raise SystemExit("Modo --stream requer o pacote 'websockets' (incluído em uvicorn[standard])") from exc
+
+    ws_url = base_url.rstrip("/").replace("http", "ws", 1) + "/v1/telemetry/stream"
+    machine_ids = [machine_id] if machines <= 1 else [f"{machine_id}-{idx:02d}" for idx in range(1, machines + 1)]
+
+    with connect(ws_url) as ws:
+        window = json.loads(ws.recv()).get("window", 1)
+        seq = 0
+        in_flight = 0
+        while True:
+            while in_flight >= window:
+                ack = json.loads(ws.recv())
+                if ack.get("type") == "ack":
+                    in_flight -= 1
+                print(f"[DEMO] seq={ack.get('seq')} :: {ack.get('type')} ingested={ack.get('ingested')}")
+            seq += 1
+            samples = [build_payload(mid, random.choice(EVENTS)[0]) for mid in machine_ids]
+            ws.send(json.dumps({"seq": seq, "samples": samples}))
+            in_flight += 1
+            if burst and seq >= burst:
+                break
+            time.sleep(interval)
+        while in_flight > 0:
+            ack = json.loads(ws.recv())
+            if ack.get("type") == "ack":
+                in_flight -= 1
+
+
 def main() -> None:
     args = parse_args()
     base_url = args.api_url
@@ -78,6 +123,11 @@ def main() -> None:
     print(f"Machine ID: {machine_id}")
     print("Ctrl+C para interromper.\n")
 
+    if args.stream:
+        stream_payloads(base_url, machine_id, args.machines, args.interval, args.burst)
+        print("=== Demo concluída ===")
+        return
+
     sent = 0
     while True:
         state, program = random.choice(EVENTS)